@@ -0,0 +1,85 @@
+import numpy as np
+from django.dispatch import receiver
+
+from .live import publish_alerts
+from .models import Alert, Sensor
+from .signals import readings_ingested
+from .summary import invalidate_summaries
+
+# Excursion beyond a threshold, as a fraction of the sensor's allowed band,
+# at which severity steps up from low -> medium -> high -> critical.
+SEVERITY_BINS = [0.1, 0.25, 0.5]
+SEVERITY_LEVELS = [level for level, _ in Alert.SEVERITY_CHOICES]
+
+
+def _threshold(value):
+    return np.nan if value is None else value
+
+
+def evaluate_thresholds(batch):
+    """Raise alerts for readings outside their sensor's thresholds.
+
+    Thresholds are looked up once per distinct sensor and broadcast over the
+    batch, so the whole batch is checked in a single vectorized pass. Each
+    sensor gets at most one alert per batch, for its worst excursion.
+    """
+    if not len(batch):
+        return []
+
+    unique_ids, inverse = np.unique(batch.sensor_ids, return_inverse=True)
+    sensors = batch.sensors or Sensor.objects.in_bulk(unique_ids.tolist())
+    low = np.array([_threshold(sensors[i].min_threshold) for i in unique_ids.tolist()])[inverse]
+    high = np.array([_threshold(sensors[i].max_threshold) for i in unique_ids.tolist()])[inverse]
+
+    values = batch.values
+    # fmax ignores NaN, so a missing threshold never counts as a breach.
+    excess = np.fmax(low - values, values - high)
+    breached = np.flatnonzero(excess > 0)
+    if not len(breached):
+        return []
+
+    band = (high - low)[breached]
+    fallback = np.fmax(np.abs(low), np.abs(high))[breached]
+    scale = np.where(np.isfinite(band) & (band > 0), band, fallback)
+    scale[~np.isfinite(scale) | (scale == 0)] = 1.0
+    ratio = excess[breached] / scale
+
+    # Group breaches by sensor with the largest excursion first in each group.
+    order = np.lexsort((-ratio, batch.sensor_ids[breached]))
+    breached, ratio = breached[order], ratio[order]
+    breached_ids = batch.sensor_ids[breached]
+    starts = np.flatnonzero(np.r_[True, breached_ids[1:] != breached_ids[:-1]])
+    counts = np.diff(np.r_[starts, len(breached)])
+    severities = np.digitize(ratio[starts], SEVERITY_BINS)
+
+    alerts = []
+    for index, count, severity in zip(breached[starts].tolist(), counts.tolist(), severities.tolist()):
+        sensor = sensors[int(batch.sensor_ids[index])]
+        value = float(values[index])
+        if sensor.max_threshold is not None and value > sensor.max_threshold:
+            limit = f'above maximum {sensor.max_threshold:g}'
+        else:
+            limit = f'below minimum {sensor.min_threshold:g}'
+        message = f'{sensor.get_sensor_type_display()} reading {value:.2f} {limit}'
+        if count > 1:
+            message += f' ({count} readings out of range)'
+        alerts.append(Alert(
+            sensor=sensor,
+            message=message,
+            value=value,
+            severity=SEVERITY_LEVELS[severity],
+        ))
+    return save_alerts(alerts)
+
+
+def save_alerts(alerts):
+    created = Alert.objects.bulk_create(alerts)
+    # bulk_create skips post_save, so refresh the dashboard counters here.
+    invalidate_summaries({alert.sensor.organization_id for alert in created})
+    publish_alerts(created)
+    return created
+
+
+@receiver(readings_ingested)
+def raise_threshold_alerts(sender, batch, **kwargs):
+    evaluate_thresholds(batch)
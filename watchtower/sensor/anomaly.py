@@ -0,0 +1,175 @@
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.dispatch import receiver
+
+from .alerting import SEVERITY_LEVELS, save_alerts
+from .models import Alert, Sensor, SensorBaseline
+from .signals import readings_ingested
+
+HOURS = 24
+# Readings a baseline must have seen before it is used for scoring.
+MIN_SAMPLES = 30
+# Smoothing factor of the exponentially weighted (recent level) baseline.
+EWMA_ALPHA = 0.05
+# A reading is anomalous when it is this many standard deviations away from
+# its hour-of-day baseline (or the overall one until that has warmed up)
+# and from the recent level.
+Z_THRESHOLD = 4.0
+# z-scores at which severity steps up from low -> medium -> high -> critical.
+Z_SEVERITY_BINS = [5.0, 6.0, 8.0]
+BASELINE_FIELDS = ['count', 'mean', 'm2', 'ewma', 'ewma_sq', 'hourly']
+MERGE_ATTEMPTS = 3
+
+
+def group_stats(groups, values, size):
+    """Per-group ``(count, mean, M2)`` of ``values``."""
+    n = np.bincount(groups, minlength=size).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(n > 0, np.bincount(groups, values, size) / n, 0.0)
+    m2 = np.bincount(groups, (values - mean[groups]) ** 2, size)
+    return n, mean, m2
+
+
+def combine_stats(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """Merge two sets of Welford statistics (Chan et al.)."""
+    n = n_a + n_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(n > 0, n_b / n, 0.0)
+    delta = mean_b - mean_a
+    return n, mean_a + delta * share, m2_a + m2_b + delta * delta * n_a * share
+
+
+def zscore(values, n, mean, variance):
+    """``|z|`` of each value, NaN where the baseline is not ready."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(values - mean) / np.sqrt(variance)
+    return np.where((n >= MIN_SAMPLES) & (variance > 0), z, np.nan)
+
+
+def _welford_variance(n, m2):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n > 1, m2 / (n - 1), 0.0)
+
+
+def _score_and_update(batch):
+    order = np.lexsort((batch.timestamps, batch.sensor_ids))
+    sensor_ids = batch.sensor_ids[order]
+    values = batch.values[order]
+    starts = np.flatnonzero(np.r_[True, sensor_ids[1:] != sensor_ids[:-1]])
+    lengths = np.diff(np.r_[starts, len(values)])
+    unique_ids = sensor_ids[starts].tolist()
+    size = len(unique_ids)
+    groups = np.repeat(np.arange(size), lengths)
+    slots = groups * HOURS + (batch.timestamps[order] // 3600 % HOURS).astype(np.int64)
+
+    stored = {
+        baseline.sensor_id: baseline
+        for baseline in SensorBaseline.objects.select_for_update().filter(sensor_id__in=unique_ids)
+    }
+    baselines = [
+        stored.get(sensor_id) or SensorBaseline(sensor_id=sensor_id, hourly=np.zeros((3, HOURS)).tobytes())
+        for sensor_id in unique_ids
+    ]
+    count, mean, m2, ewma, ewma_sq = (
+        np.array([getattr(baseline, field) for baseline in baselines], dtype=np.float64)
+        for field in BASELINE_FIELDS[:-1]
+    )
+    hourly = np.stack([np.frombuffer(bytes(baseline.hourly)).reshape(3, HOURS) for baseline in baselines])
+    hour_n, hour_mean, hour_m2 = (hourly[:, i].ravel() for i in range(3))
+
+    # Score every reading against the baselines as they were before the batch.
+    seasonal = zscore(values, hour_n[slots], hour_mean[slots], _welford_variance(hour_n, hour_m2)[slots])
+    overall = zscore(values, count[groups], mean[groups], _welford_variance(count, m2)[groups])
+    recent = zscore(values, count[groups], ewma[groups], np.maximum(ewma_sq - ewma * ewma, 0)[groups])
+    # fmin skips NaN, so a baseline that is not ready yet never blocks the other.
+    z = np.fmin(np.where(np.isnan(seasonal), overall, seasonal), recent)
+    anomalous = z > Z_THRESHOLD
+
+    # Outliers stay out of the Welford baselines so they don't inflate the
+    # variance; the EWMA takes every reading so it follows a genuine level
+    # shift, after which the shifted readings stop being flagged.
+    keep = ~anomalous
+    fresh = count == 0
+    count, mean, m2 = combine_stats(count, mean, m2, *group_stats(groups[keep], values[keep], size))
+    hour_n, hour_mean, hour_m2 = combine_stats(
+        hour_n, hour_mean, hour_m2, *group_stats(slots[keep], values[keep], size * HOURS)
+    )
+    # Closed form of the EWMA recurrence over each sensor's readings in time
+    # order; a new baseline is seeded with its first reading.
+    first = values[starts]
+    ewma = np.where(fresh, first, ewma)
+    ewma_sq = np.where(fresh, first * first, ewma_sq)
+    decay = 1 - EWMA_ALPHA
+    readings_after = lengths[groups] - 1 - (np.arange(len(values)) - starts[groups])
+    weights = EWMA_ALPHA * decay ** readings_after
+    ewma = decay ** lengths * ewma + np.bincount(groups, weights * values, size)
+    ewma_sq = decay ** lengths * ewma_sq + np.bincount(groups, weights * values * values, size)
+
+    hourly = np.stack([hour_n, hour_mean, hour_m2]).reshape(3, size, HOURS)
+    for i, baseline in enumerate(baselines):
+        baseline.count = int(count[i])
+        baseline.mean = float(mean[i])
+        baseline.m2 = float(m2[i])
+        baseline.ewma = float(ewma[i])
+        baseline.ewma_sq = float(ewma_sq[i])
+        baseline.hourly = hourly[:, i].tobytes()
+    SensorBaseline.objects.bulk_create([baseline for baseline in baselines if baseline.pk is None])
+    SensorBaseline.objects.bulk_update(
+        [baseline for baseline in baselines if baseline.pk is not None], BASELINE_FIELDS, batch_size=500
+    )
+    return unique_ids, groups, values, z, np.flatnonzero(anomalous)
+
+
+def detect_anomalies(batch):
+    """Flag readings that deviate from their sensor's learned baselines.
+
+    Each sensor keeps overall and hour-of-day Welford statistics and an
+    exponentially weighted mean, all updated per batch with grouped NumPy
+    reductions. Each sensor gets at most one alert per batch, for its most
+    extreme reading.
+    """
+    if not len(batch):
+        return []
+    # A concurrent writer may create the same baseline between our read and
+    # insert; re-read and score again when that happens.
+    for attempt in range(MERGE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                unique_ids, groups, values, z, flagged = _score_and_update(batch)
+            break
+        except IntegrityError:
+            if attempt == MERGE_ATTEMPTS - 1:
+                raise
+    if not len(flagged):
+        return []
+
+    order = np.lexsort((-z[flagged], groups[flagged]))
+    flagged = flagged[order]
+    firsts = np.flatnonzero(np.r_[True, groups[flagged][1:] != groups[flagged][:-1]])
+    counts = np.diff(np.r_[firsts, len(flagged)])
+    worst = flagged[firsts]
+    severities = np.digitize(z[worst], Z_SEVERITY_BINS)
+
+    sensors = batch.sensors or Sensor.objects.in_bulk(unique_ids)
+    alerts = []
+    for index, count, severity in zip(worst.tolist(), counts.tolist(), severities.tolist()):
+        sensor = sensors[unique_ids[groups[index]]]
+        value = float(values[index])
+        message = (
+            f'{sensor.get_sensor_type_display()} reading {value:.2f} is '
+            f'{z[index]:.1f} standard deviations from its usual level'
+        )
+        if count > 1:
+            message += f' ({count} anomalous readings)'
+        alerts.append(Alert(
+            sensor=sensor,
+            message=message,
+            value=value,
+            severity=SEVERITY_LEVELS[severity],
+        ))
+    return save_alerts(alerts)
+
+
+@receiver(readings_ingested)
+def score_anomalies(sender, batch, **kwargs):
+    detect_anomalies(batch)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SensorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sensor'
+
+    def ready(self):
+        # Connect ingest-time receivers.
+        from . import alerting, anomaly, latest, live, metrics, rollups, sqlite, summary, uptime  # noqa: F401
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import connections
+from django.db.models import F
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+
+from .models import Alert, MaintenanceLog, Sensor, SensorDataDaily, SensorDataHourly
+from .storage import get_storage
+from .uptime import coverage_percentage
+from .views import MAX_CHART_POINTS, TIMEFRAMES, downsampled_series, rollup_average
+
+# Async counterparts of the read-heavy sensor views, served under the ASGI
+# application. Independent queries are awaited together with asyncio.gather.
+# Django 4.2's async ORM runs every query on one shared thread, so each
+# query here goes through in_parallel to get a thread and connection of
+# its own, so a database server can run them at the same time.
+
+
+def async_login_required(view):
+    # django.contrib.auth's login_required only wraps sync views in 4.2.
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def in_parallel(func):
+    """``func`` as a coroutine function run on a worker thread.
+
+    The worker's database connection is closed when the call returns,
+    since no request cycle will close it.
+    """
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return sync_to_async(call, thread_sensitive=False)
+
+
+@async_login_required
+async def sensor_detail(request, sensor_id):
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=7)
+
+    sensor, recent_data, active_alerts, maintenance_logs = await asyncio.gather(
+        in_parallel(get_object_or_404)(Sensor, id=sensor_id),
+        in_parallel(get_storage().tail)(sensor_id, 100, start_date, end_date),
+        in_parallel(list)(Alert.objects.filter(sensor_id=sensor_id, acknowledged=False)),
+        in_parallel(list)(MaintenanceLog.objects.filter(sensor_id=sensor_id).select_related('performed_by')[:5])
+    )
+    context = {
+        'sensor': sensor,
+        'recent_data': recent_data,
+        'active_alerts': active_alerts,
+        'maintenance_logs': maintenance_logs
+    }
+    # Templates may still follow relations, which the ORM only allows from sync code.
+    return await sync_to_async(render)(request, 'sensor/sensor_detail.html', context)
+
+
+@async_login_required
+async def get_sensor_data(request, sensor_id):
+    timeframe = request.GET.get('timeframe', '24h')
+
+    end_date = timezone.now()
+    start_date = end_date - TIMEFRAMES.get(timeframe, TIMEFRAMES['7d'])
+
+    if 'points' in request.GET:
+        try:
+            points = max(3, min(int(request.GET['points']), MAX_CHART_POINTS))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'points must be an integer'}, status=400)
+        _, series = await asyncio.gather(
+            in_parallel(get_object_or_404)(Sensor, id=sensor_id),
+            in_parallel(downsampled_series)(sensor_id, start_date, end_date, points)
+        )
+        return JsonResponse(series)
+
+    if timeframe == '24h':
+        rollups = SensorDataHourly.objects.filter(
+            sensor_id=sensor_id,
+            period__range=(start_date.replace(minute=0, second=0, microsecond=0), end_date)
+        )
+    else:  # '7d', longer timeframes or default
+        rollups = SensorDataDaily.objects.filter(
+            sensor_id=sensor_id,
+            period__range=(start_date.date(), end_date.date())
+        )
+
+    _, data = await asyncio.gather(
+        in_parallel(get_object_or_404)(Sensor, id=sensor_id),
+        in_parallel(list)(rollups.values('period').annotate(
+            avg_value=rollup_average(),
+            min_value=F('value_min'),
+            max_value=F('value_max')
+        ).order_by('period'))
+    )
+    return JsonResponse(data, safe=False)
+
+
+@async_login_required
+async def sensor_analytics(request, sensor_id):
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=30)
+
+    _, daily_stats, alert_count, uptime = await asyncio.gather(
+        in_parallel(get_object_or_404)(Sensor, id=sensor_id),
+        in_parallel(list)(SensorDataDaily.objects.filter(
+            sensor_id=sensor_id,
+            period__range=(start_date.date(), end_date.date())
+        ).values(
+            date=F('period'),
+            avg_value=rollup_average(),
+            max_value=F('value_max'),
+            min_value=F('value_min'),
+            reading_count=F('count')
+        ).order_by('date')),
+        in_parallel(Alert.objects.filter(
+            sensor_id=sensor_id,
+            timestamp__range=(start_date, end_date)
+        ).count)(),
+        in_parallel(coverage_percentage)(sensor_id, start_date, end_date)
+    )
+    return JsonResponse({
+        'daily_stats': daily_stats,
+        'alert_count': alert_count,
+        'uptime_percentage': uptime
+    })
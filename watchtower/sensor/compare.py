@@ -0,0 +1,153 @@
+import re
+from datetime import datetime, time, timezone as dt_timezone
+
+import numpy as np
+from django.db.models import Count, FloatField, Func, Max, Min, Sum
+from django.db.models.functions import Floor
+
+from .ingest import ReadingBatch
+from .models import SensorData, SensorDataDaily, SensorDataHourly
+from .rollups import DAY, HOUR, aggregate_batch
+from .storage import ORMStorage, get_storage
+
+BUCKET_UNITS = {'s': 1, 'm': 60, 'h': HOUR, 'd': DAY}
+BUCKET_PATTERN = re.compile(r'^(\d+)([smhd]?)$')
+MAX_BUCKET_SECONDS = 366 * DAY
+MAX_SPAN_SECONDS = 10 * 366 * DAY
+
+
+def parse_bucket(raw):
+    """Bucket width in seconds from ``'900'``, ``'15m'``, ``'6h'`` or ``'1d'``."""
+    match = BUCKET_PATTERN.match(raw or '')
+    if not match or int(match.group(1)) == 0:
+        raise ValueError('bucket must be a positive number of seconds or a duration like 15m, 6h or 1d')
+    seconds = int(match.group(1)) * BUCKET_UNITS[match.group(2) or 's']
+    if seconds > MAX_BUCKET_SECONDS:
+        raise ValueError(f'bucket must be at most {MAX_BUCKET_SECONDS // DAY}d')
+    return seconds
+
+
+def bucket_edges(start, end, seconds):
+    """Start of every ``seconds``-wide bucket covering ``[start, end)``.
+
+    Buckets are aligned to multiples of their width since the epoch, so
+    series requested with the same width always line up. Raises
+    ``ValueError`` for ranges longer than ``MAX_SPAN_SECONDS`` or buckets
+    reaching past the dates ``datetime`` can represent.
+    """
+    if (end - start).total_seconds() > MAX_SPAN_SECONDS:
+        raise ValueError(f'range must span at most {MAX_SPAN_SECONDS // DAY} days')
+    first = np.floor(start.timestamp() / seconds) * seconds
+    edges = first + seconds * np.arange(max(1, int(np.ceil((end.timestamp() - first) / seconds))))
+    try:
+        datetime.fromtimestamp(edges[0], tz=dt_timezone.utc)
+        datetime.fromtimestamp(edges[-1] + seconds, tz=dt_timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        raise ValueError('range is outside the supported dates') from None
+    return edges
+
+
+def _rollup_rows(sensor_ids, first, stop, seconds):
+    # Whole-hour buckets are sums of hourly rollups and whole-day buckets of
+    # daily ones; the edges are aligned, so no rollup straddles two buckets.
+    if seconds % DAY == 0:
+        rows = SensorDataDaily.objects.filter(
+            period__gte=datetime.fromtimestamp(first, tz=dt_timezone.utc).date(),
+            period__lt=datetime.fromtimestamp(stop, tz=dt_timezone.utc).date(),
+        )
+        to_epoch = lambda period: datetime.combine(period, time(), tzinfo=dt_timezone.utc).timestamp()  # noqa: E731
+    else:
+        rows = SensorDataHourly.objects.filter(
+            period__gte=datetime.fromtimestamp(first, tz=dt_timezone.utc),
+            period__lt=datetime.fromtimestamp(stop, tz=dt_timezone.utc),
+        )
+        to_epoch = datetime.timestamp
+    rows = list(rows.filter(sensor_id__in=sensor_ids).values_list(
+        'sensor_id', 'period', 'count', 'value_sum', 'value_min', 'value_max'
+    ))
+    return (
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([to_epoch(row[1]) for row in rows], dtype=np.float64),
+        np.array([row[2] for row in rows], dtype=np.int64),
+        np.array([row[3] for row in rows], dtype=np.float64),
+        np.array([row[4] for row in rows], dtype=np.float64),
+        np.array([row[5] for row in rows], dtype=np.float64),
+    )
+
+
+class Epoch(Func):
+    """Whole seconds since the epoch of a datetime column."""
+
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'CAST(strftime(%s, {sql}) AS REAL)', ['%s', *params]
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def _raw_rows(sensor_ids, first, stop, seconds):
+    # Grouped into buckets where the readings live, so only one row per
+    # (sensor, bucket) is ever loaded.
+    start = datetime.fromtimestamp(first, tz=dt_timezone.utc)
+    end = datetime.fromtimestamp(stop, tz=dt_timezone.utc)
+    storage = get_storage()
+    if isinstance(storage, ORMStorage):
+        rows = list(SensorData.objects.filter(
+            sensor_id__in=sensor_ids, timestamp__gte=start, timestamp__lt=end
+        ).annotate(
+            bucket=Floor(Epoch('timestamp') / float(seconds))
+        ).values('sensor_id', 'bucket').annotate(
+            n=Count('id'), total=Sum('value'), low=Min('value'), high=Max('value')
+        ).order_by().values_list('sensor_id', 'bucket', 'n', 'total', 'low', 'high'))
+        ids, buckets, counts, sums, lows, highs = (
+            np.array(column, dtype=np.float64) for column in (zip(*rows) if rows else [()] * 6)
+        )
+        return ids.astype(np.int64), buckets * seconds, counts.astype(np.int64), sums, lows, highs
+
+    partials = []
+    for sensor_id in sensor_ids:
+        timestamps, values, quality = storage.read_range(sensor_id, start, end)
+        partials.append(aggregate_batch(
+            ReadingBatch(np.full(len(timestamps), sensor_id), timestamps, values, quality), seconds
+        ))
+    return tuple(
+        np.concatenate([partial[field] for partial in partials]) if partials else np.empty(0)
+        for field in ('sensor_id', 'bucket', 'count', 'value_sum', 'value_min', 'value_max')
+    )
+
+
+def compare_series(sensor_ids, edges, seconds):
+    """Aligned ``(count, avg, min, max)`` arrays of shape ``(sensors, buckets)``.
+
+    Rows come from a single query over every sensor: rollups when the
+    bucket width is a whole number of hours, raw readings grouped by
+    bucket in the database otherwise. They are combined into
+    ``(sensor, bucket)`` cells with NumPy. ``avg``, ``min`` and ``max``
+    are NaN where a cell has no readings.
+    """
+    first, stop = edges[0], edges[-1] + seconds
+    if seconds % HOUR == 0:
+        ids, timestamps, counts, sums, lows, highs = _rollup_rows(sensor_ids, first, stop, seconds)
+    else:
+        ids, timestamps, counts, sums, lows, highs = _raw_rows(sensor_ids, first, stop, seconds)
+
+    shape = (len(sensor_ids), len(edges))
+    position = {sensor_id: i for i, sensor_id in enumerate(sensor_ids)}
+    rows = np.array([position[sensor_id] for sensor_id in ids.tolist()], dtype=np.int64)
+    cells = rows * len(edges) + ((timestamps - first) // seconds).astype(np.int64)
+
+    size = shape[0] * shape[1]
+    count = np.bincount(cells, counts, size)
+    low = np.full(size, np.inf)
+    high = np.full(size, -np.inf)
+    np.minimum.at(low, cells, lows)
+    np.maximum.at(high, cells, highs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg = np.bincount(cells, sums, size) / count
+    empty = count == 0
+    low[empty] = high[empty] = np.nan
+    return tuple(array.reshape(shape) for array in (count.astype(np.int64), avg, low, high))
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the ``threshold`` points of ``(x, y)`` that best
+    preserve the visual shape of the series. ``x`` must be sorted. The first
+    and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries for the n - 2 interior points.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Average point of each bucket, used as the third triangle vertex when
+    # choosing from the bucket before it.
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        bx, by = x[start:stop], y[start:stop]
+        # Twice the triangle area; the constant factor doesn't change argmax.
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def envelope(x, y, buckets):
+    """Per-bucket ``(x, min, max)`` arrays over ``buckets`` equal-count buckets."""
+    n = len(x)
+    buckets = max(1, min(buckets, n))
+    starts = np.linspace(0, n, buckets, endpoint=False).astype(np.int64)
+    return (
+        x[starts],
+        np.minimum.reduceat(y, starts),
+        np.maximum.reduceat(y, starts),
+    )
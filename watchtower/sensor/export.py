@@ -0,0 +1,46 @@
+import csv
+import json
+
+from .storage import get_storage
+
+EXPORT_COLUMNS = ['sensor_id', 'timestamp', 'value', 'quality']
+
+
+class Echo:
+    """File-like object whose write() returns the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(sensor_ids, start=None, end=None):
+    """Stream raw ``(sensor_id, timestamp, value, quality)`` tuples.
+
+    Rows are read from the configured storage backend in chunks (from a
+    server-side cursor where the database supports one) and are never
+    turned into model instances.
+    """
+    return get_storage().iter_rows(sensor_ids, start, end)
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for sensor_id, timestamp, value, quality in rows:
+        yield writer.writerow((sensor_id, timestamp.isoformat(), value, quality))
+
+
+def ndjson_lines(rows):
+    for sensor_id, timestamp, value, quality in rows:
+        yield json.dumps({
+            'sensor': sensor_id,
+            'timestamp': timestamp.isoformat(),
+            'value': value,
+            'quality': quality,
+        }) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
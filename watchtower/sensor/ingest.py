@@ -0,0 +1,229 @@
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SensorData
+from .signals import readings_ingested
+from .storage import get_storage
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+# Most rows the ingest writer merges into one transaction.
+MAX_MERGED_ROWS = 50000
+# The ingest writer thread exits, closing its connection, after this long
+# without work; the next batch starts a new one.
+WRITER_IDLE_SECONDS = 60
+# Readings may be stamped at most this far ahead of the server clock.
+MAX_CLOCK_SKEW = 24 * 3600
+
+
+class IngestError(ValueError):
+    pass
+
+
+class ReadingBatch:
+    """A batch of readings held as parallel NumPy columns.
+
+    Timestamps are UTC epoch seconds. ``sensors`` maps sensor id to the
+    ``Sensor`` rows the batch was validated against.
+    """
+
+    def __init__(self, sensor_ids, timestamps, values, quality, sensors=None):
+        self.sensor_ids = np.asarray(sensor_ids, dtype=np.int64)
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.quality = np.asarray(quality, dtype=np.int64)
+        self.sensors = sensors if sensors is not None else {}
+
+    def __len__(self):
+        return len(self.sensor_ids)
+
+    @classmethod
+    def concat(cls, batches):
+        sensors = {}
+        for batch in batches:
+            sensors.update(batch.sensors)
+        return cls(
+            np.concatenate([batch.sensor_ids for batch in batches]),
+            np.concatenate([batch.timestamps for batch in batches]),
+            np.concatenate([batch.values for batch in batches]),
+            np.concatenate([batch.quality for batch in batches]),
+            sensors=sensors,
+        )
+
+    def to_models(self):
+        return [
+            SensorData(
+                sensor_id=sensor_id,
+                timestamp=datetime.fromtimestamp(ts, tz=dt_timezone.utc),
+                value=value,
+                quality=quality,
+            )
+            for sensor_id, ts, value, quality in zip(
+                self.sensor_ids.tolist(), self.timestamps.tolist(),
+                self.values.tolist(), self.quality.tolist()
+            )
+        ]
+
+
+def parse_payload(body, content_type=''):
+    """Decode a JSON array or NDJSON body into a list of reading dicts."""
+    try:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if content_type in NDJSON_CONTENT_TYPES:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        records = json.loads(text)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise IngestError(f'Malformed payload: {e}')
+
+    if isinstance(records, dict):
+        records = records.get('readings')
+    if not isinstance(records, list):
+        raise IngestError('Expected a JSON array of readings')
+    return records
+
+
+def _parse_timestamp(raw, default):
+    if raw is None:
+        return default
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    parsed = parse_datetime(raw)
+    if parsed is None:
+        raise IngestError(f'Invalid timestamp: {raw!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed.timestamp()
+
+
+def build_batch(records, sensors):
+    """Validate reading dicts and return a ``ReadingBatch``.
+
+    ``sensors`` is the queryset of sensors the caller may write to; every
+    sensor referenced by the batch is checked against it in one query.
+    """
+    if not records:
+        raise IngestError('No readings supplied')
+
+    now = timezone.now().timestamp()
+    count = len(records)
+    sensor_ids = np.empty(count, dtype=np.int64)
+    timestamps = np.empty(count, dtype=np.float64)
+    values = np.empty(count, dtype=np.float64)
+    quality = np.empty(count, dtype=np.int64)
+
+    for i, record in enumerate(records):
+        try:
+            sensor_ids[i] = record['sensor']
+            values[i] = record['value']
+            quality[i] = record.get('quality', 100)
+            timestamps[i] = _parse_timestamp(record.get('timestamp'), now)
+        except (KeyError, TypeError, ValueError, OverflowError, AttributeError) as e:
+            raise IngestError(f'Invalid reading at index {i}: {e}')
+
+    if not np.isfinite(values).all():
+        raise IngestError('Reading values must be finite numbers')
+    if not ((timestamps >= 0) & (timestamps <= now + MAX_CLOCK_SKEW)).all():
+        raise IngestError('Reading timestamps must be epoch seconds between 1970 and now')
+    if ((quality < 0) | (quality > 100)).any():
+        raise IngestError('Reading quality must be between 0 and 100')
+
+    unique_ids = np.unique(sensor_ids).tolist()
+    found = {sensor.id: sensor for sensor in sensors.filter(id__in=unique_ids)}
+    missing = [sensor_id for sensor_id in unique_ids if sensor_id not in found]
+    if missing:
+        raise IngestError(f'Unknown sensor ids: {missing}')
+
+    return ReadingBatch(sensor_ids, timestamps, values, quality, sensors=found)
+
+
+def store_readings(batch):
+    """Write a batch to the storage backend in a single transaction."""
+    with transaction.atomic():
+        get_storage().append(batch)
+        readings_ingested.send(sender=SensorData, batch=batch)
+    return len(batch)
+
+
+class IngestQueue:
+    """Single background writer for ingested batches.
+
+    Batches queued while a write is in progress are merged and stored in
+    one transaction, so concurrent requests never contend for SQLite's
+    write lock and readers see one short commit instead of many.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, batch):
+        """Queue ``batch``; the returned future resolves to the rows stored."""
+        future = Future()
+        self._queue.put((batch, future))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+                self._thread.start()
+        return future
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    pending = [self._queue.get(timeout=WRITER_IDLE_SECONDS)]
+                except queue.Empty:
+                    # submit() starts a new writer once this one is gone.
+                    with self._lock:
+                        if self._queue.empty():
+                            self._thread = None
+                            return
+                    continue
+                rows = len(pending[0][0])
+                while rows < MAX_MERGED_ROWS:
+                    try:
+                        pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                    rows += len(pending[-1][0])
+                self._write(pending)
+        finally:
+            connection.close()
+
+    def _write(self, pending):
+        if len(pending) > 1:
+            try:
+                store_readings(ReadingBatch.concat([batch for batch, _ in pending]))
+            except Exception:
+                pass  # retry one by one so a bad batch only fails its own request
+            else:
+                for batch, future in pending:
+                    future.set_result(len(batch))
+                return
+        for batch, future in pending:
+            try:
+                future.set_result(store_readings(batch))
+            except Exception as e:
+                future.set_exception(e)
+
+
+ingest_queue = IngestQueue()
+
+
+def write_readings(batch):
+    """Store ``batch`` via the ingest writer if ``SENSOR_INGEST_QUEUE`` is on.
+
+    Raises ``TimeoutError`` when the writer has not stored the batch
+    within ``SENSOR_INGEST_TIMEOUT`` seconds; it may still be stored later.
+    """
+    if getattr(settings, 'SENSOR_INGEST_QUEUE', False):
+        return ingest_queue.submit(batch).result(timeout=getattr(settings, 'SENSOR_INGEST_TIMEOUT', None))
+    return store_readings(batch)
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metrics import record_cache
+from .models import Sensor
+from .signals import readings_ingested
+from .storage import get_storage
+
+# Entries are replaced by newer readings rather than expiring.
+LATEST_TIMEOUT = None
+# Cache alias holding the entries, sized for one entry per sensor; the
+# default cache is used when it is not configured.
+LATEST_CACHE = 'latest'
+
+# Serializes the read-compare-write of cache updates within this process.
+_update_lock = threading.Lock()
+
+
+def latest_cache():
+    return caches[LATEST_CACHE] if LATEST_CACHE in settings.CACHES else cache
+
+
+def latest_key(sensor_id):
+    return f'sensor:latest:{sensor_id}'
+
+
+def _get_many(keys):
+    # An unreachable cache backend counts as all misses, which are then
+    # read from the storage backend.
+    try:
+        return latest_cache().get_many(keys)
+    except Exception:
+        return {}
+
+
+def _set_many(entries):
+    try:
+        latest_cache().set_many(entries, LATEST_TIMEOUT)
+    except Exception:
+        pass
+
+
+def _set_newer(entries):
+    """Cache ``entries`` except where the cached reading is newer."""
+    with _update_lock:
+        cached = _get_many(list(entries))
+        _set_many({
+            key: entry for key, entry in entries.items()
+            if key not in cached or (cached[key]['timestamp'] or 0) <= (entry['timestamp'] or 0)
+        })
+
+
+def _entry(organization_id, timestamp, value, quality):
+    # timestamp is epoch seconds (UTC) so entries compare cheaply.
+    return {'organization_id': organization_id, 'timestamp': timestamp, 'value': value, 'quality': quality}
+
+
+def update_latest(batch):
+    """Record each sensor's newest reading in ``batch`` unless the cache has a newer one."""
+    if not len(batch):
+        return
+    order = np.lexsort((batch.timestamps, batch.sensor_ids))
+    sensor_ids = batch.sensor_ids[order]
+    newest = order[np.flatnonzero(np.r_[sensor_ids[1:] != sensor_ids[:-1], True])]
+
+    sensors = batch.sensors or Sensor.objects.in_bulk(batch.sensor_ids[newest].tolist())
+    entries = {}
+    for sensor_id, timestamp, value, quality in zip(
+        batch.sensor_ids[newest].tolist(), batch.timestamps[newest].tolist(),
+        batch.values[newest].tolist(), batch.quality[newest].tolist()
+    ):
+        entries[latest_key(sensor_id)] = _entry(sensors[sensor_id].organization_id, timestamp, value, quality)
+
+    _set_newer(entries)
+
+
+def load_latest(sensor_ids):
+    """Read the newest reading of each sensor from the storage backend."""
+    organizations = dict(Sensor.objects.filter(id__in=sensor_ids).values_list('id', 'organization_id'))
+    readings = get_storage().latest(list(organizations))
+    # Sensors without readings are cached too, so they don't fall through
+    # to the storage backend on every request.
+    latest = {sensor_id: _entry(organization_id, None, None, None) for sensor_id, organization_id in organizations.items()}
+    for sensor_id, reading in readings.items():
+        latest[sensor_id] = _entry(organizations[sensor_id], reading.timestamp.timestamp(), reading.value, reading.quality)
+    return latest
+
+
+def get_latest(sensor_ids):
+    """Return ``{sensor_id: entry}`` with one cache multi-get, loading misses from the database."""
+    keys = {latest_key(sensor_id): sensor_id for sensor_id in sensor_ids}
+    cached = _get_many(list(keys))
+    record_cache(len(cached), len(keys) - len(cached))
+    latest = {keys[key]: entry for key, entry in cached.items()}
+
+    missing = [sensor_id for key, sensor_id in keys.items() if key not in cached]
+    if missing:
+        loaded = load_latest(missing)
+        # An ingest may have cached a newer reading since the load started.
+        _set_newer({latest_key(sensor_id): entry for sensor_id, entry in loaded.items()})
+        latest.update(loaded)
+    return latest
+
+
+def invalidate_latest(sensor_ids):
+    try:
+        latest_cache().delete_many([latest_key(sensor_id) for sensor_id in sensor_ids])
+    except Exception:
+        pass
+
+
+@receiver(readings_ingested)
+def record_latest(sender, batch, **kwargs):
+    transaction.on_commit(lambda: update_latest(batch))
+
+
+@receiver([post_save, post_delete], sender=Sensor)
+def sensor_changed(sender, instance, **kwargs):
+    # Entries carry the organization used for access checks.
+    invalidate_latest([instance.pk])
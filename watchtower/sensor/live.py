@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.dispatch import receiver
+
+from .signals import readings_ingested
+
+# Events buffered per connection; a client that falls further behind than
+# this loses its oldest events instead of growing the queue.
+QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+# Django 4.2 never tells a streaming response that its client went away,
+# so streams end on their own after this long and EventSource reconnects.
+MAX_STREAM_SECONDS = 300
+
+
+def sse_message(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class Subscription:
+    def __init__(self, loop, org_ids):
+        self.loop = loop
+        self.org_ids = set(org_ids)
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def put(self, message):
+        # Publishers run on request threads; hand the message to the
+        # subscriber's event loop.
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # loop already closed; the stream is gone
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class Broker:
+    """In-process fan-out of messages to the subscribers of each organization."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, org_ids):
+        subscription = Subscription(asyncio.get_running_loop(), org_ids)
+        with self._lock:
+            for org_id in subscription.org_ids:
+                self._subscribers.setdefault(org_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for org_id in subscription.org_ids:
+                subscribers = self._subscribers.get(org_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[org_id]
+
+    def has_subscribers(self, org_id):
+        return org_id in self._subscribers
+
+    def publish(self, org_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(org_id, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+
+broker = Broker()
+
+
+async def event_stream(subscription, max_seconds=MAX_STREAM_SECONDS):
+    """Yield SSE messages for ``subscription`` for up to ``max_seconds``."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_seconds
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), min(HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def latest_readings(batch):
+    """Per-organization payloads with each sensor's newest reading in ``batch``."""
+    order = np.lexsort((batch.timestamps, batch.sensor_ids))
+    sensor_ids = batch.sensor_ids[order]
+    # Last row of each sensor's group is its newest reading.
+    last = np.flatnonzero(np.r_[sensor_ids[1:] != sensor_ids[:-1], True])
+    counts = np.diff(np.r_[-1, last])
+    payloads = {}
+    for index, count in zip(order[last].tolist(), counts.tolist()):
+        sensor = batch.sensors[int(batch.sensor_ids[index])]
+        payloads.setdefault(sensor.organization_id, []).append({
+            'sensor_id': sensor.id,
+            'timestamp': datetime.fromtimestamp(float(batch.timestamps[index]), tz=dt_timezone.utc),
+            'value': float(batch.values[index]),
+            'count': count,
+        })
+    return payloads
+
+
+def publish_readings(batch):
+    if not len(batch) or not batch.sensors:
+        return
+    org_ids = {sensor.organization_id for sensor in batch.sensors.values()}
+    if not any(broker.has_subscribers(org_id) for org_id in org_ids):
+        return
+    for org_id, readings in latest_readings(batch).items():
+        broker.publish(org_id, sse_message('readings', readings))
+
+
+def publish_alerts(alerts):
+    """Push newly raised alerts once the surrounding transaction commits."""
+    by_org = {}
+    for alert in alerts:
+        by_org.setdefault(alert.sensor.organization_id, []).append({
+            'id': alert.id,
+            'sensor_id': alert.sensor_id,
+            'sensor_name': alert.sensor.name,
+            'severity': alert.severity,
+            'message': alert.message,
+            'value': alert.value,
+            'timestamp': alert.timestamp,
+        })
+    for org_id, payload in by_org.items():
+        if broker.has_subscribers(org_id):
+            message = sse_message('alerts', payload)
+            transaction.on_commit(lambda org_id=org_id, message=message: broker.publish(org_id, message))
+
+
+@receiver(readings_ingested)
+def push_readings(sender, batch, **kwargs):
+    transaction.on_commit(lambda: publish_readings(batch))
@@ -0,0 +1,476 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from sensor.alerting import evaluate_thresholds
+from sensor.downsampling import envelope, lttb
+from sensor.ingest import ReadingBatch, ingest_queue, parse_payload, build_batch, store_readings
+from sensor.models import Organization, Sensor, SensorData, SensorDataHourly
+from sensor.storage import ColumnarStorage, ORMStorage
+
+
+class Command(BaseCommand):
+    help = 'Runs performance benchmarks against a throwaway test database'
+
+    suites = ['ingest', 'alerts', 'lttb', 'views', 'concurrency', 'storage', 'load']
+    # Journal modes only apply to a database file, not an in-memory database.
+    file_backed_suites = {'concurrency', 'storage', 'load'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=self.suites)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias whose backend is benchmarked')
+        parser.add_argument('--sensors', type=int, default=100)
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--points', type=int, default=1000,
+                            help='Target size of downsampled series')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per endpoint in the views suite')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Requests in flight at once in the views suite; '
+                                 'reader threads in the concurrency suite')
+        parser.add_argument('--writers', type=int, default=4,
+                            help='Writer threads in the concurrency suite')
+        parser.add_argument('--backends', nargs='+', choices=['orm', 'columnar'], default=['orm', 'columnar'],
+                            help='Storage backends compared in the storage suite')
+        parser.add_argument('--days', type=float, default=7,
+                            help='Days of readings seeded per sensor in the load suite')
+        parser.add_argument('--interval', type=int, default=300,
+                            help='Seconds between seeded readings in the load suite')
+        parser.add_argument('--output', help='Write the load suite results to this JSON file')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        old_name = connection.settings_dict['NAME']
+        old_test_name = connection.settings_dict['TEST'].get('NAME')
+        directory = None
+        if options['suite'] in self.file_backed_suites and connection.vendor == 'sqlite' and not old_test_name:
+            directory = tempfile.mkdtemp(prefix='watchtower-benchmark-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        # The benchmark writes a lot of rows, so never touch the real database.
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.rng = np.random.default_rng(options['seed'])
+            self.stdout.write(f"Backend: {connection.vendor} ({connection.settings_dict['NAME']})")
+            getattr(self, f"bench_{options['suite']}")(**options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if directory is not None:
+                connection.settings_dict['TEST']['NAME'] = old_test_name
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def report(self, name, count, elapsed, unit='rows'):
+        rate = count / elapsed if elapsed else float('inf')
+        self.stdout.write(f'{name:<32} {count:>10} {unit} in {elapsed:8.3f}s  {rate:>12,.0f} {unit}/sec')
+
+    def report_latency(self, name, latencies, elapsed):
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        self.stdout.write(
+            f'{name:<32} {len(latencies):>6} req  p50 {p50:8.2f}ms  p99 {p99:8.2f}ms  '
+            f'{len(latencies) / elapsed:>8,.0f} req/sec'
+        )
+
+    def latency_stats(self, latencies, elapsed):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+        return {
+            'requests': len(latencies),
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(p50, 2),
+            'p90_ms': round(p90, 2),
+            'p99_ms': round(p99, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+        }
+
+    def create_sensors(self, count):
+        org = Organization.objects.create(name='Benchmark Org')
+        Sensor.objects.bulk_create([
+            Sensor(
+                name=f'Benchmark Sensor {i}',
+                description='Benchmark sensor',
+                organization=org,
+                min_threshold=15,
+                max_threshold=30,
+                reading_interval=60,
+            )
+            for i in range(count)
+        ])
+        return list(Sensor.objects.filter(organization=org).values_list('id', flat=True))
+
+    def make_payloads(self, sensor_ids, rows, batch_size):
+        start = timezone.now().timestamp() - rows
+        payloads = []
+        for offset in range(0, rows, batch_size):
+            size = min(batch_size, rows - offset)
+            ids = self.rng.choice(sensor_ids, size)
+            values = self.rng.normal(22.0, 2.0, size)
+            payloads.append(json.dumps([
+                {'sensor': int(sensor_id), 'timestamp': start + offset + i, 'value': float(value)}
+                for i, (sensor_id, value) in enumerate(zip(ids, values))
+            ]).encode())
+        return payloads
+
+    def bench_ingest(self, sensors, rows, batch_size, **options):
+        sensor_ids = self.create_sensors(sensors)
+        allowed = Sensor.objects.all()
+
+        # Baseline: one INSERT per reading, as create_sample_data used to do.
+        baseline_rows = min(rows, 2000)
+        now = timezone.now()
+        started = time.perf_counter()
+        for i in range(baseline_rows):
+            SensorData.objects.create(sensor_id=sensor_ids[i % len(sensor_ids)], timestamp=now, value=1.0)
+        self.report('objects.create per row', baseline_rows, time.perf_counter() - started)
+        SensorData.objects.all().delete()
+
+        payloads = self.make_payloads(sensor_ids, rows, batch_size)
+        parse_time = store_time = 0.0
+        for payload in payloads:
+            started = time.perf_counter()
+            batch = build_batch(parse_payload(payload), allowed)
+            parsed = time.perf_counter()
+            store_readings(batch)
+            parse_time += parsed - started
+            store_time += time.perf_counter() - parsed
+
+        self.report('parse + validate', rows, parse_time)
+        self.report('bulk_create + ingest hooks', rows, store_time)
+        self.report(f'end to end (batch={batch_size})', rows, parse_time + store_time)
+
+    def bench_alerts(self, sensors, rows, **options):
+        sensor_ids = self.create_sensors(sensors)
+        batch = ReadingBatch(
+            self.rng.choice(sensor_ids, rows),
+            timezone.now().timestamp() + np.arange(rows, dtype=np.float64),
+            self.rng.normal(22.0, 4.0, rows),
+            np.full(rows, 100),
+            sensors=Sensor.objects.in_bulk(sensor_ids),
+        )
+        started = time.perf_counter()
+        alerts = evaluate_thresholds(batch)
+        self.report(f'threshold evaluation ({len(alerts)} alerts)', rows, time.perf_counter() - started)
+
+    def bench_lttb(self, rows, points, **options):
+        timestamps = timezone.now().timestamp() + 60.0 * np.arange(rows)
+        values = np.cumsum(self.rng.normal(0, 1, rows))
+
+        started = time.perf_counter()
+        selected = lttb(timestamps, values, points)
+        self.report(f'lttb -> {len(selected)} points', rows, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        envelope(timestamps, values, points)
+        self.report(f'min/max envelope -> {points}', rows, time.perf_counter() - started)
+
+    def bench_views(self, sensors, rows, requests, concurrency, **options):
+        sensor_ids = self.create_sensors(sensors)
+        user = User.objects.create_user('benchmark')
+        user.organizations.add(Sensor.objects.get(id=sensor_ids[0]).organization)
+        # Regular readings from every sensor so rollups, alerts and coverage have data to read.
+        per_sensor = max(1, rows // len(sensor_ids))
+        rows = per_sensor * len(sensor_ids)
+        now = timezone.now().timestamp()
+        store_readings(ReadingBatch(
+            np.repeat(sensor_ids, per_sensor),
+            np.tile(now - 60.0 * np.arange(per_sensor)[::-1], len(sensor_ids)),
+            self.rng.normal(22.0, 4.0, rows),
+            np.full(rows, 100),
+            sensors=Sensor.objects.in_bulk(sensor_ids),
+        ))
+
+        setup_test_environment()
+        try:
+            # Log in outside the event loop; the session store is sync-only.
+            async_client = AsyncClient()
+            async_client.force_login(user)
+            for name, path in [
+                ('sensor_detail', 'sensor/{}/'),
+                ('get_sensor_data', 'sensor/{}/data/?timeframe=7d'),
+                ('sensor_analytics', 'sensor/{}/analytics/'),
+            ]:
+                paths = [path.format(sensor_ids[i % len(sensor_ids)]) for i in range(requests)]
+                self.report_latency(f'{name} (WSGI, sync)', *self.load_wsgi(user, [f'/{p}' for p in paths], concurrency))
+                self.report_latency(f'{name} (ASGI, async)', *asyncio.run(
+                    self.load_asgi(async_client, [f'/async/{p}' for p in paths], concurrency)
+                ))
+        finally:
+            teardown_test_environment()
+
+    def load_wsgi(self, user, paths, concurrency, payloads=None):
+        clients = []
+        for _ in range(concurrency):
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        def fetch(i):
+            started = time.perf_counter()
+            client = clients[i % concurrency]
+            if payloads is None:
+                response = client.get(paths[i])
+            else:
+                response = client.post(paths[i], payloads[i], content_type='application/json')
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(fetch, range(len(paths))))
+        return latencies, time.perf_counter() - started
+
+    async def load_asgi(self, client, paths, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(path):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                assert response.status_code == 200, response.status_code
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(fetch(path) for path in paths))
+        return latencies, time.perf_counter() - started
+
+    def bench_concurrency(self, sensors, rows, batch_size, concurrency, writers, **options):
+        sensor_ids = self.create_sensors(sensors)
+        sensor_map = Sensor.objects.in_bulk(sensor_ids)
+        start = timezone.now().timestamp() - rows
+        batches = [
+            ReadingBatch(
+                self.rng.choice(sensor_ids, min(batch_size, rows - offset)),
+                start + offset + np.arange(min(batch_size, rows - offset), dtype=np.float64),
+                self.rng.normal(22.0, 2.0, min(batch_size, rows - offset)),
+                np.full(min(batch_size, rows - offset), 100),
+                sensors=sensor_map,
+            )
+            for offset in range(0, rows, batch_size)
+        ]
+
+        self.stdout.write(f'{writers} writer threads, {concurrency} reader threads, {rows} rows per run')
+        for name, pragmas, queued in [
+            ('rollback journal', {'journal_mode': 'delete', 'busy_timeout': 5000}, False),
+            ('WAL profile', settings.SQLITE_WAL_PRAGMAS, False),
+            ('WAL profile + ingest queue', settings.SQLITE_WAL_PRAGMAS, True),
+        ]:
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                # Switch the journal mode while this is the only connection.
+                connections.close_all()
+                with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.stdout.write(f'{name}: journal_mode={cursor.fetchone()[0]}')
+                connections.close_all()
+                SensorData.objects.all().delete()
+                SensorDataHourly.objects.all().delete()
+                connections.close_all()
+                self.run_mixed(name, batches, sensor_ids, writers, concurrency, queued)
+
+    def run_mixed(self, name, batches, sensor_ids, writers, readers, queued):
+        """Write ``batches`` from several threads while others run dashboard reads."""
+        writing = threading.Event()
+        writing.set()
+        latencies, errors = [], []
+
+        def write(own_batches):
+            try:
+                for batch in own_batches:
+                    try:
+                        if queued:
+                            ingest_queue.submit(batch).result(timeout=settings.SENSOR_INGEST_TIMEOUT)
+                        else:
+                            store_readings(batch)
+                    except OperationalError as e:
+                        errors.append(e)
+            finally:
+                connections.close_all()
+
+        def read(seed):
+            rng = np.random.default_rng(seed)
+            own = []
+            try:
+                while writing.is_set():
+                    sensor_id = int(rng.choice(sensor_ids))
+                    started = time.perf_counter()
+                    try:
+                        list(SensorData.objects.filter(sensor_id=sensor_id).order_by('-timestamp')[:100])
+                        list(SensorDataHourly.objects.filter(sensor_id=sensor_id).order_by('-period')[:24])
+                    except OperationalError as e:
+                        errors.append(e)
+                        continue
+                    own.append(time.perf_counter() - started)
+            finally:
+                latencies.extend(own)
+                connections.close_all()
+
+        reader_threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+        writer_threads = [threading.Thread(target=write, args=(batches[i::writers],)) for i in range(writers)]
+        for thread in reader_threads:
+            thread.start()
+        started = time.perf_counter()
+        for thread in writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        writing.clear()
+        for thread in reader_threads:
+            thread.join()
+
+        written = SensorData.objects.count()
+        self.report(f'{name}: writes', written, elapsed)
+        if latencies:
+            self.report_latency(f'{name}: reads', latencies, elapsed)
+        self.stdout.write(f'{name}: {len(errors)} "database is locked" errors')
+
+    def bench_storage(self, sensors, rows, batch_size, requests, backends, **options):
+        sensor_ids = np.array(self.create_sensors(sensors))
+        # One reading per sensor per minute, appended in time order.
+        steps = -(-rows // len(sensor_ids))
+        steps_per_batch = max(1, batch_size // len(sensor_ids))
+        start = timezone.now().timestamp() - steps * 60
+        windows = [('1h', 3600), ('1d', 86400), ('7d', 7 * 86400)]
+        directory = tempfile.mkdtemp(prefix='watchtower-columns-')
+        storages = {'orm': ORMStorage(), 'columnar': ColumnarStorage(directory)}
+        try:
+            for name in backends:
+                storage = storages[name]
+                written, elapsed = 0, 0.0
+                for step in range(0, steps, steps_per_batch):
+                    count = min(steps_per_batch, steps - step)
+                    batch = ReadingBatch(
+                        np.tile(sensor_ids, count),
+                        np.repeat(start + 60.0 * np.arange(step, step + count), len(sensor_ids)),
+                        self.rng.normal(22.0, 2.0, count * len(sensor_ids)),
+                        np.full(count * len(sensor_ids), 100),
+                    )
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        storage.append(batch)
+                    elapsed += time.perf_counter() - started
+                    written += len(batch)
+                self.report(f'{name}: append', written, elapsed)
+
+                for label, seconds in windows:
+                    seconds = min(seconds, steps * 60)
+                    ends = start + seconds + self.rng.random(requests) * (steps * 60 - seconds)
+                    latencies, returned = [], 0
+                    started = time.perf_counter()
+                    for sensor_id, end in zip(self.rng.choice(sensor_ids, requests).tolist(), ends.tolist()):
+                        query_started = time.perf_counter()
+                        timestamps, _, _ = storage.read_range(
+                            sensor_id,
+                            datetime.fromtimestamp(end - seconds, tz=dt_timezone.utc),
+                            datetime.fromtimestamp(end, tz=dt_timezone.utc),
+                        )
+                        latencies.append(time.perf_counter() - query_started)
+                        returned += len(timestamps)
+                    self.report_latency(
+                        f'{name}: read {label} (~{returned // requests} rows)', latencies,
+                        time.perf_counter() - started
+                    )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def bench_load(self, sensors, days, interval, batch_size, requests, concurrency, output, **options):
+        sensor_ids = self.create_sensors(sensors)
+        sensor_map = Sensor.objects.in_bulk(sensor_ids)
+        user = User.objects.create_user('benchmark')
+        user.organizations.add(sensor_map[sensor_ids[0]].organization)
+
+        # Every sensor reports each interval for the whole period; the
+        # readings go through the ingest pipeline so rollups, coverage,
+        # baselines and alerts are populated as in production.
+        end = timezone.now().timestamp()
+        timestamps = end - interval * np.arange(int(days * 86400 // interval))[::-1]
+        steps_per_batch = max(1, batch_size // len(sensor_ids))
+        started = time.perf_counter()
+        for offset in range(0, len(timestamps), steps_per_batch):
+            chunk = timestamps[offset:offset + steps_per_batch]
+            size = len(chunk) * len(sensor_ids)
+            store_readings(ReadingBatch(
+                np.tile(sensor_ids, len(chunk)),
+                np.repeat(chunk, len(sensor_ids)),
+                self.rng.normal(22.0, 4.0, size),
+                np.full(size, 100),
+                sensors=sensor_map,
+            ))
+        seeded = len(timestamps) * len(sensor_ids)
+        self.report('seed readings', seeded, time.perf_counter() - started)
+
+        # Each ingest request posts one new reading per sensor (up to 100),
+        # a millisecond apart so they stay behind the server clock.
+        ingest_ids = sensor_ids[:100]
+        ingest_payloads = [
+            json.dumps([
+                {'sensor': sensor_id, 'timestamp': end + (i + 1) * 1e-3, 'value': float(value)}
+                for sensor_id, value in zip(ingest_ids, self.rng.normal(22.0, 4.0, len(ingest_ids)))
+            ])
+            for i in range(requests)
+        ]
+        targets = [
+            ('dashboard', '/', None),
+            ('sensor_detail', '/sensor/{}/', None),
+            ('get_sensor_data', '/sensor/{}/data/?timeframe=7d', None),
+            ('sensor_analytics', '/sensor/{}/analytics/', None),
+            ('alerts', '/alerts/', None),
+            ('ingest_readings', '/readings/ingest/', ingest_payloads),
+        ]
+
+        results = {}
+        setup_test_environment()
+        # Slow request warnings would drown the report.
+        slow_requests = override_settings(SENSOR_SLOW_REQUEST_MS=None)
+        slow_requests.enable()
+        try:
+            for name, path, payloads in targets:
+                paths = [path.format(sensor_ids[i % len(sensor_ids)]) for i in range(requests)]
+                latencies, elapsed = self.load_wsgi(user, paths, concurrency, payloads)
+                self.report_latency(name, latencies, elapsed)
+                results[name] = self.latency_stats(latencies, elapsed)
+        finally:
+            slow_requests.disable()
+            teardown_test_environment()
+
+        if output:
+            with open(output, 'w') as f:
+                json.dump({
+                    'suite': 'load',
+                    'commit': self.git_commit(),
+                    'started_at': timezone.now().isoformat(),
+                    'backend': connections[options['database']].vendor,
+                    'dataset': {
+                        'sensors': len(sensor_ids),
+                        'days': days,
+                        'interval': interval,
+                        'readings': seeded,
+                    },
+                    'concurrency': concurrency,
+                    'endpoints': results,
+                }, f, indent=2)
+            self.stdout.write(f'Results written to {output}')
+
+    def git_commit(self):
+        try:
+            result = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout.strip() or None
@@ -3,111 +3,145 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from sensor.models import (
     SensorType, Location, Organization, 
-    Sensor, SensorData, Alert, MaintenanceLog
+    Sensor, SensorData, Alert, MaintenanceLog,
+    SensorDataHourly, SensorDataDaily
 )
-import random
+from sensor.ingest import ReadingBatch, store_readings
 from datetime import timedelta
-import math
+import numpy as np
+import random
 
 class Command(BaseCommand):
     help = 'Creates sample data for testing the application'
 
-    def generate_temperature_data(self, timestamp, base_temp=22.0):
+    def add_arguments(self, parser):
+        parser.add_argument('--sensors', type=int, default=8,
+                            help='Number of sensors to create (cycles through sensor types)')
+        parser.add_argument('--days', type=int, default=7,
+                            help='Days of history to generate')
+        parser.add_argument('--interval', type=int,
+                            help='Reading interval in seconds (default: random per sensor)')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Readings written per bulk insert')
+        parser.add_argument('--seed', type=int,
+                            help='Random seed for reproducible data')
+
+    # The generators below take an array of UTC epoch seconds and return an
+    # array of values, so a whole series is synthesized in one pass.
+
+    @staticmethod
+    def hours(timestamps):
+        return (timestamps // 3600) % 24
+
+    @staticmethod
+    def weekdays(timestamps):
+        # 1970-01-01 was a Thursday (weekday 3).
+        return (timestamps // 86400 + 3) % 7
+
+    def office_hours(self, timestamps):
+        hour = self.hours(timestamps)
+        return (self.weekdays(timestamps) < 5) & (hour >= 9) & (hour < 17)
+
+    def generate_temperature_data(self, timestamps, base_temp=22.0):
         """Simulate indoor temperature with daily variation"""
-        hour = timestamp.hour
+        hour = self.hours(timestamps)
         # Daily temperature curve (peak at 14:00)
-        daily_variation = 2 * math.sin(math.pi * (hour - 6) / 12)
+        daily_variation = 2 * np.sin(np.pi * (hour - 6) / 12)
         # Add some random noise
-        noise = random.uniform(-0.5, 0.5)
+        noise = self.rng.uniform(-0.5, 0.5, len(timestamps))
         return base_temp + daily_variation + noise
 
-    def generate_humidity_data(self, timestamp, base_humidity=50.0):
+    def generate_humidity_data(self, timestamps, base_humidity=50.0):
         """Simulate indoor humidity with daily variation"""
-        hour = timestamp.hour
+        hour = self.hours(timestamps)
         # Inverse of temperature curve (higher at night)
-        daily_variation = -10 * math.sin(math.pi * (hour - 6) / 12)
-        noise = random.uniform(-3, 3)
+        daily_variation = -10 * np.sin(np.pi * (hour - 6) / 12)
+        noise = self.rng.uniform(-3, 3, len(timestamps))
         value = base_humidity + daily_variation + noise
-        return max(min(value, 100), 0)  # Clamp between 0-100%
+        return np.clip(value, 0, 100)  # Clamp between 0-100%
 
-    def generate_pressure_data(self, timestamp, base_pressure=1013.25):
+    def generate_pressure_data(self, timestamps, base_pressure=1013.25):
         """Simulate atmospheric pressure with weather patterns"""
         # Create a slow-changing pattern over days
-        day_factor = (timestamp.timestamp() / (24 * 3600)) % 7
-        weather_pattern = 5 * math.sin(2 * math.pi * day_factor / 7)
-        noise = random.uniform(-0.5, 0.5)
+        day_factor = (timestamps / (24 * 3600)) % 7
+        weather_pattern = 5 * np.sin(2 * np.pi * day_factor / 7)
+        noise = self.rng.uniform(-0.5, 0.5, len(timestamps))
         return base_pressure + weather_pattern + noise
 
-    def generate_co2_data(self, timestamp, base_co2=400):
+    def generate_co2_data(self, timestamps, base_co2=400):
         """Simulate CO2 levels with occupancy patterns"""
-        hour = timestamp.hour
-        weekday = timestamp.weekday()
-        
         # Simulate office hours (9-17 on weekdays)
-        if weekday < 5 and 9 <= hour < 17:
-            occupancy_factor = 200  # Higher CO2 during office hours
-        else:
-            occupancy_factor = 0
-            
+        occupancy_factor = np.where(self.office_hours(timestamps), 200, 0)
         # Add some random variation
-        noise = random.uniform(-20, 20)
+        noise = self.rng.uniform(-20, 20, len(timestamps))
         return base_co2 + occupancy_factor + noise
 
-    def generate_light_data(self, timestamp, base_light=300):
+    def generate_light_data(self, timestamps, base_light=300):
         """Simulate light levels with day/night cycle"""
-        hour = timestamp.hour
-        
-        # Night time (very low light)
-        if hour < 6 or hour > 20:
-            return random.uniform(0, 10)
-            
+        hour = self.hours(timestamps)
         # Day time with peak at noon
-        daylight = 1000 * math.sin(math.pi * (hour - 6) / 12)
-        noise = random.uniform(-50, 50)
-        return max(base_light + daylight + noise, 0)
+        daylight = 1000 * np.sin(np.pi * (hour - 6) / 12)
+        noise = self.rng.uniform(-50, 50, len(timestamps))
+        day_values = np.maximum(base_light + daylight + noise, 0)
+        # Night time (very low light)
+        night = (hour < 6) | (hour > 20)
+        return np.where(night, self.rng.uniform(0, 10, len(timestamps)), day_values)
 
-    def generate_noise_data(self, timestamp, base_noise=35):
+    def generate_noise_data(self, timestamps, base_noise=35):
         """Simulate noise levels with activity patterns"""
-        hour = timestamp.hour
-        weekday = timestamp.weekday()
-        
         # Higher noise during work hours on weekdays
-        if weekday < 5 and 9 <= hour < 17:
-            activity_noise = random.uniform(15, 25)
-        else:
-            activity_noise = random.uniform(0, 10)
-            
-        noise = random.uniform(-5, 5)
+        activity_noise = np.where(
+            self.office_hours(timestamps),
+            self.rng.uniform(15, 25, len(timestamps)),
+            self.rng.uniform(0, 10, len(timestamps))
+        )
+        noise = self.rng.uniform(-5, 5, len(timestamps))
         return base_noise + activity_noise + noise
 
-    def generate_pm25_data(self, timestamp, base_pm25=10):
+    def generate_pm25_data(self, timestamps, base_pm25=10):
         """Simulate PM2.5 levels with daily patterns"""
-        hour = timestamp.hour
-        
         # Higher pollution during rush hours
-        if hour in [8, 9, 17, 18]:
-            traffic_factor = random.uniform(5, 15)
-        else:
-            traffic_factor = random.uniform(0, 5)
-            
-        noise = random.uniform(-2, 2)
-        return max(base_pm25 + traffic_factor + noise, 0)
+        rush_hour = np.isin(self.hours(timestamps), [8, 9, 17, 18])
+        traffic_factor = np.where(
+            rush_hour,
+            self.rng.uniform(5, 15, len(timestamps)),
+            self.rng.uniform(0, 5, len(timestamps))
+        )
+        noise = self.rng.uniform(-2, 2, len(timestamps))
+        return np.maximum(base_pm25 + traffic_factor + noise, 0)
 
-    def generate_voc_data(self, timestamp, base_voc=100):
+    def generate_voc_data(self, timestamps, base_voc=100):
         """Simulate VOC levels with activity patterns"""
-        hour = timestamp.hour
-        weekday = timestamp.weekday()
-        
         # Higher VOCs during work hours
-        if weekday < 5 and 9 <= hour < 17:
-            activity_factor = random.uniform(50, 150)
-        else:
-            activity_factor = random.uniform(0, 50)
-            
-        noise = random.uniform(-20, 20)
-        return max(base_voc + activity_factor + noise, 0)
+        activity_factor = np.where(
+            self.office_hours(timestamps),
+            self.rng.uniform(50, 150, len(timestamps)),
+            self.rng.uniform(0, 50, len(timestamps))
+        )
+        noise = self.rng.uniform(-20, 20, len(timestamps))
+        return np.maximum(base_voc + activity_factor + noise, 0)
+
+    def generate_readings(self, sensor, data_generator, start_time, end_time, batch_size):
+        """Yield ReadingBatches covering a sensor's history, oldest first"""
+        timestamps = np.arange(start_time, end_time + 1, sensor.reading_interval, dtype=np.float64)
+        for offset in range(0, len(timestamps), batch_size):
+            chunk = timestamps[offset:offset + batch_size]
+            values = data_generator(chunk)
+            quality = self.rng.integers(80, 101, len(chunk))
 
-    def handle(self, *args, **kwargs):
+            # Determine data quality and possible anomalies (5% chance)
+            anomalies = self.rng.random(len(chunk)) < 0.05
+            values[anomalies] *= self.rng.uniform(1.5, 2.0, anomalies.sum())  # Significant deviation
+            quality[anomalies] = self.rng.integers(30, 61, anomalies.sum())
+
+            yield ReadingBatch(
+                np.full(len(chunk), sensor.id), chunk, values, quality,
+                sensors={sensor.id: sensor}
+            )
+
+    def handle(self, *args, **options):
+        self.rng = np.random.default_rng(options['seed'])
+        random.seed(options['seed'])
         self.stdout.write('Creating sample data...')
         
         # Clear existing data
@@ -115,6 +149,8 @@ class Command(BaseCommand):
         MaintenanceLog.objects.all().delete()
         Alert.objects.all().delete()
         SensorData.objects.all().delete()
+        SensorDataHourly.objects.all().delete()
+        SensorDataDaily.objects.all().delete()
         Sensor.objects.all().delete()
         Location.objects.all().delete()
         SensorType.objects.all().delete()
@@ -233,10 +269,12 @@ class Command(BaseCommand):
         org.users.add(User.objects.get(username='admin'))
         
         # Create sensors with appropriate distribution
-        created_sensors = []
-        for i, ((sensor_type, config), location) in enumerate(zip(created_types, created_locations * 2)):
+        sensors = []
+        for i in range(options['sensors']):
+            sensor_type, config = created_types[i % len(created_types)]
+            location = created_locations[i % len(created_locations)]
             unique_name = f"{config['name']} Sensor {location.name} {i+1}"
-            sensor = Sensor.objects.create(
+            sensors.append(Sensor(
                 name=unique_name,
                 description=f"{config['name']} sensor in {location.name}",
                 sensor_type=sensor_type,
@@ -245,49 +283,26 @@ class Command(BaseCommand):
                 status=random.choice(['active'] * 3 + ['maintenance', 'error']),
                 min_threshold=config['min_val'],
                 max_threshold=config['max_val'],
-                reading_interval=random.choice([60, 300, 600])
-            )
-            created_sensors.append((sensor, config))
+                reading_interval=options['interval'] or random.choice([60, 300, 600])
+            ))
+        Sensor.objects.bulk_create(sensors)
+        created_sensors = list(zip(
+            Sensor.objects.filter(organization=org).order_by('id'),
+            [created_types[i % len(created_types)][1] for i in range(options['sensors'])]
+        ))
         
-        # Generate sensor data
-        end_time = timezone.now()
-        start_time = end_time - timedelta(days=7)
+        # Generate sensor data. Readings go through the normal ingest path, so
+        # rollups are maintained and out-of-range anomalies raise alerts.
+        end_time = timezone.now().timestamp()
+        start_time = end_time - timedelta(days=options['days']).total_seconds()
         
         for sensor, config in created_sensors:
-            # Delete existing data
-            SensorData.objects.filter(sensor=sensor).delete()
-            
-            current_time = start_time
-            data_generator = config['data_generator']
-            
-            while current_time <= end_time:
-                # Generate value using the specific generator for this sensor type
-                value = data_generator(current_time)
-                
-                # Determine data quality and possible anomalies
-                if random.random() < 0.05:  # 5% chance of anomaly
-                    value = value * random.uniform(1.5, 2.0)  # Significant deviation
-                    quality = random.randint(30, 60)
-                    
-                    # Create alert for anomaly
-                    Alert.objects.create(
-                        sensor=sensor,
-                        message=f'Abnormal {sensor.sensor_type.name} reading detected: {value:.2f} {sensor.sensor_type.unit}',
-                        value=value,
-                        severity=random.choice(['medium', 'high']),
-                        timestamp=current_time
-                    )
-                else:
-                    quality = random.randint(80, 100)
-                
-                SensorData.objects.create(
-                    sensor=sensor,
-                    timestamp=current_time,
-                    value=value,
-                    quality=quality
-                )
-                
-                current_time += timedelta(seconds=sensor.reading_interval)
+            written = 0
+            for batch in self.generate_readings(
+                sensor, config['data_generator'], start_time, end_time, options['batch_size']
+            ):
+                written += store_readings(batch)
+            self.stdout.write(f'{sensor.name}: {written} readings written')
         
         # Create maintenance logs
         maintenance_tasks = {
@@ -301,14 +316,17 @@ class Command(BaseCommand):
             'VOC': ['VOC sensor calibrated', 'Gas chamber cleaned', 'Reference gas check']
         }
         
-        for sensor, _ in created_sensors:
+        admin = User.objects.get(username='admin')
+        maintenance_logs = []
+        for sensor, config in created_sensors:
             for _ in range(random.randint(1, 3)):
-                tasks = maintenance_tasks.get(sensor.sensor_type.name, ['Routine maintenance check'])
-                MaintenanceLog.objects.create(
+                tasks = maintenance_tasks.get(config['name'], ['Routine maintenance check'])
+                maintenance_logs.append(MaintenanceLog(
                     sensor=sensor,
-                    performed_by=User.objects.get(username='admin'),
+                    performed_by=admin,
                     description=random.choice(tasks),
                     next_maintenance_date=timezone.now() + timedelta(days=random.randint(30, 90))
-                )
+                ))
+        MaintenanceLog.objects.bulk_create(maintenance_logs)
         
         self.stdout.write(self.style.SUCCESS('Successfully created sample data'))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sensor.retention import ARCHIVE_FORMATS, DEFAULT_CHUNK_SIZE, prune_readings
+
+
+class Command(BaseCommand):
+    help = 'Rolls up, archives and deletes raw sensor readings past the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SENSOR_RAW_RETENTION_DAYS,
+                            help='Keep this many days of raw readings')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--archive-dir', default=settings.SENSOR_ARCHIVE_DIR,
+                            help='Archive pruned readings per sensor per month under this directory')
+        parser.add_argument('--format', choices=ARCHIVE_FORMATS, default='npz')
+        parser.add_argument('--every', type=int,
+                            help='Keep running, pruning every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                deleted = prune_readings(
+                    days=options['days'],
+                    chunk_size=options['chunk_size'],
+                    archive_dir=options['archive_dir'],
+                    fmt=options['format'],
+                    log=self.stdout.write if options['verbosity'] > 1 else None,
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} readings'))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sensor.rollups import rebuild_rollups
+from sensor.uptime import rebuild_coverage
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds hourly and daily reading rollups (and optionally uptime coverage) from raw sensor data; '
+            'history before the oldest kept raw reading, already pruned, is left as is')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sensor', type=int, action='append', dest='sensors',
+                            help='Only rebuild this sensor id (repeatable)')
+        parser.add_argument('--days', type=int,
+                            help='Only rebuild the most recent N days')
+        parser.add_argument('--coverage', action='store_true',
+                            help='Also rebuild uptime coverage spans from the raw readings')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['days']:
+            start = timezone.now() - timedelta(days=options['days'])
+        rebuild_rollups(sensor_ids=options['sensors'], start=start)
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt rollups'))
+        if options['coverage']:
+            rebuild_coverage(sensor_ids=options['sensors'])
+            self.stdout.write(self.style.SUCCESS('Successfully rebuilt uptime coverage'))
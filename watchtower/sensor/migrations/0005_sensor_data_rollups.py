@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0004_alert_location_maintenancelog_organization_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDataHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('value_sum', models.FloatField(default=0)),
+                ('value_sum_sq', models.FloatField(default=0)),
+                ('value_min', models.FloatField()),
+                ('value_max', models.FloatField()),
+                ('period', models.DateTimeField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='sensor.sensor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SensorDataDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('value_sum', models.FloatField(default=0)),
+                ('value_sum_sq', models.FloatField(default=0)),
+                ('value_min', models.FloatField()),
+                ('value_max', models.FloatField()),
+                ('period', models.DateField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='sensor.sensor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sensordatahourly',
+            constraint=models.UniqueConstraint(fields=('sensor', 'period'), name='unique_hourly_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='sensordatadaily',
+            constraint=models.UniqueConstraint(fields=('sensor', 'period'), name='unique_daily_rollup'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0005_sensor_data_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='sensordata',
+            options={},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0006_remove_sensordata_ordering'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['acknowledged', 'timestamp', 'id'], name='sensor_aler_acknowl_97f190_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0007_alert_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coverage', to='sensor.sensor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sensor', 'end'], name='sensor_sens_sensor__1e5051_idx')],
+            },
+        ),
+    ]
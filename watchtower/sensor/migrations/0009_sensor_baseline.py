@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0008_sensor_coverage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorBaseline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0)),
+                ('ewma', models.FloatField(default=0)),
+                ('ewma_sq', models.FloatField(default=0)),
+                ('hourly', models.BinaryField()),
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='baseline', to='sensor.sensor')),
+            ],
+        ),
+    ]
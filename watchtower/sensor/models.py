@@ -93,11 +93,62 @@ class SensorData(models.Model):
     )
     
     class Meta:
-        ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['sensor', 'timestamp']),
         ]
 
+class SensorDataRollup(models.Model):
+    count = models.IntegerField(default=0)
+    value_sum = models.FloatField(default=0)
+    value_sum_sq = models.FloatField(default=0)
+    value_min = models.FloatField()
+    value_max = models.FloatField()
+
+    class Meta:
+        abstract = True
+
+class SensorDataHourly(SensorDataRollup):
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='hourly_rollups')
+    period = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'period'], name='unique_hourly_rollup'),
+        ]
+
+class SensorDataDaily(SensorDataRollup):
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='daily_rollups')
+    period = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'period'], name='unique_daily_rollup'),
+        ]
+
+class SensorCoverage(models.Model):
+    # A span during which the sensor reported without gaps
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='coverage')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sensor', 'end']),
+        ]
+
+class SensorBaseline(models.Model):
+    # Running statistics of a sensor's readings used for anomaly scoring:
+    # Welford mean/M2 over all readings, an exponentially weighted mean of
+    # values and squared values, and per UTC hour-of-day Welford statistics
+    # packed as a float64 array of shape (3, 24) (count, mean, M2).
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, related_name='baseline')
+    count = models.BigIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    ewma = models.FloatField(default=0)
+    ewma_sq = models.FloatField(default=0)
+    hourly = models.BinaryField()
+
 class Alert(models.Model):
     SEVERITY_CHOICES = [
         ('low', 'Low'),
@@ -117,6 +168,10 @@ class Alert(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination over open alerts seeks on (timestamp, id)
+            models.Index(fields=['acknowledged', 'timestamp', 'id']),
+        ]
 
 class MaintenanceLog(models.Model):
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='maintenance_logs')
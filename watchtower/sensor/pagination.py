@@ -0,0 +1,78 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _cursor_value(value):
+    # Full isoformat: DjangoJSONEncoder would drop the microseconds that
+    # keyset equality depends on.
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_cursor_value(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Decode a cursor into a list of ``length`` scalar column values."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != length or not all(
+        isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values
+    ):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page_size(params, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(params.get('size', default))
+    except ValueError:
+        raise ValueError('size must be an integer')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, ordering, cursor=None, size=DEFAULT_PAGE_SIZE):
+    """Return ``(items, next_cursor)`` for one page of a keyset ordering.
+
+    ``ordering`` lists the columns that uniquely order the rows, all
+    ascending or all descending (e.g. ``['-timestamp', '-id']``). The page
+    after ``cursor`` is found with a row comparison on those columns, so
+    deep pages cost the same index seek as the first one.
+    """
+    fields = [name.lstrip('-') for name in ordering]
+    descending = ordering[0].startswith('-')
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor, len(fields))
+        model_fields = [queryset.model._meta.get_field(name) for name in fields]
+        try:
+            values = [field.to_python(value) for field, value in zip(model_fields, values)]
+        except (TypeError, ValueError, OverflowError, ValidationError):
+            raise ValueError('Invalid cursor')
+        op = 'lt' if descending else 'gt'
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+        seek = Q()
+        for i, name in enumerate(fields):
+            condition = Q(**{f'{name}__{op}': values[i]})
+            for prior, value in zip(fields[:i], values[:i]):
+                condition &= Q(**{prior: value})
+            seek |= condition
+        queryset = queryset.filter(seek)
+
+    items = list(queryset[:size + 1])
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    last = items[-1]
+    return items, encode_cursor([getattr(last, name) for name in fields])
@@ -0,0 +1,150 @@
+import os
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import SensorData
+from .rollups import rebuild_rollups
+from .storage import ORMStorage, get_storage
+
+ARCHIVE_FORMATS = ('npz', 'parquet')
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def retention_cutoff(days, now=None):
+    """Start of the UTC day ``days`` ago; readings before it are pruned.
+
+    Cutting on a day boundary means a day's raw readings are either all
+    present or all gone, so rebuilding a day's rollups never sees a
+    partially pruned day.
+    """
+    now = now or timezone.now()
+    day = (now - timedelta(days=days)).astimezone(dt_timezone.utc).date()
+    return datetime.combine(day, time.min, dt_timezone.utc)
+
+
+def month_windows(start, end):
+    """Yield ``(month_start, window_end)`` pairs covering ``[start, end)``."""
+    month = datetime(start.year, start.month, 1, tzinfo=dt_timezone.utc)
+    while month < end:
+        following = (month + timedelta(days=32)).replace(day=1)
+        yield month, min(following, end)
+        month = following
+
+
+def merge_archived(existing, columns):
+    """Union of archived and new rows, sorted by timestamp.
+
+    Rows archived by an earlier run that stopped before deleting them are
+    read again on the next run; identical rows are kept only once.
+    """
+    rows = np.empty(len(existing['timestamp']) + len(columns['timestamp']), dtype=[
+        ('timestamp', np.float64), ('value', np.float64), ('quality', np.uint8)
+    ])
+    for name in rows.dtype.names:
+        rows[name] = np.concatenate([existing[name], columns[name]])
+    rows = np.unique(rows)
+    return {name: np.ascontiguousarray(rows[name]) for name in rows.dtype.names}
+
+
+def archive_readings(sensor_id, start, end, directory, fmt='npz'):
+    """Write one sensor's readings in ``[start, end)`` to a columnar file.
+
+    Files are laid out as ``<directory>/<sensor_id>/<YYYY-MM>.<fmt>``; an
+    existing file for the month is merged with the new rows and replaced
+    atomically, so rerunning after a crash never duplicates readings.
+    """
+    rows = SensorData.objects.filter(
+        sensor_id=sensor_id,
+        timestamp__gte=start,
+        timestamp__lt=end
+    ).order_by('timestamp').values_list('timestamp', 'value', 'quality')
+
+    timestamps, values, quality = [], [], []
+    for ts, value, q in rows.iterator(chunk_size=DEFAULT_CHUNK_SIZE):
+        timestamps.append(ts.timestamp())
+        values.append(value)
+        quality.append(q)
+    if not timestamps:
+        return None
+
+    columns = {
+        'timestamp': np.array(timestamps, dtype=np.float64),
+        'value': np.array(values, dtype=np.float64),
+        'quality': np.array(quality, dtype=np.uint8),
+    }
+    path = Path(directory) / str(sensor_id) / f'{start:%Y-%m}.{fmt}'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+
+    if fmt == 'npz':
+        if path.exists():
+            with np.load(path) as existing:
+                columns = merge_archived(existing, columns)
+        with open(partial, 'wb') as f:
+            np.savez_compressed(f, **columns)
+    elif fmt == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError('Parquet archives require the pyarrow package')
+        if path.exists():
+            existing = pq.read_table(path)
+            columns = merge_archived({name: existing.column(name).to_numpy() for name in columns}, columns)
+        pq.write_table(pa.table(columns), partial, compression='zstd')
+    else:
+        raise ValueError(f'Unknown archive format: {fmt}')
+    os.replace(partial, path)
+    return path
+
+
+def delete_readings(sensor_id, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Delete readings in bounded chunks, each in its own short transaction."""
+    readings = SensorData.objects.filter(
+        sensor_id=sensor_id,
+        timestamp__gte=start,
+        timestamp__lt=end
+    )
+    deleted = 0
+    while True:
+        ids = list(readings.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += SensorData.objects.filter(id__in=ids).delete()[0]
+
+
+def prune_readings(days=None, chunk_size=DEFAULT_CHUNK_SIZE, archive_dir=None, fmt='npz', log=None):
+    """Roll up, optionally archive, then delete raw readings older than ``days``.
+
+    Returns the number of raw readings deleted. Only readings kept in the
+    ``SensorData`` table (``ORMStorage``) can be pruned.
+    """
+    storage = get_storage()
+    if not isinstance(storage, ORMStorage):
+        raise RuntimeError(f'Pruning needs the ORMStorage backend, not {type(storage).__name__}')
+    if days is None:
+        days = settings.SENSOR_RAW_RETENTION_DAYS
+    cutoff = retention_cutoff(days)
+    oldest = SensorData.objects.filter(timestamp__lt=cutoff).values('sensor_id').annotate(
+        first=Min('timestamp')
+    ).order_by('sensor_id')
+
+    deleted = 0
+    for row in oldest:
+        sensor_id = row['sensor_id']
+        for start, end in month_windows(row['first'], cutoff):
+            # Remaining raw data starts on a whole day, so the month's rollups
+            # can be rebuilt safely before its raw rows go away.
+            rebuild_rollups(sensor_ids=[sensor_id], start=max(start, row['first']), end=end - timedelta(days=1))
+            if archive_dir:
+                archive_readings(sensor_id, start, end, archive_dir, fmt)
+            count = delete_readings(sensor_id, start, end, chunk_size)
+            deleted += count
+            if log:
+                log(f'Sensor {sensor_id} {start:%Y-%m}: pruned {count} readings')
+    return deleted
@@ -0,0 +1,199 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.dispatch import receiver
+
+from .ingest import ReadingBatch
+from .models import Sensor, SensorData, SensorDataDaily, SensorDataHourly
+from .signals import readings_ingested
+from .storage import ORMStorage, get_storage
+
+HOUR = 3600
+DAY = 24 * HOUR
+ROLLUP_FIELDS = ['count', 'value_sum', 'value_sum_sq', 'value_min', 'value_max']
+MERGE_ATTEMPTS = 3
+
+
+def _hour(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def _day(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc).date()
+
+
+# (model, bucket width in seconds, epoch -> period value, DB truncation)
+ROLLUPS = [
+    (SensorDataHourly, HOUR, _hour, TruncHour),
+    (SensorDataDaily, DAY, _day, TruncDate),
+]
+
+
+def aggregate_batch(batch, seconds):
+    """Reduce a ``ReadingBatch`` to per-(sensor, bucket) partial aggregates."""
+    buckets = np.floor(batch.timestamps / seconds) * seconds
+    order = np.lexsort((buckets, batch.sensor_ids))
+    sensor_ids, buckets = batch.sensor_ids[order], buckets[order]
+    values = batch.values[order]
+
+    starts = np.flatnonzero(np.r_[True, (sensor_ids[1:] != sensor_ids[:-1]) | (buckets[1:] != buckets[:-1])])
+    return {
+        'sensor_id': sensor_ids[starts],
+        'bucket': buckets[starts],
+        'count': np.diff(np.r_[starts, len(values)]),
+        'value_sum': np.add.reduceat(values, starts),
+        'value_sum_sq': np.add.reduceat(values * values, starts),
+        'value_min': np.minimum.reduceat(values, starts),
+        'value_max': np.maximum.reduceat(values, starts),
+    }
+
+
+def _merge(model, to_period, partials):
+    keys = list(zip(partials['sensor_id'].tolist(), map(to_period, partials['bucket'].tolist())))
+    existing = {
+        (row.sensor_id, row.period): row
+        for row in model.objects.select_for_update().filter(
+            sensor_id__in={sensor_id for sensor_id, _ in keys},
+            period__in={period for _, period in keys},
+        )
+    }
+
+    to_create, to_update = [], []
+    columns = zip(*(partials[field].tolist() for field in ROLLUP_FIELDS))
+    for (sensor_id, period), (count, total, total_sq, low, high) in zip(keys, columns):
+        row = existing.get((sensor_id, period))
+        if row is None:
+            to_create.append(model(
+                sensor_id=sensor_id, period=period, count=count, value_sum=total,
+                value_sum_sq=total_sq, value_min=low, value_max=high,
+            ))
+            continue
+        row.count += count
+        row.value_sum += total
+        row.value_sum_sq += total_sq
+        row.value_min = min(row.value_min, low)
+        row.value_max = max(row.value_max, high)
+        to_update.append(row)
+
+    model.objects.bulk_create(to_create)
+    model.objects.bulk_update(to_update, ROLLUP_FIELDS, batch_size=500)
+
+
+def update_rollups(batch):
+    """Fold a batch of new readings into the hourly and daily rollups."""
+    if not len(batch):
+        return
+    for model, seconds, to_period, _ in ROLLUPS:
+        partials = aggregate_batch(batch, seconds)
+        # A concurrent writer may create the same bucket between our read and
+        # insert; re-read and merge again when that happens.
+        for attempt in range(MERGE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    _merge(model, to_period, partials)
+                break
+            except IntegrityError:
+                if attempt == MERGE_ATTEMPTS - 1:
+                    raise
+
+
+def _table_rollups(model, truncate, readings):
+    """Rollup rows aggregated by the database from ``SensorData``."""
+    rows = readings.annotate(
+        bucket=truncate('timestamp', tzinfo=dt_timezone.utc)
+    ).values('sensor_id', 'bucket').annotate(
+        n=Count('id'),
+        total=Sum('value'),
+        total_sq=Sum(F('value') * F('value')),
+        low=Min('value'),
+        high=Max('value'),
+    ).order_by()
+    for row in rows.iterator():
+        yield model(
+            sensor_id=row['sensor_id'], period=row['bucket'], count=row['n'],
+            value_sum=row['total'], value_sum_sq=row['total_sq'],
+            value_min=row['low'], value_max=row['high'],
+        )
+
+
+def _storage_rollups(model, seconds, to_period, storage, sensor_ids, start, end):
+    """Rollup rows aggregated with NumPy from readings read one sensor at a time."""
+    for sensor_id in sensor_ids:
+        timestamps, values, quality = storage.read_range(sensor_id, start, end)
+        if not len(timestamps):
+            continue
+        partials = aggregate_batch(
+            ReadingBatch(np.full(len(timestamps), sensor_id), timestamps, values, quality), seconds
+        )
+        for bucket, count, total, total_sq, low, high in zip(
+            *(partials[field].tolist() for field in ['bucket', *ROLLUP_FIELDS])
+        ):
+            yield model(
+                sensor_id=sensor_id, period=to_period(bucket), count=count, value_sum=total,
+                value_sum_sq=total_sq, value_min=low, value_max=high,
+            )
+
+
+def _day_start(value):
+    return datetime.combine(value.astimezone(dt_timezone.utc).date(), time.min, dt_timezone.utc)
+
+
+def rebuild_rollups(sensor_ids=None, start=None, end=None):
+    """Recompute rollups from raw readings, replacing what is stored.
+
+    ``start``/``end`` are widened to whole UTC days so that both hourly and
+    daily buckets are rebuilt from complete data. Each sensor is only
+    rebuilt from the day of its oldest stored reading on: older rollups
+    summarise readings that retention has already pruned, and sensors
+    without raw readings keep their rollups untouched. Readings come from
+    the configured storage backend: aggregated in the database for
+    ``ORMStorage``, otherwise read per sensor and aggregated with NumPy.
+    """
+    if start is not None:
+        start = _day_start(start)
+    if end is not None:
+        end = _day_start(end) + timedelta(days=1)
+
+    storage = get_storage()
+    if sensor_ids is None:
+        sensor_ids = Sensor.objects.values_list('id', flat=True)
+    # Prunes cut on a day boundary, so sensors mostly share the same floor
+    # and are still rebuilt with one query per floor.
+    groups = {}
+    for sensor_id, oldest in storage.oldest(list(sensor_ids)).items():
+        floor = _day_start(oldest) if start is None else max(start, _day_start(oldest))
+        if end is None or floor < end:
+            groups.setdefault(floor, []).append(sensor_id)
+
+    with transaction.atomic():
+        for floor, ids in groups.items():
+            _rebuild_rollups(storage, ids, floor, end)
+
+
+def _rebuild_rollups(storage, sensor_ids, start, end):
+    if isinstance(storage, ORMStorage):
+        readings = SensorData.objects.filter(sensor_id__in=sensor_ids, timestamp__gte=start)
+        if end is not None:
+            readings = readings.filter(timestamp__lt=end)
+
+    for model, seconds, to_period, truncate in ROLLUPS:
+        stale = model.objects.filter(
+            sensor_id__in=sensor_ids, period__gte=start if model is SensorDataHourly else start.date()
+        )
+        if end is not None:
+            stale = stale.filter(period__lt=end if model is SensorDataHourly else end.date())
+        stale.delete()
+
+        if isinstance(storage, ORMStorage):
+            rows = _table_rollups(model, truncate, readings)
+        else:
+            rows = _storage_rollups(model, seconds, to_period, storage, sensor_ids, start, end)
+        model.objects.bulk_create(rows, batch_size=1000)
+
+
+@receiver(readings_ingested)
+def fold_into_rollups(sender, batch, **kwargs):
+    update_rollups(batch)
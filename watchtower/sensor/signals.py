@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent inside the ingest transaction once a batch of readings has been
+# written. Receivers get ``batch``, a ``sensor.ingest.ReadingBatch``.
+readings_ingested = Signal()
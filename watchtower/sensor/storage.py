@@ -0,0 +1,271 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Min, OuterRef, Subquery
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Sensor, SensorData
+
+Reading = namedtuple('Reading', ['timestamp', 'value', 'quality'])
+
+DEFAULT_STORAGE = {'BACKEND': 'sensor.storage.ORMStorage', 'OPTIONS': {}}
+EXPORT_CHUNK_SIZE = 5000
+
+
+def _epoch(value):
+    return None if value is None else value.timestamp()
+
+
+def _datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+class ORMStorage:
+    """Raw readings in the ``SensorData`` table."""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def append(self, batch):
+        SensorData.objects.bulk_create(batch.to_models(), batch_size=self.batch_size)
+
+    def _readings(self, sensor_id, start, end):
+        readings = SensorData.objects.filter(sensor_id=sensor_id)
+        if start is not None:
+            readings = readings.filter(timestamp__gte=start)
+        if end is not None:
+            readings = readings.filter(timestamp__lt=end)
+        return readings
+
+    def read_range(self, sensor_id, start=None, end=None):
+        rows = list(self._readings(sensor_id, start, end).order_by('timestamp').values_list('timestamp', 'value', 'quality'))
+        return (
+            np.array([ts.timestamp() for ts, _, _ in rows], dtype=np.float64),
+            np.array([value for _, value, _ in rows], dtype=np.float64),
+            np.array([quality for _, _, quality in rows], dtype=np.int64),
+        )
+
+    def tail(self, sensor_id, limit, start=None, end=None):
+        return list(self._readings(sensor_id, start, end).order_by('-timestamp')
+                    .values_list('timestamp', 'value', 'quality', named=True)[:limit])
+
+    def latest(self, sensor_ids):
+        newest = SensorData.objects.filter(sensor=OuterRef('pk')).order_by('-timestamp')
+        rows = Sensor.objects.filter(id__in=sensor_ids).annotate(
+            last_timestamp=Subquery(newest.values('timestamp')[:1]),
+            last_value=Subquery(newest.values('value')[:1]),
+            last_quality=Subquery(newest.values('quality')[:1]),
+        ).filter(last_timestamp__isnull=False).values_list('id', 'last_timestamp', 'last_value', 'last_quality')
+        return {sensor_id: Reading(timestamp, value, quality) for sensor_id, timestamp, value, quality in rows}
+
+    def oldest(self, sensor_ids):
+        rows = SensorData.objects.filter(sensor_id__in=sensor_ids).values('sensor_id').annotate(
+            first=Min('timestamp')
+        ).order_by().values_list('sensor_id', 'first')
+        return dict(rows)
+
+    def iter_rows(self, sensor_ids, start=None, end=None):
+        readings = SensorData.objects.filter(sensor_id__in=sensor_ids)
+        if start is not None:
+            readings = readings.filter(timestamp__gte=start)
+        if end is not None:
+            readings = readings.filter(timestamp__lt=end)
+        return readings.order_by('sensor_id', 'timestamp')\
+            .values_list('sensor_id', 'timestamp', 'value', 'quality')\
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class ColumnarStorage:
+    """Append-only, per-sensor column files read through memory maps.
+
+    Each sensor directory holds ``timestamps`` (float64 epoch seconds),
+    ``values`` (float64) and ``quality`` (uint8) columns sorted by time, and
+    an ``index`` of ``(first, last, rows)`` per block of ``BLOCK_ROWS``
+    readings. A range query binary-searches the small index, then the one
+    or two blocks at the edges of the range, and slices the columns.
+
+    Appends are written once the surrounding transaction commits, so the
+    files only hold readings whose rollups and alerts were committed too.
+    Readings older than the newest stored one rewrite the columns from the
+    first block they fall into. Files are locked with ``fcntl.flock``, so
+    this backend needs a POSIX system.
+    """
+
+    BLOCK_ROWS = 4096
+    COLUMNS = [('timestamps', np.float64), ('values', np.float64), ('quality', np.uint8)]
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+
+    def _path(self, sensor_id, name):
+        return os.path.join(self.directory, str(sensor_id), name)
+
+    def _lock(self, sensor_id, exclusive=False):
+        # POSIX only; imported here so the app still loads elsewhere.
+        import fcntl
+
+        os.makedirs(os.path.join(self.directory, str(sensor_id)), exist_ok=True)
+        handle = open(self._path(sensor_id, 'lock'), 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return handle
+
+    def _index(self, sensor_id):
+        path = self._path(sensor_id, 'index')
+        if not os.path.exists(path):
+            return np.empty((0, 3))
+        return np.fromfile(path, dtype=np.float64).reshape(-1, 3)
+
+    def _rows(self, index):
+        if not len(index):
+            return 0
+        return (len(index) - 1) * self.BLOCK_ROWS + int(index[-1, 2])
+
+    def _column(self, sensor_id, name, dtype, rows):
+        # The index, not the file size, says how many rows are complete.
+        if not rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(sensor_id, name), dtype=dtype, mode='r', shape=(rows,))
+
+    def _write(self, path, array, offset):
+        with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+            f.seek(offset * array.itemsize)
+            f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate()
+
+    def append(self, batch):
+        transaction.on_commit(lambda: self._append(batch))
+
+    def _append(self, batch):
+        order = np.lexsort((batch.timestamps, batch.sensor_ids))
+        sensor_ids = batch.sensor_ids[order]
+        starts = np.flatnonzero(np.r_[True, sensor_ids[1:] != sensor_ids[:-1]])
+        columns = [batch.timestamps[order], batch.values[order], batch.quality[order]]
+        for sensor_id, rows in zip(sensor_ids[starts].tolist(), np.split(np.arange(len(order)), starts[1:])):
+            self._append_sensor(sensor_id, [column[rows] for column in columns])
+
+    def _append_sensor(self, sensor_id, columns):
+        with self._lock(sensor_id, exclusive=True):
+            index = self._index(sensor_id)
+            rows = self._rows(index)
+            first_block = len(index) - 1 if len(index) else 0
+            if len(index) and columns[0][0] < index[-1, 1]:
+                # Late readings: merge them into the blocks they belong to.
+                first_block = int(np.searchsorted(index[:, 1], columns[0][0], side='right'))
+                offset = first_block * self.BLOCK_ROWS
+                stored = [
+                    np.array(self._column(sensor_id, name, dtype, rows)[offset:])
+                    for name, dtype in self.COLUMNS
+                ]
+                merged = [np.concatenate([old, new]) for old, new in zip(stored, columns)]
+                order = np.argsort(merged[0], kind='stable')
+                columns = [column[order] for column in merged]
+            else:
+                offset = rows
+
+            for (name, dtype), column in zip(self.COLUMNS, columns):
+                self._write(self._path(sensor_id, name), column.astype(dtype), offset)
+
+            # Rebuild the index from the first block that changed.
+            block_start = first_block * self.BLOCK_ROWS
+            timestamps = np.concatenate([
+                np.array(self._column(sensor_id, 'timestamps', np.float64, offset)[block_start:]),
+                columns[0],
+            ])
+            edges = np.arange(0, len(timestamps), self.BLOCK_ROWS)
+            ends = np.minimum(edges + self.BLOCK_ROWS, len(timestamps))
+            blocks = np.column_stack([timestamps[edges], timestamps[ends - 1], ends - edges])
+            self._write(self._path(sensor_id, 'index'), blocks.astype(np.float64).ravel(), first_block * 3)
+
+    def _slice(self, sensor_id, index, start, end):
+        """Row range ``[lo, hi)`` of readings in ``[start, end)``."""
+        rows = self._rows(index)
+        first = 0 if start is None else int(np.searchsorted(index[:, 1], start, side='left'))
+        last = len(index) if end is None else int(np.searchsorted(index[:, 0], end, side='left'))
+        if first >= last:
+            return 0, 0
+        lo, hi = first * self.BLOCK_ROWS, min(last * self.BLOCK_ROWS, rows)
+        timestamps = self._column(sensor_id, 'timestamps', np.float64, rows)
+        if start is not None:
+            lo += int(np.searchsorted(timestamps[lo:min(lo + self.BLOCK_ROWS, hi)], start, side='left'))
+        if end is not None:
+            edge = max(lo, hi - self.BLOCK_ROWS)
+            hi = edge + int(np.searchsorted(timestamps[edge:hi], end, side='left'))
+        return lo, hi
+
+    def read_range(self, sensor_id, start=None, end=None):
+        with self._lock(sensor_id):
+            index = self._index(sensor_id)
+            lo, hi = self._slice(sensor_id, index, _epoch(start), _epoch(end))
+            rows = self._rows(index)
+            return tuple(
+                np.array(self._column(sensor_id, name, dtype, rows)[lo:hi], dtype=np.float64 if name != 'quality' else np.int64)
+                for name, dtype in self.COLUMNS
+            )
+
+    def tail(self, sensor_id, limit, start=None, end=None):
+        with self._lock(sensor_id):
+            index = self._index(sensor_id)
+            lo, hi = self._slice(sensor_id, index, _epoch(start), _epoch(end))
+            lo = max(lo, hi - limit)
+            rows = self._rows(index)
+            timestamps, values, quality = (
+                self._column(sensor_id, name, dtype, rows)[lo:hi][::-1].tolist() for name, dtype in self.COLUMNS
+            )
+        return [Reading(_datetime(ts), value, q) for ts, value, q in zip(timestamps, values, quality)]
+
+    def latest(self, sensor_ids):
+        latest = {}
+        for sensor_id in sensor_ids:
+            readings = self.tail(sensor_id, 1)
+            if readings:
+                latest[sensor_id] = readings[0]
+        return latest
+
+    def oldest(self, sensor_ids):
+        oldest = {}
+        for sensor_id in sensor_ids:
+            with self._lock(sensor_id):
+                index = self._index(sensor_id)
+            if len(index):
+                oldest[sensor_id] = _datetime(index[0, 0])
+        return oldest
+
+    def iter_rows(self, sensor_ids, start=None, end=None):
+        for sensor_id in sorted(sensor_ids):
+            # Only the slice bounds are found under the lock; rows are then
+            # copied out of the memory maps one chunk at a time.
+            with self._lock(sensor_id):
+                index = self._index(sensor_id)
+                lo, hi = self._slice(sensor_id, index, _epoch(start), _epoch(end))
+                rows = self._rows(index)
+                columns = [self._column(sensor_id, name, dtype, rows) for name, dtype in self.COLUMNS]
+            for offset in range(lo, hi, EXPORT_CHUNK_SIZE):
+                chunk = slice(offset, min(offset + EXPORT_CHUNK_SIZE, hi))
+                timestamps, values, quality = (column[chunk].tolist() for column in columns)
+                for ts, value, q in zip(timestamps, values, quality):
+                    yield sensor_id, _datetime(ts), value, q
+
+
+_storage = None
+
+
+def get_storage():
+    """The backend configured by ``settings.SENSOR_STORAGE``."""
+    global _storage
+    if _storage is None:
+        config = getattr(settings, 'SENSOR_STORAGE', DEFAULT_STORAGE)
+        _storage = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _storage
+
+
+@receiver(setting_changed)
+def reset_storage(sender, setting, **kwargs):
+    global _storage
+    if setting == 'SENSOR_STORAGE':
+        _storage = None
@@ -0,0 +1,117 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .metrics import record_cache
+from .models import Alert, Organization, Sensor
+
+SUMMARY_TIMEOUT = 300
+
+
+def summary_key(org_id):
+    return f'sensor:org-summary:{org_id}'
+
+
+def user_orgs_key(user_id):
+    return f'sensor:user-orgs:{user_id}'
+
+
+def compute_summary(org_id):
+    by_status = Sensor.objects.filter(organization_id=org_id)\
+        .values('status')\
+        .annotate(count=Count('id'))\
+        .order_by()
+    sensors_by_status = {row['status']: row['count'] for row in by_status}
+    return {
+        'total_sensors': sum(sensors_by_status.values()),
+        'sensors_by_status': sensors_by_status,
+        'active_alerts': Alert.objects.filter(
+            sensor__organization_id=org_id,
+            acknowledged=False
+        ).count(),
+    }
+
+
+def get_user_organizations(user):
+    """Return ``[{'id', 'name', 'description'}, ...]`` for the user's orgs."""
+    key = user_orgs_key(user.pk)
+    organizations = cache.get(key)
+    record_cache(int(organizations is not None), int(organizations is None))
+    if organizations is None:
+        organizations = list(user.organizations.order_by('id').values('id', 'name', 'description'))
+        cache.set(key, organizations, SUMMARY_TIMEOUT)
+    return organizations
+
+
+def get_summaries(org_ids):
+    """Return ``{org_id: summary}``, computing and caching any misses."""
+    keys = {summary_key(org_id): org_id for org_id in org_ids}
+    cached = cache.get_many(keys)
+    record_cache(len(cached), len(keys) - len(cached))
+    summaries = {keys[key]: summary for key, summary in cached.items()}
+
+    missing = {key: compute_summary(org_id) for key, org_id in keys.items() if key not in cached}
+    if missing:
+        cache.set_many(missing, SUMMARY_TIMEOUT)
+        summaries.update({keys[key]: summary for key, summary in missing.items()})
+    return summaries
+
+
+def combine_summaries(summaries):
+    total = {'total_sensors': 0, 'sensors_by_status': {}, 'active_alerts': 0}
+    for summary in summaries:
+        total['total_sensors'] += summary['total_sensors']
+        total['active_alerts'] += summary['active_alerts']
+        for status, count in summary['sensors_by_status'].items():
+            total['sensors_by_status'][status] = total['sensors_by_status'].get(status, 0) + count
+    return total
+
+
+def delete_on_commit(keys):
+    """Drop cache keys once the current transaction commits.
+
+    Deleting earlier would let a concurrent request re-cache the values it
+    still reads from before the commit.
+    """
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_summaries(org_ids):
+    delete_on_commit([summary_key(org_id) for org_id in org_ids if org_id is not None])
+
+
+@receiver([post_save, post_delete], sender=Sensor)
+def sensor_changed(sender, instance, **kwargs):
+    invalidate_summaries([instance.organization_id])
+
+
+@receiver([post_save, post_delete], sender=Alert)
+def alert_changed(sender, instance, **kwargs):
+    invalidate_summaries(
+        Sensor.objects.filter(id=instance.sensor_id).values_list('organization_id', flat=True)
+    )
+
+
+def invalidate_user_organizations(user_ids):
+    delete_on_commit([user_orgs_key(user_id) for user_id in user_ids])
+
+
+@receiver([post_save, pre_delete], sender=Organization)
+def organization_changed(sender, instance, **kwargs):
+    invalidate_user_organizations(instance.users.values_list('id', flat=True))
+    invalidate_summaries([instance.pk])
+
+
+@receiver(m2m_changed, sender=Organization.users.through)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # ``instance`` is a User whose organizations changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_user_organizations([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_organizations(pk_set)
+    elif action == 'pre_clear':
+        # post_clear no longer knows which users were removed
+        invalidate_user_organizations(instance.users.values_list('id', flat=True))
@@ -1,3 +1,933 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .alerting import evaluate_thresholds
+from .anomaly import EWMA_ALPHA, combine_stats, group_stats
+from .compare import MAX_BUCKET_SECONDS, bucket_edges, compare_series, parse_bucket
+from .downsampling import envelope, lttb
+from .ingest import IngestError, IngestQueue, ReadingBatch, build_batch, parse_payload, store_readings
+from .latest import get_latest, latest_cache, latest_key, update_latest
+from .live import broker, event_stream
+from .management.commands.create_sample_data import Command as SampleDataCommand
+from .metrics import PROMETHEUS_CONTENT_TYPE, Registry, RequestRecorder, record_query
+from .models import (
+    Alert, Organization, Sensor, SensorBaseline, SensorCoverage, SensorData, SensorDataDaily, SensorDataHourly
+)
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .retention import archive_readings, prune_readings, retention_cutoff
+from .rollups import DAY, ROLLUP_FIELDS, rebuild_rollups
+from .storage import ColumnarStorage, ORMStorage, get_storage
+from .summary import get_summaries, get_user_organizations, summary_key
+from .uptime import coverage_percentage, merge_spans, reading_runs, rebuild_coverage
+
+
+def create_sensor(organization, **kwargs):
+    return Sensor.objects.create(
+        name=kwargs.pop('name', 'Sensor'),
+        description='',
+        organization=organization,
+        **kwargs
+    )
+
+
+def ingest(sensor, timestamps, values, quality=100):
+    """Store readings for ``sensor`` through the ingest pipeline."""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return store_readings(ReadingBatch(
+        np.full(len(timestamps), sensor.id),
+        timestamps,
+        values,
+        np.full(len(timestamps), quality),
+        sensors={sensor.id: sensor},
+    ))
+
+
+class SensorTestCase(TestCase):
+    """An organization with one sensor and a user that belongs to it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme')
+        cls.user = User.objects.create_user('alice', password='password')
+        cls.organization.users.add(cls.user)
+        cls.sensor = create_sensor(cls.organization, reading_interval=60)
+
+    def setUp(self):
+        for alias in caches:
+            caches[alias].clear()
+        self.client.force_login(self.user)
+
+
+class IngestTests(SensorTestCase):
+    def build(self, records):
+        return build_batch(records, Sensor.objects.all())
+
+    def test_parse_payload(self):
+        self.assertEqual(parse_payload(b'[{"sensor": 1}]'), [{'sensor': 1}])
+        self.assertEqual(parse_payload(b'{"readings": [{"sensor": 1}]}'), [{'sensor': 1}])
+        self.assertEqual(
+            parse_payload(b'{"sensor": 1}\n\n{"sensor": 2}\n', 'application/x-ndjson'),
+            [{'sensor': 1}, {'sensor': 2}]
+        )
+        for body in (b'not json', b'{"sensor": 1}', b'\xff'):
+            with self.assertRaises(IngestError):
+                parse_payload(body)
+
+    def test_build_batch(self):
+        batch = self.build([
+            {'sensor': self.sensor.id, 'value': 21.5, 'timestamp': '2024-01-01T00:00:00Z'},
+            {'sensor': self.sensor.id, 'value': 22, 'timestamp': 1704067260, 'quality': 90},
+        ])
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.timestamps.tolist(), [1704067200.0, 1704067260.0])
+        self.assertEqual(batch.quality.tolist(), [100, 90])
+        self.assertEqual(list(batch.sensors), [self.sensor.id])
+
+    def test_build_batch_rejects_invalid_readings(self):
+        other = create_sensor(Organization.objects.create(name='Other'))
+        for records in (
+            [],
+            [{'value': 1}],
+            [{'sensor': self.sensor.id, 'value': 'warm'}],
+            [{'sensor': self.sensor.id, 'value': float('nan')}],
+            [{'sensor': self.sensor.id, 'value': 1, 'quality': 101}],
+            [{'sensor': self.sensor.id, 'value': 1, 'timestamp': 'yesterday'}],
+            [{'sensor': other.id, 'value': 1}],
+        ):
+            with self.subTest(records=records), self.assertRaises(IngestError):
+                build_batch(records, Sensor.objects.filter(organization=self.organization))
+
+    def test_build_batch_rejects_out_of_range_timestamps(self):
+        now = timezone.now().timestamp()
+        for timestamp in (now * 1000, now + 7 * 86400, -1, float('inf'), '9999-01-01T00:00:00Z'):
+            with self.subTest(timestamp=timestamp), self.assertRaises(IngestError):
+                self.build([{'sensor': self.sensor.id, 'value': 1, 'timestamp': timestamp}])
+
+    def test_ingest_endpoint(self):
+        response = self.client.post(
+            reverse('sensor:ingest_readings'),
+            json.dumps([{'sensor': self.sensor.id, 'value': 20.0, 'timestamp': '2024-01-01T00:00:00Z'}]),
+            content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'status': 'success', 'created': 1})
+        reading = SensorData.objects.get(sensor=self.sensor)
+        self.assertEqual(reading.timestamp, datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+
+    def test_ingest_endpoint_rejects_millisecond_timestamps(self):
+        response = self.client.post(
+            reverse('sensor:ingest_readings'),
+            json.dumps([{'sensor': self.sensor.id, 'value': 20.0, 'timestamp': 1.7e12}]),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SensorData.objects.exists())
+
+    def test_ingest_endpoint_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('sensor:ingest_readings'),
+            json.dumps([{'sensor': self.sensor.id, 'value': 20.0}]),
+            content_type='text/plain'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(SensorData.objects.exists())
+
+
+class RetentionTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_retention_cutoff(self):
+        now = datetime(2024, 3, 10, 15, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(retention_cutoff(30, now), datetime(2024, 2, 9, tzinfo=dt_timezone.utc))
+
+    def test_prune_readings_keeps_rollups(self):
+        cutoff = retention_cutoff(30)
+        old = (cutoff - timedelta(days=3)).timestamp() + 60 * np.arange(10)
+        recent = (cutoff + timedelta(days=1)).timestamp() + 60 * np.arange(5)
+        ingest(self.sensor, np.r_[old, recent], np.arange(15.0))
+
+        self.assertEqual(prune_readings(days=30, archive_dir=self.directory), 10)
+        self.assertEqual(SensorData.objects.count(), 5)
+        self.assertEqual(sum(SensorDataDaily.objects.values_list('count', flat=True)), 15)
+        archives = list(Path(self.directory, str(self.sensor.id)).iterdir())
+        self.assertEqual(len(archives), 1)
+        with np.load(archives[0]) as archive:
+            self.assertEqual(archive['value'].tolist(), list(np.arange(10.0)))
+
+    def test_rebuild_after_prune_keeps_pruned_history(self):
+        cutoff = retention_cutoff(30)
+        first = cutoff - timedelta(days=10)
+        self.sensor.reading_interval = 600
+        self.sensor.save()
+        ingest(self.sensor, first.timestamp() + 600 * np.arange(6 * 24 * 12), np.ones(6 * 24 * 12))
+        prune_readings(days=30)
+        daily, hourly = SensorDataDaily.objects.count(), SensorDataHourly.objects.count()
+        spans = list(SensorCoverage.objects.values_list('start', 'end'))
+        self.assertEqual(daily, 12)
+
+        call_command('rebuild_rollups', '--coverage', stdout=open(os.devnull, 'w'))
+        self.assertEqual(SensorDataDaily.objects.count(), daily)
+        self.assertEqual(SensorDataHourly.objects.count(), hourly)
+        self.assertEqual(SensorDataDaily.objects.order_by('period').first().period, first.date())
+        self.assertEqual(list(SensorCoverage.objects.values_list('start', 'end')), spans)
+        self.assertEqual(coverage_percentage(self.sensor, first, first + timedelta(days=12)), 100.0)
+
+    def test_archive_rerun_does_not_duplicate_rows(self):
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        end = datetime(2024, 2, 1, tzinfo=dt_timezone.utc)
+        ingest(self.sensor, start.timestamp() + 3600 * np.arange(4), [1.0, 2.0, 3.0, 4.0])
+
+        path = archive_readings(self.sensor.id, start, end, self.directory)
+        # A crash before the readings were deleted archives them again.
+        ingest(self.sensor, [start.timestamp() + 3600 * 10], [5.0])
+        self.assertEqual(archive_readings(self.sensor.id, start, end, self.directory), path)
+
+        with np.load(path) as archive:
+            self.assertEqual(archive['value'].tolist(), [1.0, 2.0, 3.0, 4.0, 5.0])
+            self.assertTrue((np.diff(archive['timestamp']) > 0).all())
+        self.assertEqual([p.name for p in path.parent.iterdir()], [path.name])
+
+
+class SummaryTests(SensorTestCase):
+    def test_summary_counts(self):
+        create_sensor(self.organization, status='maintenance')
+        Alert.objects.create(sensor=self.sensor, message='', value=1, severity='low')
+        self.assertEqual(get_summaries([self.organization.id]), {self.organization.id: {
+            'total_sensors': 2,
+            'sensors_by_status': {'active': 1, 'maintenance': 1},
+            'active_alerts': 1,
+        }})
+
+    def test_alerts_invalidate_summary_after_commit(self):
+        self.sensor.max_threshold = 30
+        self.sensor.save()
+        get_summaries([self.organization.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest(self.sensor, [timezone.now().timestamp()], [40.0])
+            # Invalidating before commit would let a concurrent request
+            # cache the old count again.
+            self.assertIsNotNone(cache.get(summary_key(self.organization.id)))
+        self.assertIsNone(cache.get(summary_key(self.organization.id)))
+        self.assertEqual(get_summaries([self.organization.id])[self.organization.id]['active_alerts'], 1)
+
+    def test_membership_changes_invalidate_user_organizations(self):
+        self.assertEqual(len(get_user_organizations(self.user)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Organization.objects.create(name='Second').users.add(self.user)
+        self.assertEqual(len(get_user_organizations(self.user)), 2)
+
+
+class ExportTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        self.second = create_sensor(self.organization)
+        self.theirs = create_sensor(Organization.objects.create(name='Other'))
+        for offset, sensor in enumerate((self.sensor, self.second, self.theirs)):
+            ingest(sensor, self.start.timestamp() + 60 * np.arange(3) + offset, [1.5, 2.5, 3.5], quality=90)
+
+    def export(self, **params):
+        response = self.client.get(reverse('sensor:export_readings'), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_covers_the_users_sensors_in_order(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="readings.csv"')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'sensor_id,timestamp,value,quality')
+        self.assertEqual(lines[1], f'{self.sensor.id},2024-01-01T00:00:00+00:00,1.5,90')
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], [self.sensor.id] * 3 + [self.second.id] * 3)
+
+    def test_ndjson_with_filters(self):
+        response, body = self.export(
+            format='ndjson', ids=f'{self.second.id},{self.theirs.id}',
+            start='2024-01-01T00:01:00Z', end='2024-01-01T00:02:00Z',
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{
+            'sensor': self.second.id, 'timestamp': '2024-01-01T00:01:01+00:00', 'value': 2.5, 'quality': 90,
+        }])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'format': 'xml'}, {'ids': 'a,b'}, {'start': 'yesterday'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('sensor:export_readings'), params)
+                self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('sensor:export_readings')).status_code, 302)
+
+
+class AcknowledgeAlertsTests(SensorTestCase):
+    def alert(self, sensor=None, severity='low', days_ago=0):
+        alert = Alert.objects.create(sensor=sensor or self.sensor, message='', value=1, severity=severity)
+        Alert.objects.filter(id=alert.id).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        return alert
+
+    def acknowledge(self, criteria):
+        return self.client.post(
+            reverse('sensor:acknowledge_alerts'), json.dumps(criteria), content_type='application/json'
+        )
+
+    def open_ids(self):
+        return set(Alert.objects.filter(acknowledged=False).values_list('id', flat=True))
+
+    def test_ids_are_limited_to_the_users_organizations(self):
+        other = create_sensor(Organization.objects.create(name='Other'))
+        mine, theirs = self.alert(), self.alert(other)
+        response = self.acknowledge({'ids': [mine.id, theirs.id]})
+        self.assertEqual(response.json(), {'status': 'success', 'acknowledged': 1})
+        self.assertEqual(self.open_ids(), {theirs.id})
+        mine.refresh_from_db()
+        self.assertEqual(mine.acknowledged_by, self.user)
+        self.assertIsNotNone(mine.acknowledged_at)
+
+    def test_filters(self):
+        second = create_sensor(self.organization)
+        other = create_sensor(Organization.objects.create(name='Other'))
+        old = self.alert(days_ago=10)
+        recent_high = self.alert(severity='high', days_ago=1)
+        second_sensor = self.alert(second, severity='high')
+        theirs = self.alert(other, severity='high')
+
+        self.assertEqual(self.acknowledge({'severity': 'high', 'sensor': self.sensor.id}).json()['acknowledged'], 1)
+        self.assertEqual(self.open_ids(), {old.id, second_sensor.id, theirs.id})
+        end = (timezone.now() - timedelta(days=5)).isoformat()
+        self.assertEqual(self.acknowledge({'end': end}).json()['acknowledged'], 1)
+        self.assertEqual(self.open_ids(), {second_sensor.id, theirs.id})
+        start = (timezone.now() - timedelta(hours=1)).isoformat()
+        self.assertEqual(self.acknowledge({'start': start, 'severity': 'high'}).json()['acknowledged'], 1)
+        self.assertEqual(self.open_ids(), {theirs.id})
+        recent_high.refresh_from_db()
+        self.assertTrue(recent_high.acknowledged)
+
+    def test_acknowledge_invalidates_summary(self):
+        self.alert()
+        self.assertEqual(get_summaries([self.organization.id])[self.organization.id]['active_alerts'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acknowledge({'sensor': self.sensor.id})
+        self.assertEqual(get_summaries([self.organization.id])[self.organization.id]['active_alerts'], 0)
+
+    def test_bad_input_is_rejected(self):
+        alert = self.alert()
+        for criteria in (
+            {}, [alert.id], {'ids': 5}, {'ids': str(alert.id)}, {'ids': [True]}, {'ids': [str(alert.id)]},
+            {'sensor': 'abc'}, {'sensor': True}, {'severity': 'urgent'}, {'severity': ['high']},
+            {'start': 'yesterday'}, {'end': 5},
+        ):
+            with self.subTest(criteria=criteria):
+                self.assertEqual(self.acknowledge(criteria).status_code, 400)
+        response = self.client.post(reverse('sensor:acknowledge_alerts'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('sensor:acknowledge_alerts')).status_code, 400)
+        self.assertEqual(self.open_ids(), {alert.id})
+
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class PaginationTests(SensorTestCase):
+    def test_keyset_pages_cover_every_row_once(self):
+        alerts = Alert.objects.bulk_create(
+            Alert(sensor=self.sensor, message=str(i), value=i, severity='low') for i in range(7)
+        )
+        # Ties on timestamp are broken by id.
+        Alert.objects.filter(id__in=[alert.id for alert in alerts[:4]]).update(timestamp=timezone.now())
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Alert.objects.all(), ['-timestamp', '-id'], cursor, 3)
+            seen.extend(alert.id for alert in page)
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(alert.id for alert in alerts))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_cursor_round_trip(self):
+        timestamp = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor([timestamp, 5]), 2), [timestamp.isoformat(), 5])
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('!!!', raw_cursor({'id': 1}), raw_cursor([[1], 2]), raw_cursor([1]),
+                       raw_cursor([None, 1]), raw_cursor(['soon', 1]), raw_cursor([1e400, 1])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('sensor:alerts_api'), {'after': cursor})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('sensor:sensor_list_api'), {'after': raw_cursor([[1]])})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sensor_list_api(self):
+        response = self.client.get(reverse('sensor:org_sensor_list_api', args=[self.organization.id]))
+        self.assertEqual([sensor['id'] for sensor in response.json()['results']], [self.sensor.id])
+
+    def test_sensor_list_api_hides_other_organizations(self):
+        other = Organization.objects.create(name='Other')
+        create_sensor(other)
+        for name in ('sensor:org_sensor_list_api', 'sensor:org_sensor_list'):
+            response = self.client.get(reverse(name, args=[other.id]))
+            self.assertEqual(response.status_code, 404)
+
+
+class UptimeTests(SensorTestCase):
+    def test_reading_runs(self):
+        starts, ends = reading_runs(np.array([0.0, 60, 120, 1000, 1060]), 60)
+        self.assertEqual(starts.tolist(), [0.0, 1000.0])
+        self.assertEqual(ends.tolist(), [180.0, 1120.0])
+
+    def test_merge_spans(self):
+        self.assertEqual(merge_spans([(500, 600), (0, 100), (150, 200)], 60), [[0, 200], [500, 600]])
+
+    def test_coverage_follows_ingested_batches(self):
+        start = timezone.now() - timedelta(hours=2)
+        # An hour of readings over two batches whose spans have to merge,
+        # then a repeat of the last ten minutes.
+        timestamps = start.timestamp() + 60 * np.arange(60)
+        ingest(self.sensor, timestamps[:30], np.zeros(30))
+        ingest(self.sensor, timestamps[30:], np.zeros(30))
+        ingest(self.sensor, timestamps[-10:], np.zeros(10))
+        self.assertEqual(SensorCoverage.objects.filter(sensor=self.sensor).count(), 1)
+        self.assertAlmostEqual(
+            coverage_percentage(self.sensor, start, start + timedelta(hours=2)), 50.0
+        )
+
+
+class CoverageRebuildTests(TransactionTestCase):
+    def test_rebuild_coverage_outside_a_transaction(self):
+        sensor = create_sensor(Organization.objects.create(name='Acme'), reading_interval=60)
+        start = timezone.now().timestamp() - 7200
+        ingest(sensor, start + 60 * np.r_[np.arange(10), np.arange(50, 60)], np.zeros(20))
+        SensorCoverage.objects.all().delete()
+
+        # SQLite ignores select_for_update(); pretend otherwise so locking
+        # outside a transaction fails here as it does on PostgreSQL.
+        with mock.patch.object(connection.features, 'has_select_for_update', True), \
+                mock.patch.object(connection.ops, 'for_update_sql', return_value=''):
+            rebuild_coverage()
+        self.assertEqual(SensorCoverage.objects.filter(sensor=sensor).count(), 2)
+
+
+class LiveTests(SimpleTestCase):
+    async def test_event_stream_delivers_published_messages(self):
+        subscription = broker.subscribe([-1])
+        broker.publish(-1, 'event: readings\ndata: []\n\n')
+        stream = event_stream(subscription, max_seconds=1)
+        self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+        self.assertEqual(await anext(stream), 'event: readings\ndata: []\n\n')
+        await stream.aclose()
+        self.assertFalse(broker.has_subscribers(-1))
+
+    async def test_event_stream_ends_after_max_seconds(self):
+        # Django 4.2 never cancels the stream of a closed tab; it has to end
+        # by itself for the subscription to be released.
+        subscription = broker.subscribe([-1])
+        with mock.patch('sensor.live.HEARTBEAT_SECONDS', 0.01):
+            messages = [message async for message in event_stream(subscription, max_seconds=0.05)]
+        self.assertEqual(messages[0], 'retry: 5000\n\n')
+        self.assertIn(': keepalive\n\n', messages)
+        self.assertFalse(broker.has_subscribers(-1))
+
+
+class ThresholdAlertTests(SensorTestCase):
+    def test_one_alert_per_sensor_for_the_worst_reading(self):
+        self.sensor.min_threshold, self.sensor.max_threshold = 10, 30
+        self.sensor.save()
+        quiet = create_sensor(self.organization)
+        batch = ReadingBatch(
+            [self.sensor.id] * 4 + [quiet.id],
+            [0, 1, 2, 3, 4],
+            [20.0, 31.0, 45.0, 5.0, 1000.0],
+            [100] * 5,
+            sensors={self.sensor.id: self.sensor, quiet.id: quiet},
+        )
+        alerts = evaluate_thresholds(batch)
+        self.assertEqual(len(alerts), 1)
+        alert = alerts[0]
+        self.assertEqual(alert.sensor_id, self.sensor.id)
+        self.assertEqual(alert.value, 45.0)
+        # 15 over a band of 20 is a 0.75 excursion.
+        self.assertEqual(alert.severity, 'critical')
+        self.assertIn('above maximum 30', alert.message)
+        self.assertIn('(3 readings out of range)', alert.message)
+
+    def test_severity_steps_with_the_excursion(self):
+        self.sensor.min_threshold, self.sensor.max_threshold = 0, 100
+        self.sensor.save()
+        severities = []
+        for value in (105, 115, 140, 160, -5):
+            batch = ReadingBatch([self.sensor.id], [0], [value], [100], sensors={self.sensor.id: self.sensor})
+            severities.append(evaluate_thresholds(batch)[0].severity)
+        self.assertEqual(severities, ['low', 'medium', 'high', 'critical', 'low'])
+
+
+class RollupTests(SensorTestCase):
+    def test_incremental_rollups_match_rebuild(self):
+        rng = np.random.default_rng(0)
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+        timestamps = start + rng.uniform(0, 2 * 86400, 600)
+        values = rng.normal(20, 5, 600)
+        # Out-of-order batches that share hourly and daily buckets.
+        for chunk in np.array_split(rng.permutation(600), 4):
+            ingest(self.sensor, timestamps[chunk], values[chunk])
+
+        def rollups(model):
+            return list(model.objects.order_by('period').values_list('period', *ROLLUP_FIELDS))
+
+        incremental = {model: rollups(model) for model in (SensorDataHourly, SensorDataDaily)}
+        self.assertEqual(sum(row[1] for row in incremental[SensorDataDaily]), 600)
+        self.assertAlmostEqual(max(row[5] for row in incremental[SensorDataHourly]), values.max())
+        rebuild_rollups(sensor_ids=[self.sensor.id])
+        for model, rows in incremental.items():
+            rebuilt = rollups(model)
+            self.assertEqual([row[:2] for row in rows], [row[:2] for row in rebuilt])
+            np.testing.assert_allclose([row[2:] for row in rows], [row[2:] for row in rebuilt])
+
+
+class BaselineTests(SensorTestCase):
+    def sample_temperatures(self, timestamps):
+        generator = SampleDataCommand()
+        generator.rng = np.random.default_rng(1)
+        return generator.generate_temperature_data(timestamps)
+
+    def test_combine_stats_matches_a_single_pass(self):
+        rng = np.random.default_rng(0)
+        values = rng.normal(5, 2, 100)
+        groups = rng.integers(0, 3, 100)
+        first, second = np.arange(100) < 40, np.arange(100) >= 40
+        n, mean, m2 = combine_stats(
+            *group_stats(groups[first], values[first], 3),
+            *group_stats(groups[second], values[second], 3)
+        )
+        for group in range(3):
+            expected = values[groups == group]
+            self.assertEqual(n[group], len(expected))
+            self.assertAlmostEqual(mean[group], expected.mean())
+            self.assertAlmostEqual(m2[group] / (n[group] - 1), expected.var(ddof=1))
+
+    def test_baseline_statistics_follow_the_stream(self):
+        timestamps = timezone.now().timestamp() - 3 * 86400 + 300 * np.arange(864)
+        values = np.random.default_rng(0).normal(20, 1, len(timestamps))
+        for offset in range(0, len(values), 100):
+            ingest(self.sensor, timestamps[offset:offset + 100], values[offset:offset + 100])
+
+        self.assertFalse(Alert.objects.exists())
+        baseline = SensorBaseline.objects.get(sensor=self.sensor)
+        self.assertEqual(baseline.count, len(values))
+        self.assertAlmostEqual(baseline.mean, values.mean())
+        self.assertAlmostEqual(baseline.m2 / (baseline.count - 1), values.var(ddof=1))
+        ewma, ewma_sq = values[0], values[0] ** 2
+        for value in values:
+            ewma += EWMA_ALPHA * (value - ewma)
+            ewma_sq += EWMA_ALPHA * (value * value - ewma_sq)
+        self.assertAlmostEqual(baseline.ewma, ewma)
+        self.assertAlmostEqual(baseline.ewma_sq, ewma_sq)
+        hourly = np.frombuffer(bytes(baseline.hourly)).reshape(3, 24)
+        hours = (timestamps // 3600 % 24).astype(np.int64)
+        self.assertEqual(hourly[0].tolist(), np.bincount(hours, minlength=24).tolist())
+        np.testing.assert_allclose(hourly[1], np.bincount(hours, values, 24) / hourly[0])
+
+    def test_learned_daily_cycle_flags_only_outliers(self):
+        timestamps = timezone.now().timestamp() - 3 * 86400 + 300 * np.arange(864)
+        values = self.sample_temperatures(timestamps)
+        # The first day warms the hour-of-day baselines up.
+        for offset in range(0, len(values), 96):
+            ingest(self.sensor, timestamps[offset:offset + 96], values[offset:offset + 96])
+            if offset == 288 - 96:
+                Alert.objects.all().delete()
+        self.assertFalse(Alert.objects.exists())
+        count = SensorBaseline.objects.get(sensor=self.sensor).count
+
+        ingest(self.sensor, [timestamps[-1] + 300], [40.0])
+        alert = Alert.objects.get()
+        self.assertEqual(alert.value, 40.0)
+        self.assertIn('standard deviations from its usual level', alert.message)
+        # The outlier stays out of the Welford statistics.
+        self.assertEqual(SensorBaseline.objects.get(sensor=self.sensor).count, count)
+
+
+class DownsamplingTests(SimpleTestCase):
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.sin(x / 50)
+        y[500] = 10.0
+        selected = lttb(x, y, 50)
+        self.assertEqual(len(selected), 50)
+        self.assertEqual((selected[0], selected[-1]), (0, 999))
+        self.assertTrue((np.diff(selected) > 0).all())
+        self.assertIn(500, selected)
+
+    def test_lttb_returns_everything_below_the_threshold(self):
+        x = np.arange(10, dtype=np.float64)
+        self.assertEqual(lttb(x, x, 20).tolist(), list(range(10)))
+        self.assertEqual(lttb(x, x, 2).tolist(), list(range(10)))
+
+    def test_envelope(self):
+        x = np.arange(6, dtype=np.float64)
+        starts, lows, highs = envelope(x, np.array([3.0, 1, 4, 1, 5, 9]), 3)
+        self.assertEqual(starts.tolist(), [0, 2, 4])
+        self.assertEqual(lows.tolist(), [1, 1, 5])
+        self.assertEqual(highs.tolist(), [3, 4, 9])
+
+
+class LatestReadingTests(SensorTestCase):
+    def test_latest_readings_endpoint(self):
+        ingest(self.sensor, [1704067200.0, 1704067260.0], [1.0, 2.0])
+        hidden = create_sensor(Organization.objects.create(name='Other'))
+        response = self.client.get(reverse('sensor:latest_readings'), {'ids': f'{self.sensor.id},{hidden.id}'})
+        self.assertEqual(response.json(), {str(self.sensor.id): {
+            'value': 2.0, 'timestamp': '2024-01-01T00:01:00Z', 'quality': 100
+        }})
+
+    def test_older_readings_do_not_replace_newer_ones(self):
+        sensors = {self.sensor.id: self.sensor}
+        update_latest(ReadingBatch([self.sensor.id], [200.0], [2.0], [100], sensors=sensors))
+        update_latest(ReadingBatch([self.sensor.id], [100.0], [1.0], [100], sensors=sensors))
+        self.assertEqual(get_latest([self.sensor.id])[self.sensor.id]['value'], 2.0)
+
+    def test_thousands_of_sensors_stay_cached(self):
+        sensors = Sensor.objects.bulk_create(
+            Sensor(name=str(i), description='', organization=self.organization) for i in range(2000)
+        )
+        get_summaries([self.organization.id])
+        self.assertEqual(len(get_latest([sensor.id for sensor in sensors])), 2000)
+
+        keys = [latest_key(sensor.id) for sensor in sensors]
+        self.assertEqual(len(latest_cache().get_many(keys)), 2000)
+        self.assertIsNotNone(cache.get(summary_key(self.organization.id)))
+        with self.assertNumQueries(0):
+            get_latest([sensor.id for sensor in sensors])
+
+    def test_unreachable_cache_falls_back_to_storage(self):
+        ingest(self.sensor, [1704067200.0], [5.0])
+        with mock.patch.object(latest_cache(), 'get_many', side_effect=ConnectionError):
+            self.assertEqual(get_latest([self.sensor.id])[self.sensor.id]['value'], 5.0)
+
+
+class IngestQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name='Acme')
+        self.user = User.objects.create_user('alice')
+        self.organization.users.add(self.user)
+        self.sensor = create_sensor(self.organization)
+        self.client.force_login(self.user)
+
+    def batch(self, value):
+        return ReadingBatch([self.sensor.id], [1704067200.0 + value], [value], [100], sensors={self.sensor.id: self.sensor})
+
+    def test_idle_writer_exits_and_restarts(self):
+        writer = IngestQueue()
+        with mock.patch('sensor.ingest.WRITER_IDLE_SECONDS', 0.05):
+            self.assertEqual(writer.submit(self.batch(1)).result(timeout=5), 1)
+            thread = writer._thread
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(writer.submit(self.batch(2)).result(timeout=5), 1)
+        self.assertEqual(SensorData.objects.count(), 2)
+
+    @override_settings(SENSOR_INGEST_QUEUE=True, SENSOR_INGEST_TIMEOUT=0.05)
+    def test_ingest_endpoint_times_out_on_a_stuck_writer(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('sensor.ingest.store_readings', side_effect=lambda batch: release.wait(5)):
+            response = self.client.post(
+                reverse('sensor:ingest_readings'),
+                json.dumps([{'sensor': self.sensor.id, 'value': 20.0}]),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+class StorageTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        columnar = override_settings(SENSOR_STORAGE={
+            'BACKEND': 'sensor.storage.ColumnarStorage',
+            'OPTIONS': {'directory': directory},
+        })
+        columnar.enable()
+        self.addCleanup(columnar.disable)
+
+    def ingest(self, timestamps, values):
+        # Column files are written once the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest(self.sensor, timestamps, values)
+
+    def test_backends_agree(self):
+        self.assertIsInstance(get_storage(), ColumnarStorage)
+        rng = np.random.default_rng(0)
+        timestamps = 1704067200.0 + rng.permutation(10000) * 60.0
+        values = rng.normal(20, 5, 10000)
+        orm = ORMStorage()
+        # Out-of-order batches exercise the late-reading merge.
+        for chunk in np.array_split(np.arange(10000), 5):
+            self.ingest(timestamps[chunk], values[chunk])
+            orm.append(ReadingBatch(
+                np.full(len(chunk), self.sensor.id), timestamps[chunk], values[chunk], np.full(len(chunk), 100)
+            ))
+
+        start = datetime(2024, 1, 2, tzinfo=dt_timezone.utc)
+        end = datetime(2024, 1, 3, 6, tzinfo=dt_timezone.utc)
+        for expected, actual in zip(orm.read_range(self.sensor.id, start, end),
+                                    get_storage().read_range(self.sensor.id, start, end)):
+            np.testing.assert_array_equal(expected, actual)
+        self.assertEqual(orm.tail(self.sensor.id, 5, start, end), get_storage().tail(self.sensor.id, 5, start, end))
+        self.assertEqual(orm.latest([self.sensor.id]), get_storage().latest([self.sensor.id]))
+        self.assertEqual(orm.oldest([self.sensor.id]), get_storage().oldest([self.sensor.id]))
+
+        # Exports stream chunks from the column files instead of a full copy.
+        with mock.patch('sensor.storage.EXPORT_CHUNK_SIZE', 1000), \
+                mock.patch.object(ColumnarStorage, 'read_range', side_effect=AssertionError):
+            self.assertEqual(
+                list(orm.iter_rows([self.sensor.id], start, end)),
+                list(get_storage().iter_rows([self.sensor.id], start, end)),
+            )
+
+    def test_rebuild_reads_the_configured_backend(self):
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+        self.ingest(start + 60 * np.r_[np.arange(100), np.arange(1000, 1100)], np.arange(200.0))
+        # Columnar readings never reach the SensorData table.
+        SensorData.objects.all().delete()
+        expected = list(SensorDataHourly.objects.order_by('period').values_list('period', *ROLLUP_FIELDS))
+
+        call_command('rebuild_rollups', '--coverage', stdout=open(os.devnull, 'w'))
+        self.assertEqual(
+            list(SensorDataHourly.objects.order_by('period').values_list('period', *ROLLUP_FIELDS)), expected
+        )
+        self.assertEqual(sum(SensorDataDaily.objects.values_list('count', flat=True)), 200)
+        self.assertEqual(SensorCoverage.objects.filter(sensor=self.sensor).count(), 2)
+
+    def test_prune_refuses_other_backends(self):
+        with self.assertRaises(CommandError):
+            call_command('prune_readings', days=0)
+
+
+class PortabilityTests(SimpleTestCase):
+    def test_app_loads_without_fcntl(self):
+        code = (
+            "import sys; sys.modules['fcntl'] = None\n"
+            "import django; django.setup()\n"
+            "import sensor.ingest, sensor.views"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class CompareTests(SensorTestCase):
+    def get(self, **params):
+        return self.client.get(reverse('sensor:compare_sensors'), {'ids': str(self.sensor.id), **params})
+
+    def test_parse_bucket(self):
+        self.assertEqual(parse_bucket('15m'), 900)
+        self.assertEqual(parse_bucket('1d'), 86400)
+        self.assertEqual(parse_bucket('366d'), MAX_BUCKET_SECONDS)
+        for raw in ('0', '15x', '', '367d', '100000000d'):
+            with self.assertRaises(ValueError):
+                parse_bucket(raw)
+
+    def test_bucket_edges_are_aligned(self):
+        start = datetime(2024, 1, 1, 0, 10, tzinfo=dt_timezone.utc)
+        edges = bucket_edges(start, start + timedelta(hours=1), 900)
+        self.assertEqual((edges - start.timestamp() + 600).tolist(), [0, 900, 1800, 2700, 3600])
+
+    def test_bucket_edges_rejects_unrepresentable_ranges(self):
+        with self.assertRaises(ValueError):
+            bucket_edges(
+                datetime(2000, 1, 1, tzinfo=dt_timezone.utc), datetime(2020, 1, 1, tzinfo=dt_timezone.utc), DAY
+            )
+        with self.assertRaises(ValueError):
+            bucket_edges(
+                datetime(9999, 6, 1, tzinfo=dt_timezone.utc), datetime(9999, 12, 31, tzinfo=dt_timezone.utc),
+                MAX_BUCKET_SECONDS
+            )
+
+    def test_series_from_raw_readings(self):
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        ingest(self.sensor, start.timestamp() + np.array([0, 60, 900]), [1.0, 3.0, 5.0])
+        edges = bucket_edges(start, start + timedelta(minutes=30), 900)
+        counts, averages, lows, highs = compare_series([self.sensor.id], edges, 900)
+        self.assertEqual(counts.tolist(), [[2, 1]])
+        self.assertEqual(averages.tolist(), [[2.0, 5.0]])
+        self.assertEqual(lows.tolist(), [[1.0, 5.0]])
+        self.assertEqual(highs.tolist(), [[3.0, 5.0]])
+
+    def test_raw_series_are_grouped_in_the_database(self):
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        rng = np.random.default_rng(0)
+        timestamps = start.timestamp() + np.sort(rng.choice(3 * 86400, 2000, replace=False)) + 0.25
+        values = rng.normal(20, 5, 2000)
+        ingest(self.sensor, timestamps, values)
+        edges = bucket_edges(start, start + timedelta(days=3), 5400)
+        cells = ((timestamps - edges[0]) // 5400).astype(np.int64)
+        with CaptureQueriesContext(connection) as queries:
+            counts, averages, lows, highs = compare_series([self.sensor.id], edges, 5400)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('GROUP BY', queries[0]['sql'])
+        self.assertEqual(counts[0].tolist(), np.bincount(cells, minlength=len(edges)).tolist())
+        np.testing.assert_allclose(averages[0], np.bincount(cells, values, len(edges)) / counts[0])
+        self.assertEqual(lows[0, 0], values[cells == 0].min())
+        self.assertEqual(highs[0, -1], values[cells == len(edges) - 1].max())
+
+        # The columnar backend reduces each sensor's readings the same way.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(SENSOR_STORAGE={
+            'BACKEND': 'sensor.storage.ColumnarStorage', 'OPTIONS': {'directory': directory},
+        }):
+            with self.captureOnCommitCallbacks(execute=True):
+                get_storage().append(ReadingBatch(
+                    np.full(len(timestamps), self.sensor.id), timestamps, values, np.full(len(timestamps), 100)
+                ))
+            columnar = compare_series([self.sensor.id], edges, 5400)
+        for expected, actual in zip((counts, averages, lows, highs), columnar):
+            np.testing.assert_allclose(expected, actual)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in (
+            {'bucket': '100000000d'},
+            {'bucket': '1d', 'start': '2000-01-01T00:00:00Z', 'end': '2030-01-01T00:00:00Z'},
+            {'bucket': '366d', 'start': '9999-06-01T00:00:00Z', 'end': '9999-12-31T00:00:00Z'},
+            {'start': '2024-01-02T00:00:00Z', 'end': '2024-01-01T00:00:00Z'},
+            {'end': '0001-01-01T00:00:00Z'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+        self.assertEqual(self.get(bucket='1d', timeframe='7d').status_code, 200)
+
+
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        organization = Organization.objects.create(name='Acme')
+        user = User.objects.create_user('alice')
+        organization.users.add(user)
+        self.sensor = create_sensor(organization, reading_interval=60)
+        now = timezone.now().timestamp()
+        ingest(self.sensor, now - 60.0 * np.arange(100)[::-1], np.arange(100.0))
+        self.client.force_login(user)
+        self.async_client.force_login(user)
+
+    def async_get(self, url):
+        async def get():
+            return await self.async_client.get(url)
+        return async_to_sync(get)()
+
+    def test_async_views_match_the_sync_ones(self):
+        for name in ('sensor_data', 'sensor_analytics'):
+            with self.subTest(name=name):
+                expected = self.client.get(reverse(f'sensor:{name}', args=[self.sensor.id])).json()
+                actual = self.async_get(reverse(f'sensor:async_{name}', args=[self.sensor.id])).json()
+                # Uptime windows end at each request's own now().
+                if name == 'sensor_analytics':
+                    self.assertAlmostEqual(actual.pop('uptime_percentage'), expected.pop('uptime_percentage'), places=3)
+                self.assertEqual(actual, expected)
+        response = self.async_get(reverse('sensor:async_sensor_data', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_independent_queries_use_their_own_connections(self):
+        threads = set()
+
+        def record(sender, connection, **kwargs):
+            threads.add(threading.get_ident())
+
+        connection_created.connect(record)
+        self.addCleanup(connection_created.disconnect, record)
+        response = self.async_get(reverse('sensor:async_sensor_analytics', args=[self.sensor.id]))
+        self.assertEqual(response.status_code, 200)
+        # One connection per gathered query, each opened on a worker thread.
+        self.assertGreater(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+class MetricsTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = Registry()
+        for target in ('sensor.metrics.registry', 'sensor.views.registry'):
+            patcher = mock.patch(target, self.registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Connections opened before sampling was enabled have no recorder yet.
+        wrapper = connection.execute_wrapper(record_query)
+        wrapper.__enter__()
+        self.addCleanup(wrapper.__exit__, None, None, None)
+
+    def sample(self, name, *args):
+        with override_settings(SENSOR_METRICS_SAMPLE_RATE=1.0, SENSOR_SLOW_REQUEST_MS=None):
+            return self.client.get(reverse(f'sensor:{name}', args=args))
+
+    def metric(self, text, name, **labels):
+        prefix = f'{name}{{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '} '
+        return float(next(line for line in text.splitlines() if line.startswith(prefix))[len(prefix):])
+
+    def test_sampled_requests_are_recorded_per_view(self):
+        ingest(self.sensor, [timezone.now().timestamp()], [20.0])
+        response = self.sample('sensor_data', self.sensor.id)
+        self.sample('sensor_data', self.sensor.id)
+        self.sample('export_readings')
+
+        text = self.registry.render()
+        view = 'sensor:sensor_data'
+        self.assertEqual(self.metric(text, 'watchtower_requests_total', view=view, method='GET', status=200), 2)
+        self.assertEqual(self.metric(text, 'watchtower_request_duration_seconds_count', view=view), 2)
+        self.assertEqual(self.metric(text, 'watchtower_request_duration_seconds_bucket', view=view, le='+Inf'), 2)
+        self.assertGreater(self.metric(text, 'watchtower_db_queries_total', view=view), 0)
+        self.assertEqual(self.metric(text, 'watchtower_response_bytes_total', view=view), 2 * len(response.content))
+        # Streaming bodies are not counted.
+        self.assertEqual(self.metric(text, 'watchtower_response_bytes_total', view='sensor:export_readings'), 0)
+
+    def test_unsampled_requests_are_not_recorded(self):
+        with override_settings(SENSOR_METRICS_SAMPLE_RATE=0.0):
+            self.client.get(reverse('sensor:sensor_data', args=[self.sensor.id]))
+        self.assertNotIn('sensor:sensor_data', self.registry.render())
+
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with override_settings(SENSOR_METRICS_SAMPLE_RATE=1.0, SENSOR_SLOW_REQUEST_MS=0), \
+                self.assertLogs('sensor.metrics', 'WARNING') as logs:
+            self.client.get(reverse('sensor:sensor_data', args=[self.sensor.id]))
+        self.assertIn(f'Slow request: GET /sensor/{self.sensor.id}/data/ (sensor:sensor_data)', logs.output[0])
+        self.assertIn('queries in', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.sample('sensor_data', self.sensor.id)
+        response = self.client.get(reverse('sensor:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], PROMETHEUS_CONTENT_TYPE)
+        self.assertIn('# TYPE watchtower_requests_total counter', response.content.decode())
+        self.assertIn('view="sensor:sensor_data"', response.content.decode())
+        self.assertEqual(self.client.get(reverse('sensor:metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    def test_label_values_are_escaped(self):
+        self.registry.observe('a"b\\c\nd', 'GET', 200, 0.01, RequestRecorder(), 0)
+        self.assertIn('view="a\\"b\\\\c\\nd"', self.registry.render())
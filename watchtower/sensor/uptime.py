@@ -0,0 +1,151 @@
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.dispatch import receiver
+
+from .ingest import ReadingBatch
+from .models import Sensor, SensorCoverage, SensorData
+from .signals import readings_ingested
+from .storage import ORMStorage, get_storage
+
+# A sensor is considered down once no reading arrives within this many
+# reading intervals of the previous one.
+GAP_FACTOR = 3
+REBUILD_CHUNK_SIZE = 50000
+
+
+def _to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def reading_runs(timestamps, interval):
+    """Split sorted epoch timestamps into ``(starts, ends)`` of contiguous runs.
+
+    Each reading is credited with one ``interval`` of coverage, so a run
+    ends one interval after its last reading.
+    """
+    breaks = np.flatnonzero(np.diff(timestamps) > GAP_FACTOR * interval)
+    starts = timestamps[np.r_[0, breaks + 1]]
+    ends = timestamps[np.r_[breaks, len(timestamps) - 1]] + interval
+    return starts, ends
+
+
+def merge_spans(spans, slack):
+    """Merge ``(start, end)`` epoch pairs whose gaps are at most ``slack``."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + slack:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def update_coverage(batch):
+    """Fold a batch of readings into each sensor's coverage spans.
+
+    Only stored spans within reach of the batch are read and rewritten, so
+    the cost depends on the batch, not on the sensor's history.
+    """
+    if not len(batch):
+        return
+    order = np.lexsort((batch.timestamps, batch.sensor_ids))
+    sensor_ids, timestamps = batch.sensor_ids[order], batch.timestamps[order]
+    starts = np.flatnonzero(np.r_[True, sensor_ids[1:] != sensor_ids[:-1]])
+    unique_ids = sensor_ids[starts].tolist()
+
+    sensors = batch.sensors or Sensor.objects.in_bulk(unique_ids)
+    intervals = {sensor_id: sensors[sensor_id].reading_interval for sensor_id in unique_ids}
+    slack = (GAP_FACTOR - 1) * max(intervals.values())
+    # The stored spans stay locked until the merged ones replace them.
+    with transaction.atomic():
+        existing = SensorCoverage.objects.select_for_update().filter(
+            sensor_id__in=unique_ids,
+            end__gte=_to_datetime(timestamps.min() - slack),
+            start__lte=_to_datetime(timestamps.max() + max(intervals.values()) + slack),
+        )
+        stored = {}
+        for span in existing:
+            stored.setdefault(span.sensor_id, []).append(span)
+
+        replaced, merged_spans = [], []
+        for sensor_id, run in zip(unique_ids, np.split(timestamps, starts[1:])):
+            interval = intervals[sensor_id]
+            spans = list(zip(*(edges.tolist() for edges in reading_runs(run, interval))))
+            spans += [(span.start.timestamp(), span.end.timestamp()) for span in stored.get(sensor_id, [])]
+            replaced += [span.id for span in stored.get(sensor_id, [])]
+            merged_spans += [
+                SensorCoverage(sensor_id=sensor_id, start=_to_datetime(start), end=_to_datetime(end))
+                for start, end in merge_spans(spans, (GAP_FACTOR - 1) * interval)
+            ]
+
+        SensorCoverage.objects.filter(id__in=replaced).delete()
+        SensorCoverage.objects.bulk_create(merged_spans)
+
+
+def coverage_percentage(sensor, start_date, end_date):
+    """Share of ``[start_date, end_date)`` covered by the sensor's readings.
+
+    Runs in O(number of gaps in the window).
+    """
+    window = (end_date - start_date).total_seconds()
+    if window <= 0:
+        return 100.0
+    covered = 0.0
+    spans = SensorCoverage.objects.filter(
+        sensor=sensor,
+        end__gt=start_date,
+        start__lt=end_date
+    ).values_list('start', 'end')
+    for start, end in spans:
+        covered += (min(end, end_date) - max(start, start_date)).total_seconds()
+    return covered / window * 100
+
+
+def rebuild_coverage(sensor_ids=None):
+    """Recompute coverage spans from raw readings in the storage backend.
+
+    Spans are only rebuilt from each sensor's oldest stored reading on;
+    earlier spans describe readings retention has already pruned and are
+    kept, clipped where they run into the rebuilt range.
+    """
+    storage = get_storage()
+    sensors = Sensor.objects.all()
+    if sensor_ids is not None:
+        sensors = sensors.filter(id__in=sensor_ids)
+    sensors = list(sensors)
+    oldest = storage.oldest([sensor.id for sensor in sensors])
+    for sensor in sensors:
+        if sensor.id not in oldest:
+            continue
+        floor = oldest[sensor.id]
+        SensorCoverage.objects.filter(sensor=sensor, start__gte=floor).delete()
+        SensorCoverage.objects.filter(sensor=sensor, end__gt=floor).update(end=floor)
+        if not isinstance(storage, ORMStorage):
+            timestamps = storage.read_range(sensor.id)[0]
+            for offset in range(0, len(timestamps), REBUILD_CHUNK_SIZE):
+                _rebuild_chunk(sensor, timestamps[offset:offset + REBUILD_CHUNK_SIZE])
+            continue
+        rows = SensorData.objects.filter(sensor=sensor)\
+            .order_by('timestamp')\
+            .values_list('timestamp', flat=True)\
+            .iterator(chunk_size=REBUILD_CHUNK_SIZE)
+        chunk = []
+        for timestamp in rows:
+            chunk.append(timestamp.timestamp())
+            if len(chunk) == REBUILD_CHUNK_SIZE:
+                _rebuild_chunk(sensor, chunk)
+                chunk = []
+        if chunk:
+            _rebuild_chunk(sensor, chunk)
+
+
+def _rebuild_chunk(sensor, timestamps):
+    count = len(timestamps)
+    update_coverage(ReadingBatch([sensor.id] * count, timestamps, np.zeros(count), np.zeros(count), {sensor.id: sensor}))
+
+
+@receiver(readings_ingested)
+def track_coverage(sender, batch, **kwargs):
+    update_coverage(batch)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'sensor'
 
@@ -7,10 +7,23 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('sensors/', views.sensor_list, name='sensor_list'),
     path('organization/<int:org_id>/sensors/', views.sensor_list, name='org_sensor_list'),
+    path('sensors/latest/', views.latest_readings, name='latest_readings'),
+    path('sensors/compare/', views.compare_sensors, name='compare_sensors'),
+    path('api/sensors/', views.sensor_list_api, name='sensor_list_api'),
+    path('api/organization/<int:org_id>/sensors/', views.sensor_list_api, name='org_sensor_list_api'),
     path('sensor/<int:sensor_id>/', views.sensor_detail, name='sensor_detail'),
     path('sensor/<int:sensor_id>/data/', views.get_sensor_data, name='sensor_data'),
     path('sensor/<int:sensor_id>/analytics/', views.sensor_analytics, name='sensor_analytics'),
+    path('async/sensor/<int:sensor_id>/', async_views.sensor_detail, name='async_sensor_detail'),
+    path('async/sensor/<int:sensor_id>/data/', async_views.get_sensor_data, name='async_sensor_data'),
+    path('async/sensor/<int:sensor_id>/analytics/', async_views.sensor_analytics, name='async_sensor_analytics'),
     path('alerts/', views.alerts, name='alerts'),
+    path('api/alerts/', views.alerts_api, name='alerts_api'),
     path('alert/<int:alert_id>/acknowledge/', views.acknowledge_alert, name='acknowledge_alert'),
+    path('alerts/acknowledge/', views.acknowledge_alerts, name='acknowledge_alerts'),
     path('sensor/add/', views.add_sensor, name='add_sensor'),
+    path('readings/ingest/', views.ingest_readings, name='ingest_readings'),
+    path('readings/export/', views.export_readings, name='export_readings'),
+    path('live/', views.live_events, name='live_events'),
+    path('metrics', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -1,44 +1,158 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Max, Avg, Min, Count
-from django.db.models.functions import TruncDate, TruncHour
+from django.db.models import ExpressionWrapper, F, FloatField
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+import numpy as np
 from django.views.decorators.csrf import csrf_exempt
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from .models import (
-    Sensor, SensorData, SensorType, Location, 
-    Organization, Alert, MaintenanceLog
+    Sensor, SensorType, Location, 
+    Alert, MaintenanceLog, SensorDataHourly, SensorDataDaily
 )
+from .downsampling import envelope, lttb
+from .compare import bucket_edges, compare_series, parse_bucket
+from .export import EXPORT_FORMATS, export_rows
+from .pagination import keyset_page, page_size
+from .latest import get_latest
+from .metrics import PROMETHEUS_CONTENT_TYPE, registry
+from .storage import get_storage
+from .live import broker, event_stream
+from .ingest import IngestError, parse_payload, build_batch, write_readings
+from .uptime import coverage_percentage
+from .summary import combine_summaries, get_summaries, get_user_organizations, invalidate_summaries
+
+def rollup_average():
+    return ExpressionWrapper(F('value_sum') / F('count'), output_field=FloatField())
 
 @login_required
 def dashboard(request):
-    user_orgs = request.user.organizations.all()
+    organizations = get_user_organizations(request.user)
+    summary = combine_summaries(
+        get_summaries([org['id'] for org in organizations]).values()
+    )
     context = {
-        'organizations': user_orgs,
-        'total_sensors': Sensor.objects.filter(organization__in=user_orgs).count(),
-        'active_alerts': Alert.objects.filter(
-            sensor__organization__in=user_orgs,
-            acknowledged=False
-        ).count(),
-        'sensors_by_status': Sensor.objects.filter(organization__in=user_orgs)\
-            .values('status')\
-            .annotate(count=Count('id'))
+        'organizations': organizations,
+        'total_sensors': summary['total_sensors'],
+        'active_alerts': summary['active_alerts'],
+        'sensors_by_status': json.dumps([
+            {'status': status, 'count': count}
+            for status, count in summary['sensors_by_status'].items()
+        ])
     }
     return render(request, 'sensor/dashboard.html', context)
 
-@login_required
-def sensor_list(request, org_id=None):
+ALERT_ORDERING = ['-timestamp', '-id']
+SENSOR_ORDERING = ['id']
+
+def serialize_sensor(sensor):
+    return {
+        'id': sensor.id,
+        'name': sensor.name,
+        'description': sensor.description,
+        'sensor_type': sensor.sensor_type,
+        'status': sensor.status,
+        'location': sensor.location.name if sensor.location else None,
+        'organization': sensor.organization.name if sensor.organization else None,
+    }
+
+def serialize_alert(alert):
+    return {
+        'id': alert.id,
+        'sensor_id': alert.sensor_id,
+        'sensor_name': alert.sensor.name,
+        'severity': alert.severity,
+        'message': alert.message,
+        'value': alert.value,
+        'timestamp': alert.timestamp,
+    }
+
+def user_sensors(request, org_id=None):
     if org_id:
-        organization = get_object_or_404(Organization, id=org_id)
+        organization = get_object_or_404(request.user.organizations, id=org_id)
         sensors = Sensor.objects.filter(organization=organization)
     else:
         sensors = Sensor.objects.filter(organization__in=request.user.organizations.all())
+    return sensors.select_related('location', 'organization')
+
+def sensor_page(request, org_id=None):
+    return keyset_page(
+        user_sensors(request, org_id),
+        SENSOR_ORDERING,
+        request.GET.get('after'),
+        page_size(request.GET)
+    )
+
+def alert_page(request):
+    unacknowledged = Alert.objects.filter(
+        sensor__organization__in=request.user.organizations.all(),
+        acknowledged=False
+    ).select_related('sensor')
+    return keyset_page(
+        unacknowledged,
+        ALERT_ORDERING,
+        request.GET.get('after'),
+        page_size(request.GET)
+    )
+
+@login_required
+def sensor_list(request, org_id=None):
+    try:
+        sensors, next_cursor = sensor_page(request, org_id)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
     return render(request, 'sensor/sensor_list.html', {
         'sensors': sensors,
-        'sensor_types': SensorType.objects.all(),
-        'locations': Location.objects.all()
+        'next_cursor': next_cursor,
+        'org_id': org_id,
+        'sensor_types': SensorType.objects.only('id', 'name'),
+        # Only locations that the listed organizations actually use
+        'locations': Location.objects.filter(
+            sensor__in=user_sensors(request, org_id)
+        ).distinct().only('id', 'name')
+    })
+
+@login_required
+def sensor_list_api(request, org_id=None):
+    try:
+        sensors, next_cursor = sensor_page(request, org_id)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({
+        'results': [serialize_sensor(sensor) for sensor in sensors],
+        'next': next_cursor
+    })
+
+MAX_LATEST_IDS = 5000
+
+@login_required
+def latest_readings(request):
+    """Newest reading of each sensor in ``?ids=1,2,3`` the user can see."""
+    try:
+        sensor_ids = [int(sensor_id) for sensor_id in request.GET.get('ids', '').split(',') if sensor_id]
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'ids must be comma-separated integers'}, status=400)
+    if len(sensor_ids) > MAX_LATEST_IDS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {MAX_LATEST_IDS} ids per request'
+        }, status=400)
+    
+    org_ids = {org['id'] for org in get_user_organizations(request.user)}
+    return JsonResponse({
+        sensor_id: {
+            'value': entry['value'],
+            'timestamp': datetime.fromtimestamp(entry['timestamp'], tz=dt_timezone.utc) if entry['timestamp'] is not None else None,
+            'quality': entry['quality']
+        }
+        for sensor_id, entry in get_latest(sensor_ids).items()
+        if entry['organization_id'] in org_ids
     })
 
 @login_required
@@ -49,10 +163,7 @@ def sensor_detail(request, sensor_id):
     
     context = {
         'sensor': sensor,
-        'recent_data': SensorData.objects.filter(
-            sensor=sensor,
-            timestamp__range=(start_date, end_date)
-        ).order_by('-timestamp')[:100],
+        'recent_data': get_storage().tail(sensor.id, 100, start_date, end_date),
         'active_alerts': Alert.objects.filter(
             sensor=sensor,
             acknowledged=False
@@ -61,39 +172,168 @@ def sensor_detail(request, sensor_id):
     }
     return render(request, 'sensor/sensor_detail.html', context)
 
+TIMEFRAMES = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '90d': timedelta(days=90),
+}
+MAX_CHART_POINTS = 10000
+
 @login_required
 def get_sensor_data(request, sensor_id):
     sensor = get_object_or_404(Sensor, id=sensor_id)
     timeframe = request.GET.get('timeframe', '24h')
     
     end_date = timezone.now()
+    start_date = end_date - TIMEFRAMES.get(timeframe, TIMEFRAMES['7d'])
+    
+    if 'points' in request.GET:
+        try:
+            points = max(3, min(int(request.GET['points']), MAX_CHART_POINTS))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'points must be an integer'}, status=400)
+        return JsonResponse(downsampled_series(sensor.id, start_date, end_date, points))
+    
     if timeframe == '24h':
-        start_date = end_date - timedelta(hours=24)
-        truncate = TruncHour
-    else:  # '7d' or default
-        start_date = end_date - timedelta(days=7)
-        truncate = TruncDate
+        rollups = SensorDataHourly.objects.filter(
+            sensor=sensor,
+            period__range=(start_date.replace(minute=0, second=0, microsecond=0), end_date)
+        )
+    else:  # '7d', longer timeframes or default
+        rollups = SensorDataDaily.objects.filter(
+            sensor=sensor,
+            period__range=(start_date.date(), end_date.date())
+        )
     
-    data = SensorData.objects.filter(
-        sensor=sensor,
-        timestamp__range=(start_date, end_date)
-    ).annotate(
-        period=truncate('timestamp')
-    ).values('period').annotate(
-        avg_value=Avg('value'),
-        min_value=Min('value'),
-        max_value=Max('value')
+    data = rollups.values('period').annotate(
+        avg_value=rollup_average(),
+        min_value=F('value_min'),
+        max_value=F('value_max')
     ).order_by('period')
     
     return JsonResponse(list(data), safe=False)
 
+def downsampled_series(sensor_id, start_date, end_date, points):
+    """LTTB-downsampled raw readings plus a min/max envelope per bucket"""
+    timestamps, values, _ = get_storage().read_range(sensor_id, start_date, end_date)
+    if not len(timestamps):
+        return {'points': [], 'envelope': []}
+    
+    selected = lttb(timestamps, values, points)
+    bucket_starts, lows, highs = envelope(timestamps, values, points)
+    
+    def to_datetime(ts):
+        return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+    
+    return {
+        'points': [
+            {'timestamp': to_datetime(ts), 'value': value}
+            for ts, value in zip(timestamps[selected].tolist(), values[selected].tolist())
+        ],
+        'envelope': [
+            {'timestamp': to_datetime(ts), 'min': low, 'max': high}
+            for ts, low, high in zip(bucket_starts.tolist(), lows.tolist(), highs.tolist())
+        ],
+    }
+
+def parse_time_param(params, name):
+    """Parse an optional ISO 8601 parameter into an aware datetime"""
+    raw = params.get(name)
+    if not raw:
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime')
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+@login_required
+def export_readings(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'status': 'error', 'message': 'format must be csv or ndjson'}, status=400)
+    
+    sensors = Sensor.objects.filter(organization__in=request.user.organizations.all())
+    try:
+        if request.GET.get('ids'):
+            sensors = sensors.filter(id__in=[int(i) for i in request.GET['ids'].split(',')])
+        start = parse_time_param(request.GET, 'start')
+        end = parse_time_param(request.GET, 'end')
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    content_type, render_lines = EXPORT_FORMATS[export_format]
+    rows = export_rows(sensors.values_list('id', flat=True), start, end)
+    response = StreamingHttpResponse(render_lines(rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="readings.{export_format}"'
+    return response
+
+def live_organization_ids(request):
+    if not request.user.is_authenticated:
+        return None
+    org_ids = [org['id'] for org in get_user_organizations(request.user)]
+    if 'org' in request.GET:
+        org_ids = [org_id for org_id in org_ids if str(org_id) == request.GET['org']]
+    return org_ids
+
+async def live_events(request):
+    """Server-Sent Events stream of new readings and alerts.
+
+    Each connected client receives the newest reading per sensor of every
+    ingested batch, and every new alert, for its organizations (or only
+    ``?org=<id>``). Requires the ASGI application. Each stream closes
+    after ``MAX_STREAM_SECONDS`` and the browser reconnects, so streams
+    of closed tabs do not pile up.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Live updates require the ASGI server'
+        }, status=503)
+
+    org_ids = await sync_to_async(live_organization_ids)(request)
+    if org_ids is None:
+        return JsonResponse({'status': 'error', 'message': 'Authentication required'}, status=401)
+    if not org_ids:
+        return JsonResponse({'status': 'error', 'message': 'Organization not found'}, status=404)
+
+    response = StreamingHttpResponse(
+        event_stream(broker.subscribe(org_ids)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def alerts(request):
-    alerts = Alert.objects.filter(
-        sensor__organization__in=request.user.organizations.all(),
-        acknowledged=False
-    ).select_related('sensor')
-    return render(request, 'sensor/alerts.html', {'alerts': alerts})
+    try:
+        alerts, next_cursor = alert_page(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    organizations = get_user_organizations(request.user)
+    summary = combine_summaries(
+        get_summaries([org['id'] for org in organizations]).values()
+    )
+    return render(request, 'sensor/alerts.html', {
+        'alerts': alerts,
+        'next_cursor': next_cursor,
+        'active_alerts': summary['active_alerts']
+    })
+
+@login_required
+def alerts_api(request):
+    try:
+        alerts, next_cursor = alert_page(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({
+        'results': [serialize_alert(alert) for alert in alerts],
+        'next': next_cursor
+    })
 
 @login_required
 def acknowledge_alert(request, alert_id):
@@ -106,22 +346,72 @@ def acknowledge_alert(request, alert_id):
         return JsonResponse({'status': 'success'})
     return JsonResponse({'status': 'error'}, status=400)
 
+@login_required
+def acknowledge_alerts(request):
+    """Acknowledge many alerts with a single UPDATE.
+
+    The JSON body holds either ``ids`` or any of ``sensor``, ``severity``,
+    ``start`` and ``end`` to select alerts; only unacknowledged alerts in
+    the user's organizations are touched.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error'}, status=400)
+    
+    try:
+        criteria = json.loads(request.body or '{}')
+        if not isinstance(criteria, dict):
+            raise ValueError('Expected a JSON object')
+        filters = {}
+        if 'ids' in criteria:
+            ids = criteria['ids']
+            if not isinstance(ids, list) or not all(type(alert_id) is int for alert_id in ids):
+                raise ValueError('ids must be a list of alert ids')
+            filters['id__in'] = ids
+        if criteria.get('sensor'):
+            if isinstance(criteria['sensor'], bool):
+                raise ValueError('sensor must be a sensor id')
+            filters['sensor_id'] = int(criteria['sensor'])
+        if criteria.get('severity'):
+            if criteria['severity'] not in [choice for choice, _ in Alert.SEVERITY_CHOICES]:
+                raise ValueError('Unknown severity')
+            filters['severity'] = criteria['severity']
+        for key, lookup in (('start', 'timestamp__gte'), ('end', 'timestamp__lt')):
+            if criteria.get(key):
+                filters[lookup] = parse_time_param(criteria, key)
+        if not filters:
+            raise ValueError('Provide alert ids or at least one filter')
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    user_orgs = request.user.organizations.all()
+    acknowledged = Alert.objects.filter(
+        sensor__organization__in=user_orgs,
+        acknowledged=False,
+        **filters
+    ).update(
+        acknowledged=True,
+        acknowledged_by=request.user,
+        acknowledged_at=timezone.now()
+    )
+    # update() sends no signals, so refresh the dashboard counters here.
+    invalidate_summaries(user_orgs.values_list('id', flat=True))
+    return JsonResponse({'status': 'success', 'acknowledged': acknowledged})
+
 @login_required
 def sensor_analytics(request, sensor_id):
     sensor = get_object_or_404(Sensor, id=sensor_id)
     end_date = timezone.now()
     start_date = end_date - timedelta(days=30)
     
-    daily_stats = SensorData.objects.filter(
+    daily_stats = SensorDataDaily.objects.filter(
         sensor=sensor,
-        timestamp__range=(start_date, end_date)
-    ).annotate(
-        date=TruncDate('timestamp')
-    ).values('date').annotate(
-        avg_value=Avg('value'),
-        max_value=Max('value'),
-        min_value=Min('value'),
-        reading_count=Count('id')
+        period__range=(start_date.date(), end_date.date())
+    ).values(
+        date=F('period'),
+        avg_value=rollup_average(),
+        max_value=F('value_max'),
+        min_value=F('value_min'),
+        reading_count=F('count')
     ).order_by('date')
     
     return JsonResponse({
@@ -134,17 +424,100 @@ def sensor_analytics(request, sensor_id):
     })
 
 def calculate_uptime(sensor, start_date, end_date):
-    total_readings = SensorData.objects.filter(
-        sensor=sensor,
-        timestamp__range=(start_date, end_date)
-    ).count()
+    return coverage_percentage(sensor, start_date, end_date)
+
+MAX_COMPARE_SENSORS = 100
+MAX_COMPARE_BUCKETS = 2000
+
+@login_required
+def compare_sensors(request):
+    """Aligned avg/min/max/count series for several sensors at once.
+
+    Sensors are picked with ``?ids=1,2,3`` and/or ``location``,
+    ``organization`` and ``type`` filters, limited to the user's
+    organizations. The window is ``start``/``end`` (ISO 8601) or a
+    ``timeframe``, split into ``bucket``-wide buckets (``15m``, ``1h``,
+    ``1d``, ... default ``1h``).
+    """
+    org_ids = [org['id'] for org in get_user_organizations(request.user)]
+    sensors = Sensor.objects.filter(organization_id__in=org_ids)
+    try:
+        if request.GET.get('ids'):
+            sensors = sensors.filter(id__in=[int(i) for i in request.GET['ids'].split(',') if i])
+        if request.GET.get('location'):
+            sensors = sensors.filter(location_id=int(request.GET['location']))
+        if request.GET.get('organization'):
+            sensors = sensors.filter(organization_id=int(request.GET['organization']))
+        if request.GET.get('type'):
+            sensors = sensors.filter(sensor_type=request.GET['type'])
+        seconds = parse_bucket(request.GET.get('bucket', '1h'))
+        end_date = parse_time_param(request.GET, 'end') or timezone.now()
+        start_date = parse_time_param(request.GET, 'start') or \
+            end_date - TIMEFRAMES.get(request.GET.get('timeframe', '24h'), TIMEFRAMES['7d'])
+        if start_date >= end_date:
+            raise ValueError('start must be before end')
+        edges = bucket_edges(start_date, end_date, seconds)
+    except (ValueError, OverflowError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    if len(edges) > MAX_COMPARE_BUCKETS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {MAX_COMPARE_BUCKETS} buckets per request; use a wider bucket'
+        }, status=400)
+    
+    sensors = list(sensors.order_by('id').values('id', 'name', 'sensor_type')[:MAX_COMPARE_SENSORS + 1])
+    if len(sensors) > MAX_COMPARE_SENSORS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {MAX_COMPARE_SENSORS} sensors per request'
+        }, status=400)
     
-    expected_readings = (end_date - start_date).total_seconds() / sensor.reading_interval
+    counts, averages, lows, highs = compare_series([sensor['id'] for sensor in sensors], edges, seconds)
     
-    if expected_readings == 0:
-        return 100.0
+    def column(values):
+        return [None if np.isnan(value) else value for value in values.tolist()]
     
-    return (total_readings / expected_readings) * 100
+    return JsonResponse({
+        'bucket': seconds,
+        'timestamps': [datetime.fromtimestamp(ts, tz=dt_timezone.utc) for ts in edges.tolist()],
+        'sensors': [
+            dict(sensor, count=count.tolist(), avg=column(avg), min=column(low), max=column(high))
+            for sensor, count, avg, low, high in zip(sensors, counts, averages, lows, highs)
+        ],
+    })
+
+@login_required
+def ingest_readings(request):
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid request method'
+        }, status=405)
+
+    try:
+        records = parse_payload(request.body, request.content_type)
+        batch = build_batch(
+            records,
+            Sensor.objects.filter(organization__in=request.user.organizations.all())
+        )
+    except IngestError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+
+    try:
+        created = write_readings(batch)
+    except TimeoutError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Timed out waiting for the ingest writer'
+        }, status=503)
+
+    return JsonResponse({
+        'status': 'success',
+        'created': created
+    })
 
 @login_required
 def add_sensor(request):
@@ -184,3 +557,9 @@ def add_sensor(request):
         'status': 'error',
         'message': 'Invalid request method'
     }, status=405)
+
+def metrics(request):
+    """Request metrics in the Prometheus text format, for local scrapers."""
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'SENSOR_METRICS_IPS', []):
+        return JsonResponse({'status': 'error', 'message': 'Forbidden'}, status=403)
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
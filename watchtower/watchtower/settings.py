@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sensor.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'watchtower',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Newest reading of every sensor, kept apart so that these entries
+    # never evict the dashboard summaries. MAX_ENTRIES must stay above the
+    # number of sensors, or bulk lookups fall through to the database.
+    'latest': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'watchtower-latest',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -134,3 +155,50 @@ LOGOUT_REDIRECT_URL = 'login'
 # Session settings
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+
+# Sensor data retention: raw readings older than this many days are rolled
+# up, optionally archived, and deleted by the prune_readings command.
+SENSOR_RAW_RETENTION_DAYS = 30
+SENSOR_ARCHIVE_DIR = None
+
+# Applied to every new SQLite connection. The default only waits for
+# locks instead of failing at once.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+}
+# Profile for deployments: WAL lets dashboard reads run while readings are
+# being written. Opt in with SQLITE_PRAGMAS = SQLITE_WAL_PRAGMAS. Switching
+# to WAL rewrites the database header and keeps -wal/-shm files next to it,
+# so it is left off for the checked-in development database.
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative means KiB
+    'busy_timeout': 5000,
+}
+
+# Hand ingested batches to a single background writer that merges whatever
+# has queued up into one transaction, instead of writing from each request.
+# Requests give up with a 503 after SENSOR_INGEST_TIMEOUT seconds.
+SENSOR_INGEST_QUEUE = False
+SENSOR_INGEST_TIMEOUT = 30
+
+# Where raw readings live. The default keeps them in the SensorData table;
+# 'sensor.storage.ColumnarStorage' with {'directory': BASE_DIR / 'readings'}
+# keeps memory-mapped per-sensor column files instead. Rollups, coverage,
+# alerts and baselines stay in the database either way; rebuild_rollups
+# reads from either backend, prune_readings only from the SensorData table.
+SENSOR_STORAGE = {
+    'BACKEND': 'sensor.storage.ORMStorage',
+    'OPTIONS': {},
+}
+
+# Fraction of requests (0-1) whose wall time, database queries, cache hits
+# and response size are recorded and served at /metrics to the addresses
+# in SENSOR_METRICS_IPS. 0 turns instrumentation off. Requests slower than
+# SENSOR_SLOW_REQUEST_MS are logged either way; sampled ones include their
+# slowest queries.
+SENSOR_METRICS_SAMPLE_RATE = 0.0
+SENSOR_SLOW_REQUEST_MS = 1000
+SENSOR_METRICS_IPS = ['127.0.0.1', '::1']
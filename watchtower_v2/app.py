@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, url_for
 from flask_cors import CORS
 import torch
 import torchvision.models as models
@@ -11,33 +11,79 @@ import numpy as np
 import base64
 import pytesseract
 import os
+import logging
+
+from batching import MicroBatcher
+from image_store import ImageStore
+from registry import ModelRegistry
+from result_cache import ResultCache, content_key, dhash
 
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app)
+logging.basicConfig(level=logging.INFO)  # model load/unload times
 
 # Analytics storage
 analytics = {
     'object': {'total': 0, 'common_objects': {}},
     'classify': {'total': 0, 'common_classes': {}},
     'anomaly': {'total': 0, 'defects': 0},
-    'ocr': {'total': 0, 'chars': 0}
+    'ocr': {'total': 0, 'chars': 0},
+    # Cached answers are not counted in the per-type totals above
+    'cache': {'hits': 0, 'near_hits': 0, 'misses': 0}
 }
 
-# Load models
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
+# Models are loaded on first use, or at startup when listed in
+# PRELOAD_MODELS (e.g. "object,classify"; "yolo" needs YOLO_WEIGHTS), and
+# dropped again after MODEL_IDLE_TTL seconds without requests (0 keeps
+# them loaded).
+PRELOAD_MODELS = [name for name in os.environ.get('PRELOAD_MODELS', '').split(',') if name]
+MODEL_IDLE_TTL = float(os.environ.get('MODEL_IDLE_TTL', 0))
+
 # Object Detection - Using improved FasterRCNN V2
 detection_weights = FasterRCNN_ResNet50_FPN_V2_Weights.DEFAULT
-detection_model = fasterrcnn_resnet50_fpn_v2(weights=detection_weights)
-detection_model.eval()
-detection_model.to(device)
 
-COCO_CLASSES = detection_weights.meta["categories"]
+def load_detection_model():
+    model = fasterrcnn_resnet50_fpn_v2(weights=detection_weights)
+    model.eval()
+    return model.to(device)
 
 # Image Classification - Using ResNet152
-classify_model = models.resnet152(weights=models.ResNet152_Weights.DEFAULT)
-classify_model.eval()
-classify_model.to(device)
+def load_classify_model():
+    model = models.resnet152(weights=models.ResNet152_Weights.DEFAULT)
+    model.eval()
+    return model.to(device)
+
+def read_imagenet_labels():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imagenet_classes.txt')) as f:
+        return [line.strip() for line in f]
+
+# Unloading hands the freed CUDA memory back instead of keeping it cached
+model_registry = ModelRegistry(
+    ttl=MODEL_IDLE_TTL, on_unload=torch.cuda.empty_cache if device.type == 'cuda' else None
+)
+model_registry.register(
+    'object', load_detection_model, labels=detection_weights.meta['categories'],
+    architecture='fasterrcnn_resnet50_fpn_v2', weights=str(detection_weights),
+)
+model_registry.register(
+    'classify', load_classify_model, labels=read_imagenet_labels(),
+    architecture='resnet152', weights=str(models.ResNet152_Weights.DEFAULT),
+)
+
+# Custom YOLO model (e.g. the best.pt trained for AFIA); needs ultralytics.
+YOLO_WEIGHTS = os.environ.get('YOLO_WEIGHTS')
+
+def load_yolo_model():
+    from ultralytics import YOLO
+    return YOLO(YOLO_WEIGHTS)
+
+if YOLO_WEIGHTS:
+    model_registry.register(
+        'yolo', load_yolo_model, labels=lambda: list(model_registry.get('yolo').names.values()),
+        architecture='yolo', weights=YOLO_WEIGHTS,
+    )
 
 # Preprocessing transforms
 preprocess_classify = transforms.Compose([
@@ -51,10 +97,79 @@ preprocess_detect = transforms.Compose([
     transforms.ToTensor(),
 ])
 
+# Concurrent requests are queued and run through the models together: a
+# batch starts once BATCH_MAX_SIZE images are waiting or the first one has
+# waited BATCH_MAX_WAIT_MS. A request gives up after BATCH_TIMEOUT seconds.
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+BATCH_TIMEOUT = float(os.environ.get('BATCH_TIMEOUT', 120))
+
+def detect_batch(tensors):
+    # FasterRCNN takes a list of images of any size
+    with torch.no_grad():
+        predictions = model_registry.get('object')([tensor.to(device) for tensor in tensors])
+    return [{key: value.cpu() for key, value in prediction.items()} for prediction in predictions]
+
+def classify_batch(tensors):
+    with torch.no_grad():
+        output = model_registry.get('classify')(torch.stack(tensors).to(device))
+        probabilities = torch.nn.functional.softmax(output, dim=1)
+        top_probs, top_catids = probabilities.topk(3, dim=1)  # Top 3 predictions per image
+    return list(zip(top_probs.cpu(), top_catids.cpu()))
+
+detection_batcher = MicroBatcher(
+    detect_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS / 1000, name='detection-batcher', timeout=BATCH_TIMEOUT
+)
+classify_batcher = MicroBatcher(
+    classify_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS / 1000, name='classify-batcher', timeout=BATCH_TIMEOUT
+)
+
+INSPECTION_TYPES = {'object', 'classify', 'anomaly', 'ocr'}
+
+# Results of repeated uploads are served from an in-process LRU cache of
+# at most RESULT_CACHE_MB (0 disables it). Setting RESULT_CACHE_PHASH_DISTANCE
+# also matches near-identical frames whose 64-bit image hashes differ in at
+# most that many bits.
+RESULT_CACHE_MB = float(os.environ.get('RESULT_CACHE_MB', 64))
+RESULT_CACHE_PHASH_DISTANCE = os.environ.get('RESULT_CACHE_PHASH_DISTANCE')
+result_cache = ResultCache(
+    int(RESULT_CACHE_MB * 1024 * 1024),
+    int(RESULT_CACHE_PHASH_DISTANCE) if RESULT_CACHE_PHASH_DISTANCE else None,
+) if RESULT_CACHE_MB > 0 else None
+
+# Annotated images of format=json responses, fetched from /api/images/<token>
+# within IMAGE_CACHE_TTL seconds.
+IMAGE_FORMATS = {'jpeg': ('.jpg', 'image/jpeg'), 'webp': ('.webp', 'image/webp')}
+IMAGE_CACHE_TTL = float(os.environ.get('IMAGE_CACHE_TTL', 60))
+IMAGE_CACHE_MB = float(os.environ.get('IMAGE_CACHE_MB', 64))
+image_store = ImageStore(IMAGE_CACHE_TTL, int(IMAGE_CACHE_MB * 1024 * 1024))
+
 @app.route('/')
 def serve_index():
     return send_from_directory('.', 'index.html')
 
+@app.route('/api/models')
+def list_models():
+    # Never loads a model; yolo labels appear once it has been used
+    return jsonify(model_registry.status())
+
+@app.route('/api/images/<token>')
+def annotated_image(token):
+    image = image_store.get(token)
+    if image is None:
+        return jsonify({'error': 'Image not found or expired.'}), 404
+    data, mimetype = image
+    return Response(data, mimetype=mimetype, headers={'Cache-Control': f'private, max-age={int(IMAGE_CACHE_TTL)}'})
+
+def encode_image(img_cv, structured, image_format):
+    extension, mimetype = IMAGE_FORMATS[image_format]
+    _, buffer = cv2.imencode(extension, img_cv)
+    if structured:
+        # Served as raw bytes from a short-lived URL instead of inline base64
+        return {'image_url': url_for('annotated_image', token=image_store.put(buffer.tobytes(), mimetype))}
+    img_base64 = base64.b64encode(buffer).decode('utf-8')
+    return {'image': f'data:{mimetype};base64,{img_base64}'}
+
 @app.route('/api/inspect', methods=['POST'])
 def inspect():
     if 'image' not in request.files:
@@ -63,29 +178,52 @@ def inspect():
     try:
         image_file = request.files['image']
         inspection_type = request.form['type']
-        image = Image.open(io.BytesIO(image_file.read())).convert('RGB')
-        img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        if inspection_type not in INSPECTION_TYPES:
+            return jsonify({'error': 'Invalid inspection type.'}), 400
+
+        # format=json returns boxes, labels, scores, contours and OCR boxes;
+        # the annotated image is only drawn when asked for with annotate=1.
+        response_format = request.form.get('format', 'image')
+        image_format = request.form.get('image_format', 'jpeg')
+        if response_format not in ('image', 'json'):
+            return jsonify({'error': 'Invalid response format.'}), 400
+        if image_format not in IMAGE_FORMATS:
+            return jsonify({'error': 'Invalid image format.'}), 400
+        structured = response_format == 'json'
+        annotate = not structured or request.form.get('annotate') in ('1', 'true')
+        image_bytes = image_file.read()
+
+        # Identical uploads are answered from the cache before decoding
+        cache_key = phash = None
+        if result_cache is not None:
+            params = {key: value for key, value in request.form.items() if key != 'type'}
+            cache_key = content_key(image_bytes, inspection_type, params)
+            cached, _ = result_cache.get(cache_key)
+            if cached is not None:
+                analytics['cache']['hits'] += 1
+                return Response(cached, mimetype='application/json')
+
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        if result_cache is not None and result_cache.phash_distance is not None:
+            phash = dhash(image)
+            cached, _ = result_cache.get(cache_key, phash)
+            if cached is not None:
+                analytics['cache']['near_hits'] += 1
+                return Response(cached, mimetype='application/json')
+        if result_cache is not None:
+            analytics['cache']['misses'] += 1
+        if annotate or inspection_type in ('anomaly', 'ocr'):
+            img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
 
         if inspection_type == 'object':
-            img_tensor = preprocess_detect(image).to(device)
-            with torch.no_grad():
-                predictions = detection_model([img_tensor])[0]
+            predictions = detection_batcher(preprocess_detect(image))
             
-            labels = predictions['labels'].cpu().numpy()
-            scores = predictions['scores'].cpu().numpy()
+            labels = predictions['labels'].numpy()
+            scores = predictions['scores'].numpy()
             threshold = 0.5
-            boxes = predictions['boxes'].cpu().numpy()
-            detections = [(COCO_CLASSES[label], score, box) for label, score, box in zip(labels, scores, boxes) if score > threshold]
-            
-            # Draw bounding boxes
-            for name, score, box in detections:
-                x1, y1, x2, y2 = map(int, box)
-                cv2.rectangle(img_cv, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(img_cv, f'{name} ({score:.2f})', (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            
-            # Convert to base64
-            _, buffer = cv2.imencode('.jpg', img_cv)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
+            boxes = predictions['boxes'].numpy()
+            coco_classes = model_registry.labels('object')
+            detections = [(coco_classes[label], score, box) for label, score, box in zip(labels, scores, boxes) if score > threshold]
             
             if detections:
                 analytics['object']['total'] += 1
@@ -94,32 +232,40 @@ def inspect():
                 output = f"Detected {len(detections)} objects"
             else:
                 output = "No objects detected above threshold."
-                
-            return jsonify({
-                'result': output,
-                'image': f'data:image/jpeg;base64,{img_base64}'
-            })
+            
+            result = {'result': output}
+            if structured:
+                result['detections'] = [
+                    {'label': name, 'score': round(float(score), 4), 'box': [round(float(v), 1) for v in box]}
+                    for name, score, box in detections
+                ]
+            if annotate:
+                # Draw bounding boxes
+                for name, score, box in detections:
+                    x1, y1, x2, y2 = map(int, box)
+                    cv2.rectangle(img_cv, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                    cv2.putText(img_cv, f'{name} ({score:.2f})', (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                result.update(encode_image(img_cv, structured, image_format))
 
         elif inspection_type == 'classify':
-            input_tensor = preprocess_classify(image).unsqueeze(0).to(device)
-            with torch.no_grad():
-                output = classify_model(input_tensor)
-                probabilities = torch.nn.functional.softmax(output[0], dim=0)
-                top_probs, top_catids = probabilities.topk(3)  # Get top 3 predictions
-                
-                # Read ImageNet classes
-                with open('imagenet_classes.txt', 'r') as f:
-                    categories = [s.strip() for s in f.readlines()]
-                
-                predictions = []
-                for prob, idx in zip(top_probs, top_catids):
-                    predictions.append(f"{categories[idx]} ({prob:.2%})")
-                
-                analytics['classify']['total'] += 1
-                analytics['classify']['common_classes'][categories[top_catids[0]]] = \
-                    analytics['classify']['common_classes'].get(categories[top_catids[0]], 0) + 1
-                
-            return jsonify({'result': f"Top predictions: {', '.join(predictions)}"})
+            top_probs, top_catids = classify_batcher(preprocess_classify(image))
+            
+            categories = model_registry.labels('classify')
+            
+            predictions = []
+            for prob, idx in zip(top_probs, top_catids):
+                predictions.append(f"{categories[idx]} ({prob:.2%})")
+            
+            analytics['classify']['total'] += 1
+            analytics['classify']['common_classes'][categories[top_catids[0]]] = \
+                analytics['classify']['common_classes'].get(categories[top_catids[0]], 0) + 1
+            
+            result = {'result': f"Top predictions: {', '.join(predictions)}"}
+            if structured:
+                result['predictions'] = [
+                    {'label': categories[idx], 'probability': round(float(prob), 4)}
+                    for prob, idx in zip(top_probs, top_catids)
+                ]
 
         elif inspection_type == 'anomaly':
             # Convert to grayscale
@@ -133,30 +279,31 @@ def inspect():
             
             # Find contours
             contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            defects = [contour for contour in contours if cv2.contourArea(contour) > 100]  # Minimum area threshold
+            defect_count = len(defects)
             
-            # Draw defects and analyze
-            defect_count = 0
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area > 100:  # Minimum area threshold
-                    defect_count += 1
+            analytics['anomaly']['total'] += 1
+            analytics['anomaly']['defects'] += defect_count
+            output = f"Found {defect_count} potential defects" if defect_count > 0 else "No defects detected"
+            result = {'result': output}
+            if structured:
+                result['defects'] = [
+                    {
+                        'box': list(cv2.boundingRect(contour)),  # x, y, w, h
+                        'area': float(cv2.contourArea(contour)),
+                        'contour': cv2.approxPolyDP(contour, 1.0, True).reshape(-1, 2).tolist(),
+                    }
+                    for contour in defects
+                ]
+            if annotate:
+                # Draw defects
+                for number, contour in enumerate(defects, 1):
                     cv2.drawContours(img_cv, [contour], -1, (0, 0, 255), 2)
                     # Add bounding box
                     x, y, w, h = cv2.boundingRect(contour)
                     cv2.rectangle(img_cv, (x, y), (x+w, y+h), (255, 0, 0), 2)
-                    cv2.putText(img_cv, f'Defect {defect_count}', (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-            
-            # Convert result image to base64
-            _, buffer = cv2.imencode('.jpg', img_cv)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            analytics['anomaly']['total'] += 1
-            analytics['anomaly']['defects'] += defect_count
-            output = f"Found {defect_count} potential defects" if defect_count > 0 else "No defects detected"
-            return jsonify({
-                'result': output,
-                'image': f'data:image/jpeg;base64,{img_base64}'
-            })
+                    cv2.putText(img_cv, f'Defect {number}', (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+                result.update(encode_image(img_cv, structured, image_format))
 
         elif inspection_type == 'ocr':
             # Preprocess for OCR
@@ -168,16 +315,12 @@ def inspect():
             text = pytesseract.image_to_string(binary)
             text = text.strip()
             
-            # Draw text regions
-            boxes = pytesseract.image_to_boxes(binary)
+            # Character boxes, flipped from tesseract's bottom-left origin
             h, w, _ = img_cv.shape
-            for b in boxes.splitlines():
+            characters = []
+            for b in pytesseract.image_to_boxes(binary).splitlines():
                 b = b.split()
-                cv2.rectangle(img_cv, (int(b[1]), h - int(b[2])), (int(b[3]), h - int(b[4])), (0, 255, 0), 2)
-            
-            # Convert result image to base64
-            _, buffer = cv2.imencode('.jpg', img_cv)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
+                characters.append((b[0], [int(b[1]), h - int(b[4]), int(b[3]), h - int(b[2])]))
             
             analytics['ocr']['total'] += 1
             analytics['ocr']['chars'] += len(text)
@@ -186,16 +329,26 @@ def inspect():
                 output = f"Extracted text: '{text}'"
             else:
                 output = "No text detected."
-                
-            return jsonify({
-                'result': output,
-                'image': f'data:image/jpeg;base64,{img_base64}'
-            })
+            
+            result = {'result': output}
+            if structured:
+                result['text'] = text
+                result['characters'] = [{'char': char, 'box': box} for char, box in characters]
+            if annotate:
+                # Draw text regions
+                for _, (x1, y1, x2, y2) in characters:
+                    cv2.rectangle(img_cv, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                result.update(encode_image(img_cv, structured, image_format))
 
-        return jsonify({'error': 'Invalid inspection type.'}), 400
+        # Image URLs expire, so results pointing at one are not cached
+        if cache_key is not None and 'image_url' not in result:
+            result_cache.put(cache_key, result, phash)
+        return jsonify(result)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+model_registry.preload(PRELOAD_MODELS)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000, host='0.0.0.0', threaded=True)
\ No newline at end of file
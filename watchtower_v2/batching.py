@@ -0,0 +1,73 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Groups concurrent requests into batches run by one worker thread.
+
+    ``run_batch`` takes a list of inputs and returns one result per input.
+    A batch is started once ``max_batch_size`` inputs are waiting or the
+    oldest one has waited ``max_wait`` seconds. If ``run_batch`` raises or
+    returns the wrong number of results, every input in the batch fails.
+    Calling the batcher waits at most ``timeout`` seconds for a result.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.01, name='batcher', timeout=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result(timeout=self.timeout)
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                pending.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            # Futures cancelled while queued are dropped from the batch
+            pending = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            outcome = None
+            try:
+                results = list(self.run_batch([item for item, _ in pending]))
+                if len(results) != len(pending):
+                    raise RuntimeError(f'{self.name}: got {len(results)} results for a batch of {len(pending)}')
+                outcome = results
+            except Exception as e:
+                outcome = e
+            finally:
+                # Anything else (SystemExit, KeyboardInterrupt) stops the
+                # worker; the next submit starts a new one.
+                if outcome is None:
+                    outcome = RuntimeError(f'{self.name}: worker stopped while running a batch')
+                for index, (_, future) in enumerate(pending):
+                    if isinstance(outcome, BaseException):
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(outcome[index])
@@ -0,0 +1,70 @@
+"""Throughput and latency of batched inference at several batch sizes.
+
+    python benchmark.py --model classify --batch-sizes 1 2 4 8 16
+
+Concurrent clients submit random images through a MicroBatcher, as
+/api/inspect does, with the device the app picked (CPU unless CUDA is
+available).
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import app
+from batching import MicroBatcher
+
+MODELS = {
+    # name: (preprocess, run_batch, image size)
+    'classify': (app.preprocess_classify, app.classify_batch, (320, 240)),
+    'object': (app.preprocess_detect, app.detect_batch, (640, 480)),
+}
+
+
+def random_images(count, size, seed):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    return [Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def run(batcher, tensors, clients):
+    def request(tensor):
+        started = time.perf_counter()
+        batcher(tensor)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = list(pool.map(request, tensors))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', choices=[*MODELS, 'all'], default='all')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--max-wait-ms', type=float, default=app.BATCH_MAX_WAIT_MS)
+    parser.add_argument('--requests', type=int, default=64, help='Images per batch size')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent requests')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'device: {app.device}, {args.clients} clients, max wait {args.max_wait_ms}ms')
+    for name in MODELS if args.model == 'all' else [args.model]:
+        preprocess, run_batch, size = MODELS[name]
+        tensors = [preprocess(image) for image in random_images(args.requests, size, args.seed)]
+        run_batch(tensors[:1])  # warm up
+        for batch_size in args.batch_sizes:
+            batcher = MicroBatcher(run_batch, batch_size, args.max_wait_ms / 1000, name=f'{name}-benchmark')
+            latencies, elapsed = run(batcher, tensors, args.clients)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(
+                f'{name:<9} batch {batch_size:>2}  {len(tensors) / elapsed:8.1f} images/sec  '
+                f'p50 {p50:8.1f}ms  p99 {p99:8.1f}ms'
+            )
+
+
+if __name__ == '__main__':
+    main()
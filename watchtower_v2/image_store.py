@@ -0,0 +1,41 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class ImageStore:
+    """Encoded images kept for ``ttl`` seconds under unguessable tokens.
+
+    The oldest images are dropped early once the total exceeds ``max_bytes``.
+    """
+
+    def __init__(self, ttl=60, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._images = OrderedDict()  # token -> (expires, data, mimetype)
+        self._lock = threading.Lock()
+
+    def put(self, data, mimetype):
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._images[token] = (now + self.ttl, data, mimetype)
+            self.size += len(data)
+            # Tokens are stored in expiry order, so expired ones are at the front.
+            while self._images:
+                expires, oldest, _ = next(iter(self._images.values()))
+                if expires > now and self.size <= self.max_bytes:
+                    break
+                self._images.popitem(last=False)
+                self.size -= len(oldest)
+        return token
+
+    def get(self, token):
+        """Return ``(data, mimetype)``, or None once the image has expired."""
+        with self._lock:
+            entry = self._images.get(token)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1], entry[2]
@@ -0,0 +1,127 @@
+import gc
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Loads models on first use and drops the ones left idle for ``ttl`` seconds.
+
+    Each model is registered with a loader function. Loads of different
+    models can run at once; concurrent first requests for the same model
+    wait for a single load. Class labels and other metadata are kept per
+    model too; labels given as a function are read once, on first use,
+    and stay cached when the model itself is unloaded. Such a function
+    may load the model, so ``status`` leaves its labels out until then.
+    ``on_unload`` is
+    called after a model is dropped, e.g. to return cached GPU memory.
+    """
+
+    def __init__(self, ttl=None, on_unload=None):
+        self.ttl = ttl
+        self.on_unload = on_unload
+        self._loaders = {}
+        self._locks = {}
+        self._models = {}
+        self._last_used = {}
+        self._load_seconds = {}
+        self._label_sources = {}
+        self._labels = {}
+        self._label_locks = {}
+        self._metadata = {}
+        self._reaper = None
+        self._reaper_lock = threading.Lock()
+
+    def register(self, name, loader, labels=None, **metadata):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._label_sources[name] = labels
+        self._label_locks[name] = threading.Lock()
+        self._metadata[name] = metadata
+
+    def labels(self, name):
+        labels = self._labels.get(name)
+        if labels is None:
+            # One lock per model: a slow source only holds up its own labels
+            with self._label_locks[name]:
+                labels = self._labels.get(name)
+                if labels is None:
+                    source = self._label_sources[name]
+                    labels = self._labels[name] = list(source() if callable(source) else source or [])
+        return labels
+
+    def _known_labels(self, name):
+        source = self._label_sources[name]
+        return self._labels.get(name) if callable(source) else list(source or [])
+
+    def get(self, name):
+        self._last_used[name] = time.monotonic()
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                model = self._loaders[name]()
+                self._load_seconds[name] = time.perf_counter() - started
+                self._models[name] = model
+                logger.info('Loaded %s model in %.1fs', name, self._load_seconds[name])
+            self._last_used[name] = time.monotonic()
+        self._start_reaper()
+        return model
+
+    def preload(self, names):
+        unknown = [name for name in names if name not in self._loaders]
+        if unknown:
+            raise ValueError(
+                f"Cannot preload unknown model(s) {', '.join(unknown)}; registered: {', '.join(self._loaders)}"
+            )
+        for name in names:
+            self.get(name)
+
+    def unload(self, name, idle_for=0):
+        """Drop ``name`` if it has not been used for ``idle_for`` seconds."""
+        with self._locks[name]:
+            if time.monotonic() - self._last_used.get(name, 0) < idle_for:
+                return
+            if self._models.pop(name, None) is not None:
+                # Requests already holding the model finish with it; the
+                # memory is released once they drop their reference.
+                gc.collect()
+                if self.on_unload is not None:
+                    self.on_unload()
+                logger.info('Unloaded %s model', name)
+
+    def unload_idle(self):
+        if self.ttl:
+            for name in list(self._models):
+                self.unload(name, idle_for=self.ttl)
+
+    def _start_reaper(self):
+        if not self.ttl:
+            return
+        with self._reaper_lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap, name='model-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(min(self.ttl, 60))
+            self.unload_idle()
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            name: {
+                **self._metadata[name],
+                'labels': self._known_labels(name),
+                'loaded': name in self._models,
+                'load_seconds': self._load_seconds.get(name),
+                'idle_seconds': max(0.0, now - self._last_used[name]) if name in self._last_used else None,
+            }
+            for name in self._loaders
+        }
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def content_key(data, inspection_type, params):
+    """Cache key of an upload: its SHA-256 plus the inspection type and parameters."""
+    return inspection_type, tuple(sorted(params.items())), hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, size=8):
+    """64-bit difference hash; near-identical frames differ in only a few bits."""
+    pixels = np.asarray(image.convert('L').resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class ResultCache:
+    """LRU cache of inspection results, stored as JSON bytes and bounded by their size.
+
+    With ``phash_distance`` set, a miss on the exact key falls back to the
+    most recent result of the same inspection type and parameters whose
+    image hash is at most that many bits away. Only the last
+    ``phash_bucket_size`` hashes of each type and parameters are compared.
+    """
+
+    # Rough cost of the key, hash and bookkeeping kept for every entry
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_bytes, phash_distance=None, phash_bucket_size=256):
+        self.max_bytes = max_bytes
+        self.phash_distance = phash_distance
+        self.phash_bucket_size = phash_bucket_size
+        self.size = 0
+        self._entries = OrderedDict()  # key -> JSON bytes
+        self._phashes = {}  # (type, params) -> OrderedDict(key -> phash)
+        self._lock = threading.Lock()
+
+    def get(self, key, phash=None):
+        """Return ``(json_bytes, 'hit' | 'near')`` or ``(None, None)``."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data, 'hit'
+            if phash is None or self.phash_distance is None:
+                return None, None
+            candidates = list(self._phashes.get(key[:2], {}).items())
+        # Compared outside the lock so lookups don't queue behind each other
+        for other, other_phash in reversed(candidates):
+            if bin(phash ^ other_phash).count('1') <= self.phash_distance:
+                with self._lock:
+                    data = self._entries.get(other)
+                    if data is not None:
+                        self._entries.move_to_end(other)
+                        return data, 'near'
+        return None, None
+
+    def put(self, key, result, phash=None):
+        data = json.dumps(result).encode()
+        if len(data) + self.ENTRY_OVERHEAD > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = data
+            self.size += len(data) + self.ENTRY_OVERHEAD
+            if phash is not None:
+                bucket = self._phashes.setdefault(key[:2], OrderedDict())
+                bucket[key] = phash
+                if len(bucket) > self.phash_bucket_size:
+                    bucket.popitem(last=False)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        data = self._entries.pop(key, None)
+        if data is not None:
+            self.size -= len(data) + self.ENTRY_OVERHEAD
+        bucket = self._phashes.get(key[:2])
+        if bucket is not None and bucket.pop(key, None) is not None and not bucket:
+            del self._phashes[key[:2]]
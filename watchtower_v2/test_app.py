@@ -0,0 +1,96 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+pytest.importorskip('cv2')
+pytest.importorskip('pytesseract')
+
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import app as inspection_app  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(inspection_app, 'result_cache', ResultCache(1024 * 1024))
+    monkeypatch.setitem(inspection_app.analytics, 'cache', {'hits': 0, 'near_hits': 0, 'misses': 0})
+    return inspection_app.app.test_client()
+
+
+def png(square=True):
+    pixels = np.full((64, 64, 3), 255, dtype=np.uint8)
+    if square:
+        pixels[16:48, 16:48] = 0
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def inspect(client, inspection_type='anomaly', image=None, **form):
+    data = {'type': inspection_type, 'image': (io.BytesIO(image or png()), 'frame.png'), **form}
+    return client.post('/api/inspect', data=data, content_type='multipart/form-data')
+
+
+def test_json_without_annotation_has_no_image(client):
+    body = inspect(client, format='json').get_json()
+    assert body['defects']
+    assert {'box', 'area', 'contour'} <= set(body['defects'][0])
+    assert 'image' not in body and 'image_url' not in body
+
+
+def test_json_annotation_is_served_from_a_short_lived_url(client):
+    for image_format, mimetype in (('jpeg', 'image/jpeg'), ('webp', 'image/webp')):
+        body = inspect(client, format='json', annotate='1', image_format=image_format).get_json()
+        response = client.get(body['image_url'])
+        assert response.status_code == 200
+        assert response.mimetype == mimetype
+        assert response.data
+    assert client.get('/api/images/missing').status_code == 404
+
+
+def test_results_with_image_urls_are_not_cached(client):
+    first = inspect(client, format='json', annotate='1').get_json()
+    second = inspect(client, format='json', annotate='1').get_json()
+    assert first['image_url'] != second['image_url']
+    assert inspection_app.analytics['cache']['hits'] == 0
+
+
+def test_json_results_are_cached(client):
+    first = inspect(client, format='json')
+    second = inspect(client, format='json')
+    assert second.get_json() == first.get_json()
+    assert second.mimetype == 'application/json'
+    assert inspection_app.analytics['cache'] == {'hits': 1, 'near_hits': 0, 'misses': 1}
+
+
+def test_image_format_embeds_a_data_uri(client):
+    body = inspect(client).get_json()
+    prefix = 'data:image/jpeg;base64,'
+    assert body['image'].startswith(prefix)
+    assert base64.b64decode(body['image'][len(prefix):])[:2] == b'\xff\xd8'
+
+
+def test_object_detections_in_json(client, monkeypatch):
+    monkeypatch.setattr(inspection_app, 'detection_batcher', lambda tensor: {
+        'labels': torch.tensor([1, 3]),
+        'scores': torch.tensor([0.9, 0.2]),
+        'boxes': torch.tensor([[1.0, 2.0, 30.0, 40.0], [0.0, 0.0, 5.0, 5.0]]),
+    })
+    body = inspect(client, 'object', format='json').get_json()
+    assert body['result'] == 'Detected 1 objects'
+    assert body['detections'] == [{
+        'label': inspection_app.model_registry.labels('object')[1], 'score': 0.9, 'box': [1.0, 2.0, 30.0, 40.0],
+    }]
+
+
+def test_invalid_options_are_rejected(client):
+    assert inspect(client, format='xml').status_code == 400
+    assert inspect(client, format='json', image_format='gif').status_code == 400
+    assert inspect(client, 'unknown').status_code == 400
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_concurrent_calls_share_a_batch():
+    sizes = []
+
+    def run_batch(items):
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait=0.2)
+    futures = [batcher.submit(i) for i in range(4)]
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6]
+    assert sizes == [4]
+
+
+def test_errors_fail_the_whole_batch():
+    def run_batch(items):
+        raise ValueError('bad batch')
+
+    batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait=0.2)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError, match='bad batch'):
+            future.result(timeout=5)
+
+
+def test_wrong_number_of_results_fails_the_whole_batch():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=3, max_wait=0.2)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match='1 results for a batch of 3'):
+            future.result(timeout=5)
+
+
+class Stop(BaseException):
+    pass
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_worker_stopping_resolves_the_batch_and_restarts():
+    calls = []
+
+    def run_batch(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise Stop
+        return items
+
+    batcher = MicroBatcher(run_batch, max_batch_size=1, max_wait=0)
+    with pytest.raises(RuntimeError, match='worker stopped'):
+        batcher.submit('first').result(timeout=5)
+    batcher._thread.join(timeout=5)
+    assert batcher('second') == 'second'
+
+
+def test_call_times_out():
+    release = threading.Event()
+
+    def run_batch(items):
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(run_batch, max_batch_size=1, max_wait=0, timeout=0.05)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        batcher('slow')
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_cancelled_requests_are_skipped():
+    release = threading.Event()
+    seen = []
+
+    def run_batch(items):
+        release.wait(5)
+        seen.extend(items)
+        return items
+
+    batcher = MicroBatcher(run_batch, max_batch_size=1, max_wait=0)
+    first = batcher.submit('first')
+    cancelled = batcher.submit('cancelled')
+    kept = batcher.submit('kept')
+    assert cancelled.cancel()
+    release.set()
+    assert (first.result(timeout=5), kept.result(timeout=5)) == ('first', 'kept')
+    assert seen == ['first', 'kept']
@@ -0,0 +1,41 @@
+import image_store
+from image_store import ImageStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_images_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(image_store.time, 'monotonic', clock)
+    store = ImageStore(ttl=60)
+    token = store.put(b'jpeg', 'image/jpeg')
+    assert store.get(token) == (b'jpeg', 'image/jpeg')
+    clock.now += 60
+    assert store.get(token) is None
+    store.put(b'next', 'image/jpeg')
+    assert token not in store._images
+    assert store.size == 4
+
+
+def test_oldest_images_are_dropped_over_max_bytes():
+    store = ImageStore(ttl=60, max_bytes=10)
+    first = store.put(b'x' * 6, 'image/jpeg')
+    second = store.put(b'y' * 4, 'image/webp')
+    third = store.put(b'z' * 4, 'image/jpeg')
+    assert store.get(first) is None
+    assert store.get(second) == (b'y' * 4, 'image/webp')
+    assert store.get(third) == (b'z' * 4, 'image/jpeg')
+    assert store.size == 8
+
+
+def test_tokens_are_unique_and_unknown_tokens_miss():
+    store = ImageStore()
+    tokens = {store.put(b'x', 'image/jpeg') for _ in range(100)}
+    assert len(tokens) == 100
+    assert store.get('missing') is None
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from registry import ModelRegistry
+
+
+def test_concurrent_first_requests_share_one_load():
+    loads = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry = ModelRegistry()
+    registry.register('model', load)
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get('model'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len({id(model) for model in models}) == 1
+
+
+def test_unload_drops_idle_models_and_calls_hook():
+    unloaded = []
+    registry = ModelRegistry(ttl=60, on_unload=lambda: unloaded.append(1))
+    registry.register('model', object)
+    registry.get('model')
+    registry.unload('model', idle_for=60)
+    assert registry.status()['model']['loaded']
+    assert unloaded == []
+    registry.unload('model')
+    assert not registry.status()['model']['loaded']
+    assert unloaded == [1]
+    registry.unload('model')
+    assert unloaded == [1]
+
+
+def test_preload_rejects_unknown_names():
+    loads = []
+    registry = ModelRegistry()
+    registry.register('object', lambda: loads.append('object') or object())
+    with pytest.raises(ValueError, match='yolo; registered: object'):
+        registry.preload(['object', 'yolo'])
+    assert loads == []
+    registry.preload(['object'])
+    assert loads == ['object']
+
+
+def test_status_does_not_load_models_for_labels():
+    registry = ModelRegistry()
+    registry.register('object', object, labels=['person', 'car'])
+    registry.register('yolo', lambda: {'names': ['crack']}, labels=lambda: registry.get('yolo')['names'])
+    status = registry.status()
+    assert status['object']['labels'] == ['person', 'car']
+    assert status['yolo']['labels'] is None
+    assert not status['yolo']['loaded']
+    assert registry.labels('yolo') == ['crack']
+    assert registry.status()['yolo']['labels'] == ['crack']
+
+
+def test_slow_label_source_does_not_block_other_models():
+    release = threading.Event()
+    registry = ModelRegistry()
+    registry.register('slow', object, labels=lambda: release.wait(5) and ['slow'])
+    registry.register('fast', object, labels=lambda: ['fast'])
+    thread = threading.Thread(target=registry.labels, args=('slow',))
+    thread.start()
+    try:
+        started = time.monotonic()
+        assert registry.labels('fast') == ['fast']
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        thread.join()
+    assert registry.labels('slow') == ['slow']
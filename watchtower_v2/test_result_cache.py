@@ -0,0 +1,96 @@
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from result_cache import ResultCache, content_key  # noqa: E402
+
+OVERHEAD = ResultCache.ENTRY_OVERHEAD
+
+
+def key(name, inspection_type='object', params=()):
+    return inspection_type, params, name
+
+
+def test_results_are_stored_as_json_bytes():
+    cache = ResultCache(10_000)
+    cache.put(key('a'), {'result': 'ok'})
+    data, kind = cache.get(key('a'))
+    assert kind == 'hit'
+    assert json.loads(data) == {'result': 'ok'}
+    assert cache.size == len(data) + OVERHEAD
+
+
+def test_size_bound_evicts_least_recently_used():
+    entry = len(json.dumps({'result': 'x' * 100}).encode()) + OVERHEAD
+    cache = ResultCache(2 * entry)
+    cache.put(key('a'), {'result': 'x' * 100})
+    cache.put(key('b'), {'result': 'x' * 100})
+    cache.get(key('a'))
+    cache.put(key('c'), {'result': 'x' * 100})
+    assert cache.get(key('b')) == (None, None)
+    assert cache.get(key('a'))[1] == cache.get(key('c'))[1] == 'hit'
+    assert cache.size == 2 * entry
+
+
+def test_results_larger_than_the_cache_are_skipped():
+    cache = ResultCache(OVERHEAD + 10)
+    cache.put(key('a'), {'result': 'x' * 100})
+    assert cache.get(key('a')) == (None, None)
+    assert cache.size == 0
+
+
+def test_near_matches_need_same_type_and_params():
+    cache = ResultCache(10_000, phash_distance=2)
+    cache.put(key('a'), {'result': 'a'}, phash=0b1111)
+    assert json.loads(cache.get(key('b'), 0b1100)[0]) == {'result': 'a'}
+    assert cache.get(key('b'), 0b0000) == (None, None)
+    assert cache.get(key('b', 'classify'), 0b1111) == (None, None)
+    assert cache.get(key('b', params=(('format', 'json'),)), 0b1111) == (None, None)
+
+
+def test_near_match_prefers_most_recent_and_forgets_evicted_entries():
+    entry = len(json.dumps({'result': 'a'}).encode()) + OVERHEAD
+    cache = ResultCache(2 * entry, phash_distance=4)
+    cache.put(key('a'), {'result': 'a'}, phash=0)
+    cache.put(key('b'), {'result': 'b'}, phash=1)
+    assert json.loads(cache.get(key('x'), 0)[0]) == {'result': 'b'}
+    cache.put(key('c'), {'result': 'c'})
+    cache.put(key('d'), {'result': 'd'})
+    assert cache.get(key('x'), 0) == (None, None)
+    assert cache._phashes == {}
+
+
+def test_phash_buckets_are_capped():
+    cache = ResultCache(1_000_000, phash_distance=0, phash_bucket_size=2)
+    for i in range(3):
+        cache.put(key(str(i)), {'result': i}, phash=i)
+    assert list(cache._phashes[key('')[:2]]) == [key('1'), key('2')]
+    assert cache.get(key('x'), 0) == (None, None)
+    assert cache.get(key('0'))[1] == 'hit'
+
+
+def test_concurrent_puts_keep_size_consistent():
+    cache = ResultCache(50 * OVERHEAD, phash_distance=1)
+
+    def worker(offset):
+        for i in range(200):
+            cache.put(key(str(offset + i % 60)), {'result': i}, phash=i)
+            cache.get(key('y'), i)
+
+    threads = [threading.Thread(target=worker, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.size == sum(len(data) + OVERHEAD for data in cache._entries.values())
+    assert cache.size <= cache.max_bytes
+    assert all(k in cache._entries for bucket in cache._phashes.values() for k in bucket)
+
+
+def test_content_key_depends_on_type_params_and_bytes():
+    assert content_key(b'x', 'ocr', {'b': '1', 'a': '2'}) == content_key(b'x', 'ocr', {'a': '2', 'b': '1'})
+    assert content_key(b'x', 'ocr', {}) != content_key(b'y', 'ocr', {})
+    assert content_key(b'x', 'ocr', {}) != content_key(b'x', 'object', {})